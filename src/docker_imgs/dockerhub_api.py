@@ -1,11 +1,24 @@
 import re
 from packaging import version
-import requests
-from json import loads
-from urllib.request import urlopen
-from src.utilities.urls import dockerhub_api_call_template_all_tags, dockerhub_headers, dockerhub_search_api_call, dockerhub_api_call_template_specific_tag
+from math import ceil
+from concurrent.futures import ThreadPoolExecutor
+from src.utilities.urls import dockerhub_api_call_template_all_tags, dockerhub_api_call_template_tags_by_last_updated, dockerhub_headers, dockerhub_search_api_call, dockerhub_api_call_template_specific_tag, dockerhub_max_page_size
+from src.utilities.environment_variables import get_dockerhub_pagination_workers_environment_variable, get_dockerhub_full_scan_interval_in_seconds_environment_variable, \
+    get_dockerhub_incremental_page_size_environment_variable, get_tags_cache_max_size_environment_variable
 from src.utilities.logging_messages import get_updatable_docker_imgs_failed, docker_image_not_found, docker_date_not_found
-from urllib.error import HTTPError
+from src.utilities.tags_cache import tags_cache
+from src.utilities.registry_http import registry_http_client
+from src.utilities.rate_limiter import get_request_priority, set_request_priority
+from requests import HTTPError
+from string import Template
+from collections import namedtuple, OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Union
+
+
+# Compact record of a tag of the DockerHub tags listing, with what is needed after the listing: when it was pushed, and its digest.
+DockerHubTagRecord = namedtuple('DockerHubTagRecord', ['name', 'last_updated', 'digest'])
 
 
 class DockerHubImgNotFound(Exception):
@@ -39,7 +52,8 @@ def get_search_img_dockerhub_api(img_name:str, logs_registry_json_id:str, curr_i
         json: The JSON response from the DockerHub API.
     """    
     try:
-        return loads(requests.get(dockerhub_search_api_call.substitute(img_name=img_name), cookies=dockerhub_headers, timeout=0.4).text)
+        headers = dict(dockerhub_headers, Referer=Template(dockerhub_headers['Referer']).substitute(img_name=img_name))
+        return registry_http_client.get_json(dockerhub_search_api_call.substitute(img_name=img_name), headers=headers, timeout_in_seconds=0.4)
     except Exception:
         docker_image_not_found(img_name, logs_registry_json_id, curr_img_id)
         raise DockerHubImgNotFound(f'Image with name {img_name} not found in the DockerHub API response while looking for its corresponding namespace.')
@@ -70,8 +84,10 @@ def img_namespace_for_search_query(search_query_response:dict, img_name:str, log
     raise DockerHubImgNotFound(f'Image with name {img_name} not found in the DockerHub API response while looking for its corresponding namespace.')
 
 
-def get_latest_img_date_dockerhub_api(img_namespace:str, img_name:str, img_tag:str, logs_registry_json_id:str, curr_img_id:str) -> str:
+def get_latest_img_date_dockerhub_api(img_namespace:str, img_name:str, img_tag:str, logs_registry_json_id:str, curr_img_id:str, tag_records:Union[dict, None]=None) -> str:
     """ Given a namespace, name and tag of an image, this function queries the DockerHub API to get the date of the latest version of that image.
+    If the tag is in the records of the tags listing, see get_dockerhub_tag_records, the date is taken from them instead.
+    Otherwise, the answer is read through the tags cache.
 
     Args:
         img_namespace (str): The namespace of the image.
@@ -79,24 +95,158 @@ def get_latest_img_date_dockerhub_api(img_namespace:str, img_name:str, img_tag:s
         img_tag (str): The tag of the image.
         logs_registry_json_id (str): The ID of the logs registry JSON file.
         curr_img_id (str): The ID of the current image.
+        tag_records (Union[dict, None], optional): The records of the tags listing of the image, of the form {tag: DockerHubTagRecord}. Defaults to None.
 
     Returns:
         str: The date of the latest version of the image with the specified tag.
     """    
+    if tag_records is not None and img_tag in tag_records and tag_records[img_tag].last_updated is not None:
+        return tag_records[img_tag].last_updated
     try:
-        return loads(urlopen(dockerhub_api_call_template_specific_tag.substitute(namespace=img_namespace, image_name=img_name, image_tag=img_tag)).read())['last_updated']
+        return tags_cache.get_or_fetch(('dockerhub', img_namespace, img_name, 'tag', img_tag), \
+            lambda: registry_http_client.get_json(dockerhub_api_call_template_specific_tag.substitute(namespace=img_namespace, image_name=img_name, image_tag=img_tag))['last_updated'])
     except Exception:
         docker_date_not_found(img_name, img_tag, img_namespace, logs_registry_json_id, curr_img_id)
         raise DockerHubDateNotFound(f'Date of the latest version of the image {img_namespace}/{img_name}:{img_tag} not found in the DockerHub API response.')
 
 
 def get_updatable_dockerhub_imgs(img_name:str, img_namespace:str, curr_version:str, logs_registry_json_id:str, curr_img_id:str) -> dict:
+    """ Get all the newer versions of the image, reading through the tags cache shared by all the VersioningHandlers,
+    so that the DockerHub API is only traversed again when the cached entry has expired.
+
+    Args:
+        img_name (str): The name of the image.
+        img_namespace (str): The namespace of the image.
+        curr_version (str): The current name of the image.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Returns:
+        dict: All images previous to the current version available in DockerHub, see _fetch_updatable_dockerhub_imgs.
+    """
+    return dict(_get_dockerhub_tags_listing(img_name, img_namespace, curr_version, logs_registry_json_id, curr_img_id)[0])
+
+
+def get_dockerhub_tag_records(img_name:str, img_namespace:str, curr_version:str, logs_registry_json_id:str, curr_img_id:str) -> dict:
+    """ Get the records of the tags traversed while looking for the newer versions of the image, from the same listing as get_updatable_dockerhub_imgs,
+    so that the dates of the current and latest tags are known without requesting them one by one.
+
+    Args:
+        img_name (str): The name of the image.
+        img_namespace (str): The namespace of the image.
+        curr_version (str): The current name of the image.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Returns:
+        dict: The records, of the form {tag: DockerHubTagRecord}.
+    """
+    return dict(_get_dockerhub_tags_listing(img_name, img_namespace, curr_version, logs_registry_json_id, curr_img_id)[1])
+
+
+def _get_dockerhub_tags_listing(img_name:str, img_namespace:str, curr_version:str, logs_registry_json_id:str, curr_img_id:str) -> tuple:
+    return tags_cache.get_or_fetch(('dockerhub', img_namespace, img_name, curr_version), \
+        lambda: _scan_dockerhub_tags(img_name, img_namespace, curr_version, logs_registry_json_id, curr_img_id))
+
+
+class DockerHubWatermark():
+    """ What has already been seen of the tags of an image: the newer versions and tag records found, and the newest last_updated among them,
+    so that later scans only need to read the tags pushed since then.
+    """
+    def __init__(self, newer_versions:dict, tag_records:dict) -> None:
+        self.newer_versions = newer_versions
+        self.tag_records = tag_records
+        self.sha256_of_found_imgs = {tag_records[tag].digest for tag in newer_versions.values() if tag in tag_records and tag_records[tag].digest is not None}
+        self.last_updated = max((record.last_updated for record in tag_records.values() if record.last_updated is not None), default=None)
+        self.full_scan_at = monotonic()
+        self.lock = Lock()
+
+
+_dockerhub_watermarks = OrderedDict()
+_dockerhub_watermarks_lock = Lock()
+
+
+def _scan_dockerhub_tags(img_name:str, img_namespace:str, curr_version:str, logs_registry_json_id:str, curr_img_id:str) -> tuple:
+    """ Get the newer versions and tag records of the image, see _fetch_updatable_dockerhub_imgs.
+    The first time, and every DOCKERHUB_FULL_SCAN_INTERVAL_IN_SECONDS, the tags are traversed down to the current one.
+    In between, only the tags pushed after the watermark of the image are read, newest first, and merged into the ones already found.
+
+    Args:
+        img_name (str): The name of the image.
+        img_namespace (str): The namespace of the image.
+        curr_version (str): The current name of the image.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Returns:
+        tuple: The newer versions and the tag records, see _fetch_updatable_dockerhub_imgs.
+    """
+    key = (img_namespace, img_name, curr_version)
+    with _dockerhub_watermarks_lock:
+        watermark = _dockerhub_watermarks.get(key)
+    if watermark is None or watermark.last_updated is None or monotonic() - watermark.full_scan_at >= get_dockerhub_full_scan_interval_in_seconds_environment_variable():
+        watermark = DockerHubWatermark(*_fetch_updatable_dockerhub_imgs(img_name, img_namespace, curr_version, logs_registry_json_id, curr_img_id))
+    else:
+        with watermark.lock:
+            _fetch_dockerhub_tags_since_watermark(img_name, img_namespace, curr_version, watermark, logs_registry_json_id, curr_img_id)
+    with _dockerhub_watermarks_lock:
+        _dockerhub_watermarks[key] = watermark
+        _dockerhub_watermarks.move_to_end(key)
+        while len(_dockerhub_watermarks) > max(1, get_tags_cache_max_size_environment_variable()):
+            _dockerhub_watermarks.popitem(last=False)
+    with watermark.lock:
+        return dict(watermark.newer_versions), dict(watermark.tag_records)
+
+
+def _fetch_dockerhub_tags_since_watermark(img_name:str, img_namespace:str, curr_version:str, watermark:DockerHubWatermark, logs_registry_json_id:str, curr_img_id:str) -> None:
+    """ Read the tags of the image ordered by last_updated, newest first, until reaching the watermark, and merge them into it.
+    Tags pushed at the same time as the watermark are read again, as merging them twice changes nothing.
+
+    Args:
+        img_name (str): The name of the image.
+        img_namespace (str): The namespace of the image.
+        curr_version (str): The current name of the image.
+        watermark (DockerHubWatermark): The watermark of the image, updated in place.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Returns:
+        None
+    """
+    regexp = re.compile('(\d\.?)+')
+    curr_version_partition = curr_version.partition(regexp.search(curr_version).group())
+    page_size = get_dockerhub_incremental_page_size_environment_variable()
+    page = 1
+    url = dockerhub_api_call_template_tags_by_last_updated.substitute(namespace=img_namespace, image_name=img_name, page=page, page_size=page_size)
+    try:
+        while True:
+            content = registry_http_client.get_json(url)
+            new_results = [res for res in content['results'] if res.get('last_updated') is not None and res['last_updated'] >= watermark.last_updated]
+            for res in new_results:
+                # One by one, as finding the current tag, if it was pushed again, must not stop the merge.
+                _collect_newer_dockerhub_versions([res], regexp, curr_version_partition, watermark.sha256_of_found_imgs, watermark.newer_versions, watermark.tag_records)
+            if new_results:
+                watermark.last_updated = max(watermark.last_updated, max(res['last_updated'] for res in new_results))
+            if len(new_results) < len(content['results']) or content.get('next') is None:
+                return
+            page += 1
+            url = dockerhub_api_call_template_tags_by_last_updated.substitute(namespace=img_namespace, image_name=img_name, page=page, page_size=page_size)
+    except Exception:
+        get_updatable_docker_imgs_failed(img_name, img_namespace, curr_version, url, page, logs_registry_json_id, curr_img_id)
+        raise DockerHubAbnormalJSONResponse(f'Abnormal response from the DockerHub API while getting the updatable images for the image {img_name} of namespace {img_namespace}.')
+
+
+def _fetch_updatable_dockerhub_imgs(img_name:str, img_namespace:str, curr_version:str, logs_registry_json_id:str, curr_img_id:str) -> dict:
     """ Traverse the json that contains all the available versions of the image,
     saving all the newer versions of the image in a dictionary.
 
     That way, later, we can get the latest version of the image, 
     and the latest automatically updatable version, based on the version_frontier parameter specified by the user.
 
+    The pages are requested with the maximum page size allowed by DockerHub. The first one tells how many tags there are,
+    and the rest are fetched concurrently, in windows of DOCKERHUB_PAGINATION_WORKERS pages, which are processed in order
+    so that the traversal still stops at the page where the current version is found.
+
     Args:
         img_name (str): The name of the image.
         img_namespace (str): The namespace of the image.
@@ -105,11 +255,14 @@ def get_updatable_dockerhub_imgs(img_name:str, img_namespace:str, curr_version:s
         curr_img_id (str): The ID of the current image.
 
     Returns:
-        dict: All images previous to the current version available in DockerHub.
-            - keys: packaging.version.Version objects, representing the versions, following the regex '(\d\.?)+'
-            - values: the corresponding tags, contained in 'name' field of the JSON response.
+        tuple: 
+            - dict: All images previous to the current version available in DockerHub.
+                - keys: packaging.version.Version objects, representing the versions, following the regex '(\d\.?)+'
+                - values: the corresponding tags, contained in 'name' field of the JSON response.
+            - dict: The records of all the tags traversed, including the current one if found, of the form {tag: DockerHubTagRecord}.
     """    
     newer_versions = {}
+    tag_records = {}
 
     sha256_of_found_imgs = set()
     page = 1
@@ -123,37 +276,71 @@ def get_updatable_dockerhub_imgs(img_name:str, img_namespace:str, curr_version:s
         curr_version_partition = curr_version.partition(curr_version_found)
     else:
         # No PEP440 version number found in the deployment's image.
-        return newer_versions
+        return newer_versions, tag_records
+    url_for_page = lambda p: dockerhub_api_call_template_all_tags.substitute(namespace=img_namespace, image_name=img_name, page=p, page_size=dockerhub_max_page_size)
+    priority = get_request_priority()
+    def read_page(p:int) -> dict:
+        # The pages read by the pagination workers keep the priority of the image.
+        set_request_priority(priority)
+        return registry_http_client.get_json(url_for_page(p))
+    url = url_for_page(page)
     try:
-        url = dockerhub_api_call_template_all_tags.substitute(namespace=img_namespace, image_name=img_name, page=page)
-        while True:
-            content = loads(urlopen(url).read())
-            for res in content['results']:
-                m = regexp.search(res['name'])        
-                if m is not None:
-                    # The version number of DockerHub's registry contains a PEP440 version number as a substring.
-                    version_number = m.group()
-                    tag_partition = res['name'].partition(version_number)
-                    if tag_partition[0] == curr_version_partition[0] \
-                        and tag_partition[2] == curr_version_partition[2]:
-                        if tag_partition[1] == curr_version_partition[1]:
-                            return newer_versions
-                        # As traversing is linear with time, the first version that is found is the latest version, and the last is the first one.
-                        # However, there are versions that specify the latest of a level. That's why sha256 must be compared as well.
-                        found_version_obj = version.Version(version_number)
-                        if 'digest' in res \
-                        and res['digest'] not in sha256_of_found_imgs:
-                            sha256_of_found_imgs.add(res['digest'])
-                            newer_versions[found_version_obj] = res['name']
-                        elif 'digest' not in res:
-                            newer_versions[found_version_obj] = res['name']
-            page += 1 
+        content = read_page(page)
+        if _collect_newer_dockerhub_versions(content['results'], regexp, curr_version_partition, sha256_of_found_imgs, newer_versions, tag_records):
+            return newer_versions, tag_records
+        pages_count = ceil(content['count'] / dockerhub_max_page_size)
+        workers = max(1, get_dockerhub_pagination_workers_environment_variable())
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for window_start in range(2, pages_count + 1, workers):
+                window = range(window_start, min(window_start + workers, pages_count + 1))
+                for page, content in zip(window, executor.map(read_page, window)):
+                    url = url_for_page(page)
+                    if _collect_newer_dockerhub_versions(content['results'], regexp, curr_version_partition, sha256_of_found_imgs, newer_versions, tag_records):
+                        return newer_versions, tag_records
+        return newer_versions, tag_records
     except HTTPError:
         # No match is found, or all matches found are newer than the current version.
-        return newer_versions
+        return newer_versions, tag_records
     except Exception:
         get_updatable_docker_imgs_failed(img_name, img_namespace, curr_version, url, page, logs_registry_json_id, curr_img_id)
         raise DockerHubAbnormalJSONResponse(f'Abnormal response from the DockerHub API while getting the updatable images for the image {img_name} of namespace {img_namespace}.')
+
+
+def _collect_newer_dockerhub_versions(results:list, regexp:re.Pattern, curr_version_partition:tuple, sha256_of_found_imgs:set, newer_versions:dict, tag_records:dict) -> bool:
+    """ Save in newer_versions the versions of a page of DockerHub tags that are newer than the current one, and have the same prefix and suffix.
+
+    Args:
+        results (list): The 'results' field of the JSON response of a page of tags.
+        regexp (re.Pattern): The compiled regex that extracts the version number of a tag.
+        curr_version_partition (tuple): The current tag, partitioned into (prefix, version number, suffix).
+        sha256_of_found_imgs (set): The digests of the images already saved, updated in place.
+        newer_versions (dict): The newer versions found so far, updated in place.
+        tag_records (dict): The records of the tags traversed so far, updated in place.
+
+    Returns:
+        bool: True if the current version has been found, meaning that the traversal must stop, False otherwise.
+    """
+    for res in results:
+        tag_records[res['name']] = DockerHubTagRecord(res['name'], res.get('last_updated'), res.get('digest'))
+        m = regexp.search(res['name'])        
+        if m is not None:
+            # The version number of DockerHub's registry contains a PEP440 version number as a substring.
+            version_number = m.group()
+            tag_partition = res['name'].partition(version_number)
+            if tag_partition[0] == curr_version_partition[0] \
+                and tag_partition[2] == curr_version_partition[2]:
+                if tag_partition[1] == curr_version_partition[1]:
+                    return True
+                # As traversing is linear with time, the first version that is found is the latest version, and the last is the first one.
+                # However, there are versions that specify the latest of a level. That's why sha256 must be compared as well.
+                found_version_obj = version.Version(version_number)
+                if 'digest' in res \
+                and res['digest'] not in sha256_of_found_imgs:
+                    sha256_of_found_imgs.add(res['digest'])
+                    newer_versions[found_version_obj] = res['name']
+                elif 'digest' not in res:
+                    newer_versions[found_version_obj] = res['name']
+    return False
     
 
 def get_latest_version_dockerhub(available_newer_imgs:dict) -> str:
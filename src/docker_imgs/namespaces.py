@@ -0,0 +1,125 @@
+from os.path import exists
+from json import load
+from threading import Lock
+from time import time
+from typing import Callable, Union
+from src.utilities.logs_registry import write_json_atomically
+from src.utilities.single_flight import SingleFlight
+from src.utilities.environment_variables import get_dockerhub_namespaces_cache_path_environment_variable, get_dockerhub_namespaces_cache_ttl_in_seconds_environment_variable, \
+    get_dockerhub_search_namespaces_environment_variable
+
+
+
+dockerhub_hosts = {'docker.io', 'index.docker.io', 'registry-1.docker.io', 'registry.hub.docker.com'}
+
+
+def split_dockerhub_image_reference(img_reference:str) -> tuple:
+    """ Split a DockerHub image reference, without tag, into its namespace and name, as the Docker client does.
+    - The DockerHub host, if present, is removed, for example docker.io/bitnami/redis.
+    - References of the form namespace/name carry their namespace.
+    - Bare names are official images, which belong to the library namespace.
+
+    Args:
+        img_reference (str): The image reference, for example nginx, bitnami/redis or docker.io/library/nginx.
+
+    Returns:
+        tuple: The namespace and the name of the image, for example ('library', 'nginx').
+    """
+    components = img_reference.split('/')
+    if len(components) > 1 and components[0] in dockerhub_hosts:
+        components = components[1:]
+    if len(components) == 1:
+        return 'library', components[0]
+    return components[0], '/'.join(components[1:])
+
+
+class NamespacesCache():
+    """ Namespaces of the DockerHub images found with the search API, kept in a json file so that they survive restarts of the operator.
+    The namespace of an image does not change, so entries are valid for a long time.
+    """
+    def __init__(self, path:str, ttl_in_seconds:int) -> None:
+        self.path = path
+        self.ttl_in_seconds = ttl_in_seconds
+        self._entries = None
+        self._lock = Lock()
+        self.single_flight = SingleFlight()
+
+    def get_or_search(self, img_name:str, search:Callable[[], str]) -> str:
+        """ Get the namespace of an image, calling search and saving its result if not cached or expired.
+        Concurrent searches of the same image are coalesced into a single one.
+
+        Args:
+            img_name (str): The name of the image, as written in the deployment.
+            search (Callable[[], str]): Function that finds the namespace with the DockerHub search API.
+
+        Returns:
+            str: The namespace of the image.
+        """
+        namespace = self.get(img_name)
+        if namespace is None:
+            def search_and_set() -> str:
+                found_namespace = search()
+                self.set(img_name, found_namespace)
+                return found_namespace
+            namespace = self.single_flight.do(img_name, search_and_set)
+        return namespace
+
+    def get(self, img_name:str) -> Union[str, None]:
+        """ Get the namespace of an image, if cached and not expired.
+
+        Args:
+            img_name (str): The name of the image.
+
+        Returns:
+            str: The namespace.
+            None: The namespace is not cached, or has expired.
+        """
+        with self._lock:
+            entry = self._load().get(img_name)
+        if entry is None or time() - entry[1] >= self.ttl_in_seconds:
+            return None
+        return entry[0]
+
+    def set(self, img_name:str, namespace:str) -> None:
+        """ Save the namespace of an image, writing the json file.
+
+        Args:
+            img_name (str): The name of the image.
+            namespace (str): The namespace.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._load()[img_name] = (namespace, time())
+            write_json_atomically(self.path, self._entries)
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            if exists(self.path):
+                with open(self.path, 'r') as f:
+                    self._entries = {img_name: tuple(entry) for img_name, entry in load(f).items()}
+        return self._entries
+
+
+def resolve_dockerhub_image(img_reference:str, search:Callable[[], str]) -> tuple:
+    """ Get the namespace and name with which an image is queried in the DockerHub API.
+    They are taken from the image reference, see split_dockerhub_image_reference. Only if DOCKERHUB_SEARCH_NAMESPACES is true,
+    the namespace of bare names is looked up with the DockerHub search API instead, and cached persistently, see NamespacesCache.
+
+    Args:
+        img_reference (str): The image reference, without tag.
+        search (Callable[[], str]): Function that finds the namespace with the DockerHub search API.
+
+    Returns:
+        tuple: The namespace and the name of the image.
+    """
+    namespace, name = split_dockerhub_image_reference(img_reference)
+    if '/' not in img_reference and get_dockerhub_search_namespaces_environment_variable() == 'true':
+        namespace = namespaces_cache.get_or_search(img_reference, search)
+    return namespace, name
+
+
+# Shared by all the VersioningHandlers.
+namespaces_cache = NamespacesCache(get_dockerhub_namespaces_cache_path_environment_variable(), get_dockerhub_namespaces_cache_ttl_in_seconds_environment_variable())
@@ -1,7 +1,12 @@
 import gitlab
-from typing import Union
+import requests
+from threading import Lock
+from typing import Iterator, Union
 from src.utilities.environment_variables import _get_gitlab_environment_variables, _is_gitlab_ready
 from src.utilities.logging_messages import gitlab_obj_creation_failed, get_gitlab_project_failed, gitlab_credentials_not_found
+from src.utilities.rate_limiter import RateLimitedHTTPAdapter, registry_rate_limiter
+from src.utilities.tags_cache import tags_cache
+from src.utilities.tags_index import SortedTagsIndex, get_tags_index
 from traceback import format_exc
 
 
@@ -20,8 +25,15 @@ class GitlabNoCredentialsFoundException(Exception):
     pass
 
 
+# The Gitlab object is created once and reused by all the VersioningHandlers, see _create_gitlab_obj.
+_gitlab_obj = None
+_gitlab_obj_lock = Lock()
+gitlab_connection_pool_maxsize = 20
+
+
 def _create_gitlab_obj(base_url:str, token:str, logs_registry_json_id:str, curr_img_id:str) -> gitlab.Gitlab:
-    """ Creates a Gitlab object.
+    """ Creates a Gitlab object, or reuses the one created before for the same base url and token.
+    Its session keeps a pool of connections, shared by all the VersioningHandlers, and its requests are paced by the shared rate limiter.
 
     Args:
         base_url (str): The URL where all projects of your organization can be found.
@@ -32,15 +44,26 @@ def _create_gitlab_obj(base_url:str, token:str, logs_registry_json_id:str, curr_
     Returns:
         gitlab.Gitlab: The Gitlab object.
     """    
-    try:
-        return gitlab.Gitlab(base_url, private_token=token)
-    except Exception:
-        gitlab_obj_creation_failed(format_exc(), logs_registry_json_id, curr_img_id)
-        raise GitlabCanNotCreateObjectException(f'Can not create Gitlab object for base url {base_url} and given token.')
+    global _gitlab_obj
+    with _gitlab_obj_lock:
+        if _gitlab_obj is not None and _gitlab_obj[0] == (base_url, token):
+            return _gitlab_obj[1]
+        try:
+            session = requests.Session()
+            adapter = RateLimitedHTTPAdapter(registry_rate_limiter, pool_maxsize=gitlab_connection_pool_maxsize)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            gl = gitlab.Gitlab(base_url, private_token=token, session=session)
+        except Exception:
+            gitlab_obj_creation_failed(format_exc(), logs_registry_json_id, curr_img_id)
+            raise GitlabCanNotCreateObjectException(f'Can not create Gitlab object for base url {base_url} and given token.')
+        _gitlab_obj = ((base_url, token), gl)
+        return gl
 
 
 def _get_gitlab_project(gl:gitlab.Gitlab, project_id:str, logs_registry_json_id:str, curr_img_id:str):
     """ Returns the project with the given ID for the repository.
+    The project is not fetched, as only its ID is needed to reach its container registry.
 
     Args:
         gl (gitlab.Gitlab): The Gitlab object.
@@ -52,12 +75,35 @@ def _get_gitlab_project(gl:gitlab.Gitlab, project_id:str, logs_registry_json_id:
         gitlab.v4.objects.projects.Project: The project object.
     """    
     try:
-        return gl.projects.get(id=project_id)
+        return gl.projects.get(id=project_id, lazy=True)
     except Exception:
         get_gitlab_project_failed(format_exc(), logs_registry_json_id, curr_img_id)
         raise GitlabProjectNotFoundException(f'Can not find project with ID {project_id}.')
 
 
+def _get_gitlab_repositories_index(gl:gitlab.Gitlab, project_id:str, logs_registry_json_id:str, curr_img_id:str) -> dict:
+    """ Returns the repositories of the project's container registry, indexed by their name.
+    The index is read through the tags cache, so the repositories are listed once for all the images of a tick.
+
+    Args:
+        gl (gitlab.Gitlab): The Gitlab object.
+        project_id (str): The ID of the project.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Returns:
+        dict: The repositories, in the format {image_name: gitlab.v4.objects.ProjectRegistryRepository}
+    """
+    def list_repositories() -> dict:
+        project = _get_gitlab_project(gl, project_id, logs_registry_json_id, curr_img_id)
+        try:
+            return {r.name: r for r in project.repositories.list(all=True)}
+        except Exception:
+            get_gitlab_project_failed(format_exc(), logs_registry_json_id, curr_img_id)
+            raise GitlabProjectNotFoundException(f'Can not list the container registry repositories of the project with ID {project_id}.')
+    return tags_cache.get_or_fetch(('gitlab', project_id), list_repositories)
+
+
 def get_all_gitlab_imgs_in_repository(logs_registry_json_id:str, curr_img_id:str, gl:gitlab.Gitlab=None) -> list:
     """ Get all images names contained in a repository container registry.
 
@@ -80,9 +126,7 @@ def get_all_gitlab_imgs_in_repository(logs_registry_json_id:str, curr_img_id:str
     if gl is None and base_url != token != project_id != '':
         # The method is being called externally, no gitlab object, credentials are directly used to create it.
         gl = _create_gitlab_obj(base_url, token, logs_registry_json_id, curr_img_id)
-    project = _get_gitlab_project(gl, project_id, logs_registry_json_id, curr_img_id)
-    plist = project.repositories.list(all=True)
-    return [p.name for p in plist]
+    return list(_get_gitlab_repositories_index(gl, project_id, logs_registry_json_id, curr_img_id).keys())
     
 
 def get_gitlab_imgs_tags(image:str, logs_registry_json_id:str, curr_img_id:str) -> Union[dict, None]:
@@ -90,6 +134,7 @@ def get_gitlab_imgs_tags(image:str, logs_registry_json_id:str, curr_img_id:str)
     - The tag 'latest' has the bigger priority. If it exists, it will appear the first one.
     - The versions strings are sorted lexicographically.
     Finally, each array of tags will be sorted in descending order, thus placing the newest one in the first position.
+    The tags are read through the tags cache shared by all the VersioningHandlers.
 
     Args:
         image (str): Name of the image to extract tags for
@@ -101,9 +146,73 @@ def get_gitlab_imgs_tags(image:str, logs_registry_json_id:str, curr_img_id:str)
         None: No image is found, the exception is raised
     """    
     base_url, token, project_id = _get_gitlab_environment_variables()
+    def fetch() -> Union[list, None]:
+        tags = _fetch_gitlab_imgs_tags(image, base_url, token, project_id, logs_registry_json_id, curr_img_id)
+        if tags is not None:
+            # The sorted index of the image is only updated when the tags are fetched again.
+            get_tags_index(('gitlab', project_id, image)).update(tags)
+        return tags
+    return tags_cache.get_or_fetch(('gitlab', project_id, image), fetch)
+
+
+def get_gitlab_imgs_tags_index(image:str, logs_registry_json_id:str, curr_img_id:str) -> SortedTagsIndex:
+    """ Get the sorted tags index of an image of the project's container registry, see get_gitlab_imgs_tags.
+
+    Args:
+        image (str): Name of the image to get the index for.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Returns:
+        SortedTagsIndex: The index of the tags of the image.
+    """
+    _, _, project_id = _get_gitlab_environment_variables()
+    tags = get_gitlab_imgs_tags(image, logs_registry_json_id, curr_img_id)
+    tags_index = get_tags_index(('gitlab', project_id, image))
+    if tags and len(tags_index) == 0 and not tags_index.other_tags:
+        # The index was discarded while the tags were still cached.
+        tags_index.update(tags)
+    return tags_index
+
+
+def _fetch_gitlab_imgs_tags(image:str, base_url:str, token:str, project_id:str, logs_registry_json_id:str, curr_img_id:str) -> Union[list, None]:
+    """ Query the Gitlab API for all the tags of an image of the project's container registry, following the pagination.
+
+    Args:
+        image (str): Name of the image to extract tags for
+        base_url (str): The URL where all projects of your organization can be found.
+        token (str): Private personal access token that gives access to the API.
+        project_id (str): The ID of the project.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Returns:
+        list: The tags of the image.
+        None: No image is found.
+    """
     gl = _create_gitlab_obj(base_url, token, logs_registry_json_id, curr_img_id)
-    project = _get_gitlab_project(gl, project_id, logs_registry_json_id, curr_img_id)
-    plist = project.repositories.list(all=True)
-    for p in plist:
-        if p.name == image:
-            return [tag.name for tag in p.tags.list()]
+    repositories_index = _get_gitlab_repositories_index(gl, project_id, logs_registry_json_id, curr_img_id)
+    if image in repositories_index:
+        # All the pages are read: Gitlab sorts the tags by name as strings, so the latest version may be on any page (10.0 comes before 9.0),
+        # and the sorted index of the image has to contain exactly the available tags, see SortedTagsIndex.update.
+        return list(iter_gitlab_imgs_tags(repositories_index[image]))
+
+
+def iter_gitlab_imgs_tags(repository, per_page:int=100) -> Iterator[str]:
+    """ Lazily iterate over the tag names of a repository of the container registry, requesting the next page only when the previous one has been consumed.
+    Keyset pagination is requested, and if the server does not support it for the registry tags, offset pagination is used instead.
+    The consumer can stop at any moment, and no more pages are requested.
+
+    Args:
+        repository (gitlab.v4.objects.ProjectRegistryRepository): The repository of the image.
+        per_page (int, optional): Number of tags per page. Defaults to 100, the maximum allowed by Gitlab.
+
+    Yields:
+        str: The tag names, as they arrive.
+    """
+    try:
+        tags = repository.tags.list(iterator=True, per_page=per_page, pagination='keyset', order_by='name', sort='desc')
+    except gitlab.exceptions.GitlabListError:
+        tags = repository.tags.list(iterator=True, per_page=per_page)
+    for tag in tags:
+        yield tag.name
@@ -0,0 +1,175 @@
+from threading import Event, Lock, Thread
+from traceback import format_exc
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+from src.kube.kubernetes_api import get_api_client
+from src.utilities.logging_messages import deployments_watch_failed
+
+
+
+class DeploymentsInformerNotSyncedException(Exception):
+    """ Raised when the deployments index has not been filled by the first list call yet. """
+    pass
+
+
+class DeploymentsInformer():
+    """ Keeps an in-process index of the deployments of the cluster, shared by all the VersioningHandlers.
+    The deployments are listed once, and then a watch started from the resourceVersion of the list keeps the index up to date.
+    If the watch expires (410 Gone), the deployments are listed again.
+
+    The index has the form {deployment_name: {deployment_namespace: deployment}}.
+    """
+    def __init__(self, api_instance:client.AppsV1Api, native_namespaces:list=['kube-system', 'kube-node-lease', 'kube-public'], \
+            watch_timeout_in_seconds:int=300, retry_delay_in_seconds:int=5) -> None:
+        self.api_instance = api_instance
+        self.native_namespaces = set(native_namespaces)
+        self.watch_timeout_in_seconds = watch_timeout_in_seconds
+        self.retry_delay_in_seconds = retry_delay_in_seconds
+        self._index = {}
+        self._lock = Lock()
+        self._synced = Event()
+        self._stopped = Event()
+        self._resource_version = None
+        self._watch = None
+        self._thread = None
+
+    def start(self) -> None:
+        """ Start listing and watching the deployments in a background thread.
+
+        Returns:
+            None
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, name='deployments-informer', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop watching the deployments.
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        if self._watch is not None:
+            self._watch.stop()
+
+    def get_deployments(self, deployment_name:str, timeout_in_seconds:float=30) -> list:
+        """ Get the deployments with the given name, from all the namespaces except for the native ones.
+
+        Args:
+            deployment_name (str): Name of the deployments.
+            timeout_in_seconds (float, optional): Seconds to wait for the first list call to finish. Defaults to 30.
+
+        Raises:
+            DeploymentsInformerNotSyncedException: If the first list call did not finish in time.
+
+        Returns:
+            list: The deployments, as client.V1Deployment objects.
+        """
+        if not self._synced.wait(timeout_in_seconds):
+            raise DeploymentsInformerNotSyncedException(f'The deployments index was not filled in {timeout_in_seconds} seconds, deployment {deployment_name} can not be looked up.')
+        with self._lock:
+            return list(self._index.get(deployment_name, {}).values())
+
+    def _relist(self) -> None:
+        """ List all the deployments, rebuild the index from scratch and save the resourceVersion to watch from.
+
+        Returns:
+            None
+        """
+        deployments = self.api_instance.list_deployment_for_all_namespaces()
+        index = {}
+        for deployment in deployments.items:
+            if deployment.metadata.namespace not in self.native_namespaces:
+                index.setdefault(deployment.metadata.name, {})[deployment.metadata.namespace] = deployment
+        with self._lock:
+            self._index = index
+        self._resource_version = deployments.metadata.resource_version
+        self._synced.set()
+
+    def _apply_event(self, event_type:str, deployment:client.V1Deployment) -> None:
+        """ Update the index with a watch event.
+
+        Args:
+            event_type (str): ADDED, MODIFIED or DELETED.
+            deployment (client.V1Deployment): The deployment of the event.
+
+        Returns:
+            None
+        """
+        name, namespace = deployment.metadata.name, deployment.metadata.namespace
+        if namespace in self.native_namespaces:
+            return
+        with self._lock:
+            if event_type == 'DELETED':
+                namespaces = self._index.get(name, {})
+                namespaces.pop(namespace, None)
+                if not namespaces:
+                    self._index.pop(name, None)
+            else:
+                self._index.setdefault(name, {})[namespace] = deployment
+
+    def _run(self) -> None:
+        """ List and watch the deployments until stopped, relisting when the watch expires.
+
+        Returns:
+            None
+        """
+        while not self._stopped.is_set():
+            try:
+                if self._resource_version is None:
+                    self._relist()
+                self._watch = watch.Watch()
+                for event in self._watch.stream(self.api_instance.list_deployment_for_all_namespaces, \
+                        resource_version=self._resource_version, timeout_seconds=self.watch_timeout_in_seconds, allow_watch_bookmarks=True):
+                    if event['type'] == 'ERROR':
+                        # Old versions of the client yield the expiration of the watch as an event instead of raising it.
+                        if event['raw_object'].get('code') == 410:
+                            self._resource_version = None
+                            break
+                        raise ApiException(status=event['raw_object'].get('code'), reason=event['raw_object'].get('message'))
+                    self._resource_version = event['object'].metadata.resource_version
+                    if event['type'] != 'BOOKMARK':
+                        self._apply_event(event['type'], event['object'])
+            except ApiException as e:
+                if e.status == 410:
+                    # The resourceVersion is too old: list again.
+                    self._resource_version = None
+                else:
+                    deployments_watch_failed(format_exc())
+                    self._stopped.wait(self.retry_delay_in_seconds)
+            except Exception:
+                deployments_watch_failed(format_exc())
+                self._stopped.wait(self.retry_delay_in_seconds)
+
+
+_deployments_informer = None
+_deployments_informer_lock = Lock()
+
+
+def get_deployments_informer() -> DeploymentsInformer:
+    """ Obtains the deployments informer of the operator process, creating and starting it the first time.
+
+    Returns:
+        DeploymentsInformer: The informer shared by all the VersioningHandlers.
+    """
+    global _deployments_informer
+    with _deployments_informer_lock:
+        if _deployments_informer is None:
+            _deployments_informer = DeploymentsInformer(client.AppsV1Api(get_api_client()))
+            _deployments_informer.start()
+    return _deployments_informer
+
+
+def stop_deployments_informer() -> None:
+    """ Stops the deployments informer of the operator process, if it was started.
+
+    Returns:
+        None
+    """
+    global _deployments_informer
+    with _deployments_informer_lock:
+        if _deployments_informer is not None:
+            _deployments_informer.stop()
+            _deployments_informer = None
@@ -1,8 +1,14 @@
+from copy import deepcopy
 from datetime import datetime
+from json import loads
 from kubernetes import client, config
+from kubernetes.client.rest import ApiException
 from traceback import format_exc
+from threading import Lock
+from time import time
+from typing import Union
 import base64
-from src.utilities.environment_variables import get_latest_preference_environment_variable
+from src.utilities.environment_variables import get_latest_preference_environment_variable, get_apiserver_url_environment_variable
 from src.utilities.logging_messages import update_deployment_failed, restart_deployment_failed, get_bearer_token_failed, get_api_instance_failed
 from traceback import format_exc
 
@@ -28,24 +34,147 @@ class CanNotRestartDeploymentException(Exception):
     pass
 
 
+class BearerTokenCache():
+    """ Caches the bearer token of a ServiceAccount, so that it is looked up only when it expires, 
+    or when the apiserver rejects it because it has been rotated.
+    """
+    def __init__(self, name:str, namespace:str, expiration_margin_in_seconds:int=60) -> None:
+        self.name = name
+        self.namespace = namespace
+        self.expiration_margin_in_seconds = expiration_margin_in_seconds
+        self._token = None
+        self._expires_at = None
+        self._lock = Lock()
+
+    def get(self, api_instance:client.CoreV1Api, logs_registry_json_id:str, curr_img_id:str) -> str:
+        """ Get the bearer token, looking it up only if it is not cached or has expired.
+
+        Args:
+            api_instance (client.CoreV1Api): The object with which we can interact with kubernetes api.
+            logs_registry_json_id (str): The id of the logs registry json.
+            curr_img_id (str): The id of the current image.
+
+        Returns:
+            str: The bearer token, base64 decoded.
+        """
+        with self._lock:
+            if self._token is None or (self._expires_at is not None and time() >= self._expires_at - self.expiration_margin_in_seconds):
+                self._token = get_bearer_token(api_instance, self.name, self.namespace, logs_registry_json_id, curr_img_id)
+                self._expires_at = _get_token_expiration(self._token)
+            return self._token
+
+    def invalidate(self) -> None:
+        """ Forget the cached token, so that it is looked up again the next time it is needed.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._token = None
+            self._expires_at = None
+
+
+def _get_token_expiration(token:str) -> Union[float, None]:
+    """ Get the expiration timestamp of a bearer token, from the exp claim of its JWT payload.
+
+    Args:
+        token (str): The bearer token.
+
+    Returns:
+        float: The expiration timestamp.
+        None: The token does not expire, as legacy ServiceAccount tokens, or it is not a JWT.
+    """
+    try:
+        payload = token.split('.')[1]
+        exp = loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))['exp']
+        return float(exp)
+    except Exception:
+        return None
+
+
+# One long-lived api client, with its connection pool, shared by the reading and the patching of the deployments, see get_api_client.
+_api_client = None
+_api_client_lock = Lock()
+# Api clients of the apiservers the deployments are patched through, when the shared one can not be used, see get_patching_api_client.
+_patching_api_clients = {}
+_patching_api_clients_lock = Lock()
+_bearer_token_cache = BearerTokenCache('default', 'kube-system')
+
+
+def get_api_client() -> client.ApiClient:
+    """ Obtains the api client of the operator process, loading the configuration and creating it only the first time.
+    The configuration is also set as the default one, so that every api instance of the process shares it.
+    It is authenticated with the credentials of the loaded configuration only, see get_patching_api_client for the bearer token of the default ServiceAccount.
+
+    Returns:
+        client.ApiClient: The api client.
+    """
+    global _api_client
+    with _api_client_lock:
+        if _api_client is None:
+            try:
+                # The operator is being executed in a pod (production).
+                # The ServiceAccount token is read from the pod, and the client reloads it when it is rotated.
+                config.load_incluster_config()
+                configuration = client.Configuration.get_default_copy()
+            except config.ConfigException:
+                # The operator is being executed from shell manually (development).
+                configuration = client.Configuration()
+                config.load_kube_config(client_configuration=configuration)
+            if get_apiserver_url_environment_variable():
+                configuration.host = get_apiserver_url_environment_variable()
+            client.Configuration.set_default(configuration)
+            _api_client = client.ApiClient(configuration)
+        return _api_client
+
+
+def _has_credentials(configuration:client.Configuration) -> bool:
+    """ Check if a configuration authenticates its requests by itself.
+
+    Args:
+        configuration (client.Configuration): The configuration.
+
+    Returns:
+        bool: True if it has a bearer token, or a way of refreshing it, or a client certificate, False otherwise.
+    """
+    return 'authorization' in configuration.api_key or configuration.refresh_api_key_hook is not None or bool(configuration.cert_file)
+
+
+def get_patching_api_client(apiserver_url:str) -> client.ApiClient:
+    """ Obtains the api client with which the deployments are patched through an apiserver.
+    It is the shared one, see get_api_client, if it points to the same apiserver and its configuration has credentials.
+    Otherwise, a copy of its configuration pointing to the apiserver is created, only the first time, whose bearer token is set in get_api_instance.
+
+    Args:
+        apiserver_url (str): The configuration host and port, of the form https://[host]:[port]
+
+    Returns:
+        client.ApiClient: The api client.
+    """
+    api_client = get_api_client()
+    if apiserver_url == api_client.configuration.host and _has_credentials(api_client.configuration):
+        return api_client
+    with _patching_api_clients_lock:
+        if apiserver_url not in _patching_api_clients:
+            configuration = deepcopy(api_client.configuration)
+            configuration.host = apiserver_url
+            _patching_api_clients[apiserver_url] = client.ApiClient(configuration)
+        return _patching_api_clients[apiserver_url]
+
+
 def get_kubernetes_api_instance() -> client.CoreV1Api:
     """ Obtains an api instance to interact with the kubernetes api from the main_operator.py file.
 
     Returns:
         client.CoreV1Api: The object with which we can interact with kubernetes api.
     """    
-    try:
-        # The operator is being executed in a pod (production).
-        api_instance = client.CoreV1Api(config.load_incluster_config())
-    except:
-        # The operator is being executed from shell manually (development).
-        api_instance = client.CoreV1Api(config.new_client_from_config())
-        return api_instance
-    return api_instance
+    return client.CoreV1Api(get_api_client())
 
 
 def get_apiserver_url(api_instance:client.CoreV1Api) -> str:
-    """ Obtains the apiserver url from the kubernetes api.
+    """ Obtains the url of the apiserver the deployments are updated through, see get_api_instance.
+    It is the host of the configuration loaded once per operator process, see get_api_client: the APISERVER_URL environment variable if set,
+    or else the in-cluster one when the operator runs in a pod, or the kube config one otherwise.
 
     Args:
         api_instance (client.CoreV1Api): The object with which we can interact with kubernetes api.
@@ -53,14 +182,7 @@ def get_apiserver_url(api_instance:client.CoreV1Api) -> str:
     Returns:
         str: The apiserver url, in format https://[host]:[port]
     """    
-    # Get information for all pods
-    resp = api_instance.list_pod_for_all_namespaces()
-    # Set the URL needed to communicate with the API for updates beforehand
-    for pod in resp.items:
-        if 'kube-apiserver' in pod.metadata.name:
-            for container in pod.spec.containers:
-                if 'kube-apiserver' in container.image:
-                    return f'https://{container.liveness_probe.http_get.host}:{container.liveness_probe.http_get.port}'
+    return api_instance.api_client.configuration.host
 
 
 def get_namespaces_to_look_at(api_instance:client.CoreV1Api, native_namespaces:list=['kube-system', 'kube-node-lease', 'kube-public']) -> list:
@@ -83,6 +205,32 @@ def get_namespaces_to_look_at(api_instance:client.CoreV1Api, native_namespaces:l
     return namespaces_to_look_at
 
 
+def get_running_image_digest(api_instance:client.CoreV1Api, deployment:client.V1Deployment, container_name:str) -> Union[str, None]:
+    """ Get the digest of the image a container of a deployment runs, from the imageID its pods report, such as docker.io/library/nginx@sha256:...
+    It is the digest the tag pointed to when the pods pulled it, so it survives the restarts of the operator.
+
+    Args:
+        api_instance (client.CoreV1Api): The object with which we can interact with kubernetes api.
+        deployment (client.V1Deployment): The deployment.
+        container_name (str): The name of the container.
+
+    Returns:
+        str: The digest, of the form sha256:...
+        None: No running pod reports it, or the pods could not be listed.
+    """
+    try:
+        label_selector = ','.join(f'{key}={value}' for key, value in (deployment.spec.selector.match_labels or {}).items())
+        pods = api_instance.list_namespaced_pod(deployment.metadata.namespace, label_selector=label_selector)
+    except Exception:
+        return None
+    for pod in pods.items:
+        for container_status in (pod.status.container_statuses or []) if pod.status else []:
+            # Some runtimes report the ID of the image config instead, which is not the digest of any tag.
+            if container_status.name == container_name and container_status.image_id and '@' in container_status.image_id:
+                return container_status.image_id.rpartition('@')[2]
+    return None
+
+
 def update_container_image(img_name:str, deployment_name:str, deployment_namespace:str, apiserver_url:str, prev_tag:str, tag:str, logs_registry_json_id:str, curr_img_id:str) -> None:
     """ Determines wether the image should be updated or not.
 
@@ -123,7 +271,11 @@ def get_bearer_token(api_instance:client.CoreV1Api, name:str, namespace:str, log
         # Get the service account resource
         sa_resource = api_instance.read_namespaced_service_account(name=name, namespace=namespace)
         # Get the token associated with the service account
-        token_resource_name = [s for s in sa_resource.secrets if 'token' in s.name][0].name
+        token_secrets = [s for s in sa_resource.secrets or [] if 'token' in s.name]
+        if not token_secrets:
+            # Since Kubernetes 1.24, the token secrets of the ServiceAccounts are no longer created automatically.
+            raise CanNotGetBearerTokenException(f'The service account {name} in namespace {namespace} has no token secret.')
+        token_resource_name = token_secrets[0].name
         # Get the secret resource associated with the service account
         secret = api_instance.read_namespaced_secret(name=token_resource_name, namespace=namespace)
         # Get the token data out of the secret
@@ -139,7 +291,9 @@ def get_bearer_token(api_instance:client.CoreV1Api, name:str, namespace:str, log
 
 
 def get_api_instance(apiserver_url:str, logs_registry_json_id:str, curr_img_id:str) -> client.AppsV1Api:
-    """ Obtains an api instance to interact with the kubernetes api.
+    """ Obtains an api instance to interact with the kubernetes api through the given apiserver, see get_patching_api_client.
+    If the loaded configuration has no credentials, the bearer token of the default ServiceAccount of kube-system is used,
+    which is looked up only when it is not cached, see BearerTokenCache.
 
     Args:
         apiserver_url (str): The configuration host and port, of the form https://[host]:[port]
@@ -150,15 +304,11 @@ def get_api_instance(apiserver_url:str, logs_registry_json_id:str, curr_img_id:s
         client.AppsV1Api: The object with which we can interact with kubernetes api.
     """    
     try:
-        configuration = client.Configuration()
-        api_instance = client.CoreV1Api(config.new_client_from_config())
-        configuration.host = apiserver_url
-        configuration.api_key['authorization'] = get_bearer_token(api_instance, "default", "kube-system", logs_registry_json_id, curr_img_id)
-        configuration.api_key_prefix['authorization'] = 'Bearer'
-        configuration.verify_ssl=False
-        with client.ApiClient(configuration) as api_client:
-            # Create an instance of the API class
-            api_instance = client.AppsV1Api(api_client)
+        api_client = get_patching_api_client(apiserver_url)
+        if not _has_credentials(get_api_client().configuration):
+            api_client.configuration.api_key['authorization'] = _bearer_token_cache.get(get_kubernetes_api_instance(), logs_registry_json_id, curr_img_id)
+            api_client.configuration.api_key_prefix['authorization'] = 'Bearer'
+        api_instance = client.AppsV1Api(api_client)
     except Exception:
         get_api_instance_failed(apiserver_url, format_exc(), logs_registry_json_id, curr_img_id)
         raise CanNotGetAPIInstanceException(f'Could not get api instance for apiserver url {apiserver_url} \n \
@@ -167,6 +317,19 @@ def get_api_instance(apiserver_url:str, logs_registry_json_id:str, curr_img_id:s
     return api_instance
 
 
+def _invalidate_bearer_token_if_unauthorized(exception:Exception) -> None:
+    """ Forget the cached bearer token if the apiserver rejected it, as it may have been rotated.
+
+    Args:
+        exception (Exception): The exception raised while calling the kubernetes api.
+
+    Returns:
+        None
+    """
+    if isinstance(exception, ApiException) and exception.status == 401:
+        _bearer_token_cache.invalidate()
+
+
 def update_img_version_in_deployment(api_instance:client.CoreV1Api, img_name:str, tag:str, deployment_name:str, deployment_namespace:str, logs_registry_json_id:str, curr_img_id:str) -> None:
     """ Updates the image version in the deployment by performing a patch, which changes the tag of the image.
     As an imagePullPolicy is assumed to be Always, the deployment is updated automatically.
@@ -197,7 +360,8 @@ def update_img_version_in_deployment(api_instance:client.CoreV1Api, img_name:str
                 }
             }
         api_instance.patch_namespaced_deployment(deployment_name, deployment_namespace, body, pretty=True)
-    except Exception:
+    except Exception as e:
+        _invalidate_bearer_token_if_unauthorized(e)
         update_deployment_failed(deployment_name, deployment_namespace, img_name, tag, format_exc(), logs_registry_json_id, curr_img_id)
         raise CanNotUpdateDeploymentException(f'Could not update deployment {deployment_name} in namespace {deployment_namespace} with image {img_name}:{tag} \n \
             {format_exc()}')
@@ -232,7 +396,8 @@ def restart_deployment(api_instance:client.CoreV1Api, deployment_name:str, deplo
             }
         }
         api_instance.patch_namespaced_deployment(deployment_name, deployment_namespace, body, pretty='true')
-    except Exception:
+    except Exception as e:
+        _invalidate_bearer_token_if_unauthorized(e)
         restart_deployment_failed(deployment_name, deployment_namespace, format_exc(), logs_registry_json_id, curr_img_id)
         raise CanNotRestartDeploymentException(f'Could not restart deployment {deployment_name} in namespace {deployment_namespace} \n \
             {format_exc()}')
@@ -1,17 +1,62 @@
+import asyncio
 import kopf
-from kubernetes import client
-from src.kube.kubernetes_api import get_apiserver_url, get_kubernetes_api_instance, get_namespaces_to_look_at
+from time import time
+from src.kube.kubernetes_api import get_apiserver_url, get_kubernetes_api_instance, get_running_image_digest
+from src.kube.deployments_informer import get_deployments_informer, stop_deployments_informer
 from src.utilities.dates_times import docker_str_to_datetime
-from src.docker_imgs.dockerhub_api import get_latest_version_dockerhub, get_updatable_dockerhub_imgs, img_namespace_for_search_query, get_search_img_dockerhub_api, get_latest_img_date_dockerhub_api
-from src.utilities.environment_variables import get_refresh_frequency_in_seconds_environment_variable, get_versions_frontier_environment_variable
-from src.utilities.versions import get_latest_pep440_updatable_version, get_latest_version, get_newest_docker_updatable_version
+from src.docker_imgs.namespaces import resolve_dockerhub_image
+from src.docker_imgs.dockerhub_api import get_latest_version_dockerhub, get_updatable_dockerhub_imgs, get_dockerhub_tag_records, img_namespace_for_search_query, get_search_img_dockerhub_api, get_latest_img_date_dockerhub_api
+from src.utilities.environment_variables import get_versions_frontier_environment_variable, get_log_registry_flush_interval_in_seconds_environment_variable, \
+    get_refresh_frequency_in_seconds_environment_variable, get_scheduling_mode_environment_variable
+from src.utilities.versions import get_latest_pep440_updatable_version_from_index, get_latest_version_from_index, get_newest_docker_updatable_version
 from src.utilities.updater import updating_engine
-from src.utilities.internet_connection import is_there_internet_connection
-from src.utilities.logging_messages import on_create_log, on_delete_log, on_resume_log, on_update_log
-from src.gitlab.api import get_all_gitlab_imgs_in_repository, get_gitlab_imgs_tags
+from src.utilities.scheduling import get_seconds_until_next_updates_check
+from src.utilities.adaptive_polling import is_image_check_due, schedule_image_check
+from src.utilities.internet_connection import is_there_internet_connection, is_registry_reachable, get_reachability_monitor, stop_reachability_monitor
+from src.utilities.logging_messages import on_create_log, on_delete_log, on_resume_log, on_update_log, oci_image_reference_invalid
+from src.utilities.rate_limiter import get_image_request_priority, set_request_priority
+from src.utilities.logs_registry import log_registry
+from src.utilities.notifications import notifications_dispatcher, notifications_digest, smtp_session
+from src.gitlab.api import get_all_gitlab_imgs_in_repository, get_gitlab_imgs_tags_index
+from src.oci.api import split_oci_image_reference, get_oci_registry_url, get_oci_imgs_tags_index, get_oci_manifest_digest, get_latest_digest, save_latest_digest, \
+    InvalidOCIImageReferenceException
 
 
 
+@kopf.on.startup()
+def on_startup(**_:dict) -> None:
+    """ This function is called once when the operator starts, before any versioninghandler is handled.
+    See here for more information -> https://kopf.readthedocs.io/en/stable/startup/
+
+    Returns:
+        None
+    """
+    # Load the kubernetes configuration, resolve the apiserver url, and start filling the deployments index while the handlers are being resumed.
+    get_apiserver_url(get_kubernetes_api_instance())
+    get_deployments_informer()
+    # Start probing the container registries, so that the first ticks already know which ones are reachable.
+    get_reachability_monitor()
+    # Load the logs registry once, and write it back to disk periodically.
+    log_registry.start(get_log_registry_flush_interval_in_seconds_environment_variable())
+
+
+@kopf.on.cleanup()
+def on_cleanup(**_:dict) -> None:
+    """ This function is called once when the operator exits.
+    See here for more information -> https://kopf.readthedocs.io/en/stable/shutdown/
+
+    Returns:
+        None
+    """
+    stop_deployments_informer()
+    stop_reachability_monitor()
+    log_registry.stop()
+    # Send the pending notifications before exiting.
+    notifications_digest.stop()
+    notifications_dispatcher.stop()
+    smtp_session.close()
+
+
 @kopf.on.create('versioninghandlers')
 def on_create(spec:dict, meta:dict, **kwargs:dict) -> None:
     """ This function is called when a new versioninghandler is created.
@@ -40,6 +85,8 @@ def on_delete(spec:dict, meta:dict, **kwargs:dict) -> None:
         None 
     """    
     on_delete_log(spec, meta['name'], meta['name'], kwargs)
+    # The logs registry of the versioninghandler is no longer needed.
+    log_registry.expire([meta['name']])
 
 
 @kopf.on.update('versioninghandlers')
@@ -72,76 +119,144 @@ def on_resume(spec:dict, meta:dict, **kwargs:dict) -> None:
     on_resume_log(spec, meta['name'], meta['name'], kwargs)
 
 
-@kopf.timer('versioninghandlers', interval=get_refresh_frequency_in_seconds_environment_variable())
 def updates_checker(spec:dict, meta:dict, **_:dict) -> None:
     """ This is the operator's heart.
     It is the function responsible of retrieving the deployment's images versions continuously and update/notify the user.
+    It is run by a kopf timer in lockstep mode, or by a kopf daemon in sharded mode, see sharded_updates_checker.
     See here for more information about how kopf timers work -> https://kopf.readthedocs.io/en/stable/timers/
 
     Returns: None
     """    
     logs_registry_json_id = meta['name']
 
-    internet_access_available = is_there_internet_connection(logs_registry_json_id)
-
     #Get container registry to check
     container_registry = spec['containerregistry']
-    if container_registry != 'dockerhub' != 'gitlab':
-        raise ValueError(f'The container registry specified in the object {meta["name"]} must be either dockerhub or gitlab')
+    if container_registry not in ('dockerhub', 'gitlab', 'oci'):
+        raise ValueError(f'The container registry specified in the object {meta["name"]} must be either dockerhub, gitlab or oci')
+
+    # Skip the registry right away if the last probe could not reach it, instead of waiting for its requests to time out.
+    if container_registry == 'dockerhub' and not is_there_internet_connection(logs_registry_json_id):
+        return
+    if container_registry == 'gitlab' and not is_registry_reachable('gitlab', logs_registry_json_id):
+        return
 
     # Catch object information.
     target_deployment = spec['deployment']
     # Get environment variables values
     version_frontier = get_versions_frontier_environment_variable()
 
-    # Get namespaces to look at
     api_instance = get_kubernetes_api_instance()
     apiserver_url = get_apiserver_url(api_instance)
-    namespaces_to_look_at = get_namespaces_to_look_at(api_instance)
-
-    # Traverse pods' images, obtaining their information and 
-    #config.load_kube_config()
-    appsv1api = client.AppsV1Api()
-    for deployment_namespace in namespaces_to_look_at:
-        deployments = appsv1api.list_namespaced_deployment(namespace=deployment_namespace)
-        for deployment in deployments.items:
-            if deployment.metadata.name == target_deployment:
-                deployment_name = deployment.metadata.name
-                deployment_namespace = deployment.metadata.namespace
-                for container in deployment.spec.template.spec.containers: 
-                    # Get image names and versions.
-                    # Partition is needed for Gitlab versions, which contain the whole URL in the deployment name field.
-                    img_partition = container.image.partition('containers/')
-                    short_img_name = container.image if img_partition[2] == '' else img_partition[2]
-                    img_version = short_img_name.split(':')[1]
-                    short_img_name = short_img_name.split(':')[0]
-                    full_image_name = short_img_name.split(':')[0] if img_partition[2] == '' else f'{img_partition[0]}containers/{img_partition[2].split(":")[0]}'
-                    logs_registry_curr_img_id = f'{deployment_namespace}/{deployment_name}/{short_img_name}:{img_version}'
-
-                    if container_registry == 'gitlab':
-                        # All Gitlab's images of the repository
-                        gitlab_imgs_list = set(get_all_gitlab_imgs_in_repository(logs_registry_json_id, ''))
-                        if short_img_name in gitlab_imgs_list:
-                            # Gitlab image
-                            img_versions = get_gitlab_imgs_tags(short_img_name, logs_registry_json_id, logs_registry_curr_img_id)
-                            latest_version_number = get_latest_version(img_versions, filter=True)
-                            latest_updatable_version_number = get_latest_pep440_updatable_version(img_version, img_versions, version_frontier)
-                            if latest_updatable_version_number != '' or latest_version_number == 'latest':
-                                updating_engine(full_image_name, deployment_name, deployment_namespace, apiserver_url, img_version, \
-                                    latest_updatable_version_number, latest_version_number, logs_registry_json_id, logs_registry_curr_img_id)
-                    if container_registry == 'dockerhub' and internet_access_available:
-                        # Docker image, it requires internet access
-                        full_image_namespace = img_namespace_for_search_query(get_search_img_dockerhub_api(full_image_name, logs_registry_json_id, logs_registry_curr_img_id), full_image_name, logs_registry_json_id, logs_registry_curr_img_id)
-                        if img_version == 'latest':
-                            latest_updatable_version_number = latest_version_number = 'latest'
-                        else:
-                            available_newer_imgs = get_updatable_dockerhub_imgs(full_image_namespace, full_image_name, img_version, logs_registry_json_id, logs_registry_curr_img_id)
-                            latest_version_number = get_latest_version_dockerhub(available_newer_imgs)
-                            latest_updatable_version_number = get_newest_docker_updatable_version(img_versions, version_frontier, latest_version_number)
-                        # Get current image date.
-                        curr_image_date = docker_str_to_datetime(get_latest_img_date_dockerhub_api(full_image_namespace, full_image_name, img_version, logs_registry_json_id, logs_registry_curr_img_id))
-                        # Check on the catalogue of the Docker Hub for the latest image with the name and tag
-                        latest_image_date = docker_str_to_datetime(get_latest_img_date_dockerhub_api(full_image_namespace, full_image_name, 'latest', logs_registry_json_id, logs_registry_curr_img_id))
-                        if latest_updatable_version_number != '':
-                            updating_engine(full_image_name, deployment_name, deployment_namespace, apiserver_url, img_version, \
-                                latest_updatable_version_number, latest_version_number, logs_registry_json_id, logs_registry_curr_img_id, curr_img_date=curr_image_date, latest_img_date=latest_image_date)
+
+    # Traverse the deployment's images. The deployments are looked up in the index kept by the informer, instead of listing every namespace.
+    for deployment in get_deployments_informer().get_deployments(target_deployment):
+        deployment_name = deployment.metadata.name
+        deployment_namespace = deployment.metadata.namespace
+        for container in deployment.spec.template.spec.containers: 
+            if container_registry == 'oci':
+                # The image reference carries the registry host, which may have a port, so it is split on its own.
+                try:
+                    oci_host, oci_img_name, img_version = split_oci_image_reference(container.image)
+                except InvalidOCIImageReferenceException as e:
+                    oci_image_reference_invalid(container.image, str(e), logs_registry_json_id, f'{deployment_namespace}/{deployment_name}/{container.image}')
+                    continue
+                logs_registry_curr_img_id = f'{deployment_namespace}/{deployment_name}/{oci_host}/{oci_img_name}:{img_version}'
+                set_request_priority(get_image_request_priority(logs_registry_curr_img_id))
+                # Each registry host is probed on its own.
+                get_reachability_monitor().register(f'oci:{oci_host}', f'{get_oci_registry_url(oci_host)}/v2/')
+                if not is_registry_reachable(f'oci:{oci_host}', logs_registry_json_id, logs_registry_curr_img_id):
+                    continue
+                if img_version == 'latest':
+                    # A single HEAD on the manifest tells if latest moved since the previous check.
+                    latest_img_digest = get_oci_manifest_digest(oci_host, oci_img_name, 'latest', logs_registry_json_id, logs_registry_curr_img_id)
+                    # The digest the pods run is only read when it is not known yet, such as after a restart of the operator.
+                    curr_img_digest = get_latest_digest(logs_registry_curr_img_id, latest_img_digest, \
+                        lambda: get_running_image_digest(api_instance, deployment, container.name))
+                    updating_engine(f'{oci_host}/{oci_img_name}', deployment_name, deployment_namespace, apiserver_url, img_version, 'latest', 'latest', \
+                        logs_registry_json_id, logs_registry_curr_img_id, curr_img_digest=curr_img_digest, latest_img_digest=latest_img_digest)
+                    # Only saved once the deployment has been restarted, so that a failed restart is tried again on the next check.
+                    save_latest_digest(logs_registry_curr_img_id, latest_img_digest)
+                else:
+                    img_tags_index = get_oci_imgs_tags_index(oci_host, oci_img_name, logs_registry_json_id, logs_registry_curr_img_id)
+                    latest_version_number = get_latest_version_from_index(img_tags_index)
+                    latest_updatable_version_number = get_latest_pep440_updatable_version_from_index(img_version, img_tags_index, version_frontier)
+                    if latest_updatable_version_number != '':
+                        updating_engine(f'{oci_host}/{oci_img_name}', deployment_name, deployment_namespace, apiserver_url, img_version, \
+                            latest_updatable_version_number, latest_version_number, logs_registry_json_id, logs_registry_curr_img_id)
+                continue
+            # Get image names and versions.
+            # Partition is needed for Gitlab versions, which contain the whole URL in the deployment name field.
+            img_partition = container.image.partition('containers/')
+            short_img_name = container.image if img_partition[2] == '' else img_partition[2]
+            img_version = short_img_name.split(':')[1]
+            short_img_name = short_img_name.split(':')[0]
+            full_image_name = short_img_name.split(':')[0] if img_partition[2] == '' else f'{img_partition[0]}containers/{img_partition[2].split(":")[0]}'
+            logs_registry_curr_img_id = f'{deployment_namespace}/{deployment_name}/{short_img_name}:{img_version}'
+            # The requests of the images waiting for the user to update them are sent first when the registry is rate limited.
+            set_request_priority(get_image_request_priority(logs_registry_curr_img_id))
+
+            if container_registry == 'gitlab':
+                # All Gitlab's images of the repository
+                gitlab_imgs_list = set(get_all_gitlab_imgs_in_repository(logs_registry_json_id, ''))
+                if short_img_name in gitlab_imgs_list:
+                    # Gitlab image
+                    img_tags_index = get_gitlab_imgs_tags_index(short_img_name, logs_registry_json_id, logs_registry_curr_img_id)
+                    latest_version_number = get_latest_version_from_index(img_tags_index)
+                    latest_updatable_version_number = get_latest_pep440_updatable_version_from_index(img_version, img_tags_index, version_frontier)
+                    if latest_updatable_version_number != '' or latest_version_number == 'latest':
+                        updating_engine(full_image_name, deployment_name, deployment_namespace, apiserver_url, img_version, \
+                            latest_updatable_version_number, latest_version_number, logs_registry_json_id, logs_registry_curr_img_id)
+            if container_registry == 'dockerhub' and is_image_check_due(logs_registry_curr_img_id, time()):
+                # Docker image, it requires internet access
+                # The namespace is taken from the image reference, so the search API is only called if explicitly enabled.
+                full_image_namespace, dockerhub_image_name = resolve_dockerhub_image(full_image_name, \
+                    lambda: img_namespace_for_search_query(get_search_img_dockerhub_api(full_image_name, logs_registry_json_id, logs_registry_curr_img_id), full_image_name, logs_registry_json_id, logs_registry_curr_img_id))
+                if img_version == 'latest':
+                    latest_updatable_version_number = latest_version_number = 'latest'
+                    tag_records = None
+                else:
+                    available_newer_imgs = get_updatable_dockerhub_imgs(dockerhub_image_name, full_image_namespace, img_version, logs_registry_json_id, logs_registry_curr_img_id)
+                    latest_version_number = get_latest_version_dockerhub(available_newer_imgs)
+                    latest_updatable_version_number = get_newest_docker_updatable_version(available_newer_imgs, version_frontier, latest_version_number)
+                    # Records of the tags listed above, which usually contain the dates of the current and latest tags.
+                    tag_records = get_dockerhub_tag_records(dockerhub_image_name, full_image_namespace, img_version, logs_registry_json_id, logs_registry_curr_img_id)
+                # Get current image date.
+                curr_image_date = docker_str_to_datetime(get_latest_img_date_dockerhub_api(full_image_namespace, dockerhub_image_name, img_version, logs_registry_json_id, logs_registry_curr_img_id, tag_records))
+                # Check on the catalogue of the Docker Hub for the latest image with the name and tag
+                latest_image_date = curr_image_date if img_version == 'latest' else \
+                    docker_str_to_datetime(get_latest_img_date_dockerhub_api(full_image_namespace, dockerhub_image_name, 'latest', logs_registry_json_id, logs_registry_curr_img_id, tag_records))
+                if latest_updatable_version_number != '':
+                    updating_engine(full_image_name, deployment_name, deployment_namespace, apiserver_url, img_version, \
+                        latest_updatable_version_number, latest_version_number, logs_registry_json_id, logs_registry_curr_img_id, curr_img_date=curr_image_date, latest_img_date=latest_image_date)
+                # The dates of the tags seen tell how often the image is released, and therefore when to check it again.
+                release_dates = [docker_str_to_datetime(r.last_updated) for r in (tag_records or {}).values() if r.last_updated]
+                schedule_image_check(logs_registry_curr_img_id, time(), release_dates + [curr_image_date, latest_image_date])
+
+
+async def sharded_updates_checker(spec:dict, meta:dict, **_:dict) -> None:
+    """ Checks a versioninghandler once per REFRESH_FREQUENCY_IN_SECONDS, on its own slot of the interval, see get_seconds_until_next_updates_check.
+    It sleeps until its slot, instead of being a timer that ticks often and skips the ticks out of its slot, as kopf logs every run of a timer,
+    which is also posted as a Kubernetes event of the object.
+    See here for more information about how kopf daemons work -> https://kopf.readthedocs.io/en/stable/daemons/
+
+    Args:
+        spec (dict): The spec of the versioninghandler, kept up to date by kopf while the daemon runs.
+        meta (dict): The metadata of the versioninghandler.
+
+    Returns:
+        None
+    """
+    # The daemon is async, and kopf cancels it when the object is deleted or the operator exits: a sync daemon would hold a thread of
+    # the kopf executor for its whole life, so with more versioninghandlers than threads, the rest of daemons and handlers would never run.
+    # Only the checks themselves take a thread, of the default executor of the event loop.
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(get_seconds_until_next_updates_check(meta['uid'], time()))
+        await loop.run_in_executor(None, updates_checker, spec, meta)
+
+
+# The updates checker is registered according to SCHEDULING_MODE.
+if get_scheduling_mode_environment_variable() == 'sharded':
+    kopf.daemon('versioninghandlers')(sharded_updates_checker)
+else:
+    kopf.timer('versioninghandlers', interval=get_refresh_frequency_in_seconds_environment_variable())(updates_checker)
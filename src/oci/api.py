@@ -0,0 +1,260 @@
+import re
+from json import loads
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from traceback import format_exc
+from typing import Callable, Iterator, Union
+from urllib.parse import urljoin, urlencode
+from requests import HTTPError
+from src.utilities.environment_variables import get_oci_insecure_registries_environment_variable, get_oci_registry_credentials_environment_variable, \
+    get_tags_cache_max_size_environment_variable
+from src.utilities.logging_messages import oci_request_failed
+from src.utilities.registry_http import registry_http_client
+from src.utilities.tags_cache import tags_cache
+from src.utilities.tags_index import SortedTagsIndex, get_tags_index
+
+
+
+class OCIRegistryRequestFailedException(Exception):
+    """ Raised when a request to the OCI Distribution API of a registry fails. """
+    pass
+
+
+class InvalidOCIImageReferenceException(Exception):
+    """ Raised when an image reference does not start with the host of its registry. """
+    pass
+
+
+# Media types of the manifests accepted when reading the digest of a tag, so that multi-arch images return the digest of their index.
+oci_manifest_accept = ', '.join(['application/vnd.oci.image.index.v1+json', 'application/vnd.oci.image.manifest.v1+json', \
+    'application/vnd.docker.distribution.manifest.list.v2+json', 'application/vnd.docker.distribution.manifest.v2+json'])
+oci_tags_page_size = 1000
+
+link_next_regex = re.compile(r'<([^>]+)>\s*;\s*rel="?next"?')
+bearer_challenge_param_regex = re.compile(r'(\w+)="([^"]*)"')
+
+
+def split_oci_image_reference(img_reference:str) -> tuple:
+    """ Split an image reference of an OCI registry into the registry host, the repository name and the tag.
+
+    As Docker does, the first component of the reference is the host only if it contains a . or a :, or is localhost.
+
+    Args:
+        img_reference (str): The image reference, for example registry.local:5000/team/app:1.2. The tag defaults to latest.
+
+    Raises:
+        InvalidOCIImageReferenceException: If the reference has no registry host, such as team/app:1.2 or nginx:1.2.
+
+    Returns:
+        tuple: The host, the name and the tag, for example ('registry.local:5000', 'team/app', '1.2').
+    """
+    host, _, repository = img_reference.partition('/')
+    if not repository or not ('.' in host or ':' in host or host == 'localhost'):
+        raise InvalidOCIImageReferenceException(f'The image reference {img_reference} does not start with the host of its registry.')
+    repository = repository.partition('@')[0]
+    if ':' not in repository.split('/')[-1]:
+        return host, repository, 'latest'
+    name, _, tag = repository.rpartition(':')
+    return host, name, tag
+
+
+def get_oci_registry_url(host:str) -> str:
+    """ Get the base url of a registry, which is served over plain http only if listed in OCI_INSECURE_REGISTRIES.
+
+    Args:
+        host (str): The host of the registry, with port if any.
+
+    Returns:
+        str: The base url.
+    """
+    return f'{"http" if host in get_oci_insecure_registries_environment_variable() else "https"}://{host}'
+
+
+# Bearer tokens of the registries that require them, by (host, name), see _get_bearer_token.
+_bearer_tokens = {}
+_bearer_tokens_lock = Lock()
+
+
+def _oci_request(method:str, host:str, name:str, url:str, headers:Union[dict, None]=None):
+    """ Send a request to the OCI Distribution API of a registry.
+    If the registry answers 401 with a Bearer challenge, a token with pull scope for the repository is obtained, anonymously or with
+    the credentials of OCI_REGISTRY_CREDENTIALS, and the request is sent again.
+
+    Args:
+        method (str): GET or HEAD.
+        host (str): The host of the registry.
+        name (str): The name of the repository.
+        url (str): The url.
+        headers (Union[dict, None], optional): Extra headers. Defaults to None.
+
+    Raises:
+        requests.HTTPError: If the response status is an error one.
+
+    Returns:
+        RegistryResponse: The response.
+    """
+    send = registry_http_client.get if method == 'GET' else registry_http_client.head
+    headers = dict(headers or {})
+    with _bearer_tokens_lock:
+        token = _bearer_tokens.get((host, name))
+    if token is not None and token[1] > monotonic():
+        headers['Authorization'] = f'Bearer {token[0]}'
+    try:
+        return send(url, headers=headers)
+    except HTTPError as e:
+        challenge = e.response.headers.get('WWW-Authenticate', '') if e.response is not None else ''
+        if e.response is None or e.response.status_code != 401 or not challenge.lower().startswith('bearer'):
+            raise
+    headers['Authorization'] = f'Bearer {_get_bearer_token(host, name, challenge)}'
+    return send(url, headers=headers)
+
+
+def _get_bearer_token(host:str, name:str, challenge:str) -> str:
+    """ Obtain a token from the authorization service given in the Bearer challenge of a registry, and keep it until it expires.
+
+    Args:
+        host (str): The host of the registry.
+        name (str): The name of the repository.
+        challenge (str): The WWW-Authenticate header, of the form Bearer realm="...",service="...",scope="...".
+
+    Returns:
+        str: The token.
+    """
+    params = dict(bearer_challenge_param_regex.findall(challenge))
+    realm = params.pop('realm')
+    params.setdefault('scope', f'repository:{name}:pull')
+    headers = {}
+    credentials = get_oci_registry_credentials_environment_variable().get(host)
+    if credentials is not None:
+        headers['Authorization'] = f'Basic {credentials}'
+    content = registry_http_client.get_json(f'{realm}?{urlencode(params)}', headers=headers)
+    token = content.get('token') or content.get('access_token')
+    with _bearer_tokens_lock:
+        # Renewed a bit before it expires. Tokens without expiration are valid for 60 seconds, as the specification says.
+        _bearer_tokens[(host, name)] = (token, monotonic() + max(0, int(content.get('expires_in', 60)) - 10))
+    return token
+
+
+def iter_oci_imgs_tags(host:str, name:str) -> Iterator[str]:
+    """ Lazily iterate over the tags of a repository with /v2/<name>/tags/list, following the pagination given in the Link header.
+
+    Args:
+        host (str): The host of the registry.
+        name (str): The name of the repository.
+
+    Yields:
+        str: The tags.
+    """
+    base_url = get_oci_registry_url(host)
+    url = f'{base_url}/v2/{name}/tags/list?n={oci_tags_page_size}'
+    while url is not None:
+        response = _oci_request('GET', host, name, url)
+        yield from loads(response.content).get('tags') or []
+        next_link = link_next_regex.search(response.headers.get('Link', ''))
+        url = urljoin(base_url, next_link.group(1)) if next_link is not None else None
+
+
+def get_oci_imgs_tags_index(host:str, name:str, logs_registry_json_id:str, curr_img_id:str) -> SortedTagsIndex:
+    """ Get the sorted tags index of a repository of an OCI registry. The tags are read through the tags cache shared by all the VersioningHandlers.
+
+    Args:
+        host (str): The host of the registry.
+        name (str): The name of the repository.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Raises:
+        OCIRegistryRequestFailedException: If the tags can not be listed.
+
+    Returns:
+        SortedTagsIndex: The index of the tags of the repository.
+    """
+    key = ('oci', host, name)
+    def fetch() -> list:
+        try:
+            tags = list(iter_oci_imgs_tags(host, name))
+        except Exception:
+            oci_request_failed(host, name, 'tags/list', format_exc(), logs_registry_json_id, curr_img_id)
+            raise OCIRegistryRequestFailedException(f'Listing the tags of {host}/{name} failed.')
+        # The sorted index of the repository is only updated when the tags are fetched again.
+        get_tags_index(key).update(tags)
+        return tags
+    tags = tags_cache.get_or_fetch(key, fetch)
+    tags_index = get_tags_index(key)
+    if tags and len(tags_index) == 0 and not tags_index.other_tags:
+        # The index was discarded while the tags were still cached.
+        tags_index.update(tags)
+    return tags_index
+
+
+def get_oci_manifest_digest(host:str, name:str, tag:str, logs_registry_json_id:str, curr_img_id:str) -> str:
+    """ Get the digest of the manifest a tag points to, with a single HEAD request to /v2/<name>/manifests/<tag>.
+
+    Args:
+        host (str): The host of the registry.
+        name (str): The name of the repository.
+        tag (str): The tag.
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str): The ID of the current image.
+
+    Raises:
+        OCIRegistryRequestFailedException: If the request fails, or the response has no Docker-Content-Digest header.
+
+    Returns:
+        str: The digest, of the form sha256:...
+    """
+    try:
+        response = _oci_request('HEAD', host, name, f'{get_oci_registry_url(host)}/v2/{name}/manifests/{tag}', headers={'Accept': oci_manifest_accept})
+        return response.headers['Docker-Content-Digest']
+    except Exception:
+        oci_request_failed(host, name, f'manifests/{tag}', format_exc(), logs_registry_json_id, curr_img_id)
+        raise OCIRegistryRequestFailedException(f'Reading the digest of {host}/{name}:{tag} failed.')
+
+
+_latest_digests = OrderedDict()
+_latest_digests_lock = Lock()
+
+
+def get_latest_digest(curr_img_id:str, digest:str, get_running_digest:Callable[[], Union[str, None]]=None) -> str:
+    """ Get the digest the latest tag of an image pointed to when the deployment was last updated, so that a change means that latest moved.
+    The digests are only kept in memory, so the first time, or after a restart of the operator or the eviction of the image, the digest the deployment runs is read,
+    and saved. If it can not be known, the given one is assumed to be running, so a push of latest before that check is only applied with the next one.
+
+    Args:
+        curr_img_id (str): The ID of the current image, of the form namespace/deployment/image:tag.
+        digest (str): The digest latest points to now.
+        get_running_digest (Callable[[], Union[str, None]], optional): Returns the digest the deployment runs, or None if unknown, see get_running_image_digest. Defaults to None.
+
+    Returns:
+        str: The digest saved, see save_latest_digest, or else the running one, or the given one.
+    """
+    with _latest_digests_lock:
+        if curr_img_id in _latest_digests:
+            return _latest_digests[curr_img_id]
+    running_digest = get_running_digest() if get_running_digest else None
+    with _latest_digests_lock:
+        if curr_img_id not in _latest_digests:
+            _save_latest_digest(curr_img_id, running_digest or digest)
+        return _latest_digests[curr_img_id]
+
+
+def save_latest_digest(curr_img_id:str, digest:str) -> None:
+    """ Save the digest the latest tag of an image points to, once the deployment has been updated to it.
+
+    Args:
+        curr_img_id (str): The ID of the current image.
+        digest (str): The digest.
+
+    Returns:
+        None
+    """
+    with _latest_digests_lock:
+        _save_latest_digest(curr_img_id, digest)
+
+
+def _save_latest_digest(curr_img_id:str, digest:str) -> None:
+    _latest_digests[curr_img_id] = digest
+    _latest_digests.move_to_end(curr_img_id)
+    while len(_latest_digests) > max(1, get_tags_cache_max_size_environment_variable()):
+        _latest_digests.popitem(last=False)
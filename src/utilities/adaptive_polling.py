@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from statistics import median
+from threading import Lock
+from time import time
+from typing import Iterable, Union
+from src.utilities.environment_variables import get_adaptive_polling_environment_variable, get_adaptive_polling_min_interval_in_seconds_environment_variable, \
+    get_adaptive_polling_max_interval_in_seconds_environment_variable, get_adaptive_polling_factor_environment_variable, get_tags_cache_max_size_environment_variable
+
+
+
+# Tags pushed within this time of each other, such as 1.23, 1.23-alpine and latest, belong to the same release.
+release_grouping_in_seconds = 3600
+# Release dates kept per image to estimate its release interval.
+release_history_size = 20
+# Median gaps between releases after which an image without new releases is considered dormant.
+dormant_after_median_gaps = 2
+
+
+def get_release_times(pushed_times:Iterable[float], grouping_in_seconds:float=release_grouping_in_seconds) -> list:
+    """ Get the times of the releases of an image from the times its tags were pushed, grouping the ones pushed together.
+
+    Args:
+        pushed_times (Iterable[float]): The unix times the tags were pushed.
+        grouping_in_seconds (float, optional): The seconds within which tags belong to the same release. Defaults to release_grouping_in_seconds.
+
+    Returns:
+        list: The unix times of the releases, sorted, each of them the time of the first tag of the release.
+    """
+    release_times = []
+    for pushed_at in sorted(pushed_times):
+        if not release_times or pushed_at - release_times[-1] > grouping_in_seconds:
+            release_times.append(pushed_at)
+    return release_times
+
+
+def estimate_release_interval(release_times:list, now:float) -> Union[float, None]:
+    """ Estimate the seconds between the releases of an image: the median gap between its releases,
+    or the time since its last release once it is longer than dormant_after_median_gaps median gaps, so that images that stopped releasing are considered dormant,
+    while the ones that keep their cadence are not checked less often as their next release approaches.
+
+    Args:
+        release_times (list): The unix times of the releases, sorted.
+        now (float): The current unix time.
+
+    Returns:
+        float: The release interval in seconds.
+        None: No release is known.
+    """
+    if not release_times:
+        return None
+    gaps = [b - a for a, b in zip(release_times, release_times[1:])]
+    time_since_last_release = max(0.0, now - release_times[-1])
+    if not gaps:
+        return time_since_last_release
+    median_gap = median(gaps)
+    return time_since_last_release if time_since_last_release > dormant_after_median_gaps * median_gap else median_gap
+
+
+def get_polling_interval(release_interval_in_seconds:Union[float, None], factor:float, min_interval_in_seconds:float, max_interval_in_seconds:float) -> float:
+    """ Get the seconds between the checks of an image, a fraction of its release interval, within the bounds.
+
+    Args:
+        release_interval_in_seconds (Union[float, None]): The release interval, see estimate_release_interval.
+        factor (float): The fraction of the release interval.
+        min_interval_in_seconds (float): The minimum seconds between checks.
+        max_interval_in_seconds (float): The maximum seconds between checks.
+
+    Returns:
+        float: The polling interval in seconds, the minimum if the release interval is unknown.
+    """
+    if release_interval_in_seconds is None:
+        return min_interval_in_seconds
+    return max(min_interval_in_seconds, min(max_interval_in_seconds, release_interval_in_seconds * factor))
+
+
+class AdaptivePolling():
+    """ Decides when each image is checked again, from the release dates seen for it, so that images released often are checked
+    on every tick, and dormant ones less and less often, see get_polling_interval.
+
+    The release dates and the time of the next check of the images are kept in memory, for the most recently checked max_size images.
+    """
+    def __init__(self, factor:float, min_interval_in_seconds:float, max_interval_in_seconds:float, max_size:int) -> None:
+        self.factor = factor
+        self.min_interval_in_seconds = min_interval_in_seconds
+        self.max_interval_in_seconds = max(min_interval_in_seconds, max_interval_in_seconds)
+        self.max_size = max_size
+        self._images = OrderedDict()
+        self._lock = Lock()
+
+    def is_due(self, curr_img_id:str, now:float) -> bool:
+        """ Check if an image has to be checked now.
+
+        Args:
+            curr_img_id (str): The id of the image, of the form namespace/deployment/image:tag.
+            now (float): The current unix time.
+
+        Returns:
+            bool: True if the image has not been scheduled yet, or its next check has arrived, False otherwise.
+        """
+        with self._lock:
+            entry = self._images.get(curr_img_id)
+            return entry is None or now >= entry[1]
+
+    def schedule(self, curr_img_id:str, now:float, dates:Iterable[datetime]) -> float:
+        """ Save the dates seen in a check of an image, and schedule its next check.
+
+        Args:
+            curr_img_id (str): The id of the image.
+            now (float): The current unix time.
+            dates (Iterable[datetime]): The dates the tags of the image were pushed, as given by DockerHub.
+
+        Returns:
+            float: The polling interval of the image in seconds.
+        """
+        with self._lock:
+            entry = self._images.get(curr_img_id)
+            # The dates are naive, in UTC, as docker_str_to_datetime returns them.
+            pushed_times = [d.replace(tzinfo=timezone.utc).timestamp() for d in dates] + (entry[0] if entry is not None else [])
+            release_times = get_release_times(pushed_times)[-release_history_size:]
+            interval_in_seconds = get_polling_interval(estimate_release_interval(release_times, now), self.factor, \
+                self.min_interval_in_seconds, self.max_interval_in_seconds)
+            # The checks are made on the ticks of the timer, so the next one is brought forward half of the minimum interval,
+            # for it not to be skipped by a tick arriving slightly early.
+            self._images[curr_img_id] = (release_times, now + interval_in_seconds - self.min_interval_in_seconds / 2)
+            self._images.move_to_end(curr_img_id)
+            while len(self._images) > max(1, self.max_size):
+                self._images.popitem(last=False)
+            return interval_in_seconds
+
+    def stats(self) -> dict:
+        """ Get the polling interval of the images scheduled.
+
+        Returns:
+            dict: The seconds until the next check of each image, of the form {curr_img_id: seconds}, negative if due.
+        """
+        with self._lock:
+            now = time()
+            return {curr_img_id: next_check_at - now for curr_img_id, (_, next_check_at) in self._images.items()}
+
+
+def is_image_check_due(curr_img_id:str, now:float) -> bool:
+    """ Check if an image has to be checked now, according to ADAPTIVE_POLLING.
+
+    Args:
+        curr_img_id (str): The id of the image.
+        now (float): The current unix time.
+
+    Returns:
+        bool: True if adaptive polling is disabled, and otherwise, see AdaptivePolling.is_due.
+    """
+    return get_adaptive_polling_environment_variable() != 'true' or adaptive_polling.is_due(curr_img_id, now)
+
+
+def schedule_image_check(curr_img_id:str, now:float, dates:Iterable[datetime]) -> None:
+    """ Schedule the next check of an image from the dates seen, if ADAPTIVE_POLLING is enabled, see AdaptivePolling.schedule.
+
+    Args:
+        curr_img_id (str): The id of the image.
+        now (float): The current unix time.
+        dates (Iterable[datetime]): The dates the tags of the image were pushed.
+
+    Returns:
+        None
+    """
+    if get_adaptive_polling_environment_variable() == 'true':
+        adaptive_polling.schedule(curr_img_id, now, dates)
+
+
+# Shared by all the VersioningHandlers.
+adaptive_polling = AdaptivePolling(get_adaptive_polling_factor_environment_variable(), get_adaptive_polling_min_interval_in_seconds_environment_variable(), \
+    get_adaptive_polling_max_interval_in_seconds_environment_variable(), get_tags_cache_max_size_environment_variable())
@@ -1,3 +1,4 @@
+from base64 import b64encode
 from curses.ascii import isupper
 from os import environ, getenv
 
@@ -111,10 +112,351 @@ def get_refresh_frequency_in_seconds_environment_variable() -> int:
     return int(getenv('REFRESH_FREQUENCY_IN_SECONDS'))
 
 
-def get_internet_available_environment_variable() -> bool:
-    """ Get the environment variable for the internet available.
+def get_internet_available_environment_variable() -> str:
+    """ Get the environment variable for the internet available, which can be set to false to disable email and Telegram logging in clusters without internet access.
     
     Returns:
-        bool: The environment variable value for the internet available.
+        str: The environment variable value for the internet available, true or false. Defaults to true.
     """    
-    return bool(getenv('INTERNET_AVAILABLE'))
+    return getenv('INTERNET_AVAILABLE', 'true').lower()
+
+
+def get_tags_cache_ttl_in_seconds_environment_variable() -> int:
+    """ Get the environment variable for the time to live in seconds of the tags cache shared by all the VersioningHandlers.
+    A value of 0 disables the cache.
+
+    Returns:
+        int: The environment variable value for the tags cache time to live in seconds. Defaults to 300.
+    """
+    return int(getenv('TAGS_CACHE_TTL_IN_SECONDS', '300'))
+
+
+def get_tags_cache_max_size_environment_variable() -> int:
+    """ Get the environment variable for the maximum number of entries of the tags cache shared by all the VersioningHandlers.
+
+    Returns:
+        int: The environment variable value for the tags cache maximum size. Defaults to 512.
+    """
+    return int(getenv('TAGS_CACHE_MAX_SIZE', '512'))
+
+
+def get_dockerhub_pagination_workers_environment_variable() -> int:
+    """ Get the environment variable for the maximum number of DockerHub tags pages fetched concurrently for a single image.
+
+    Returns:
+        int: The environment variable value for the DockerHub pagination workers. Defaults to 4.
+    """
+    return int(getenv('DOCKERHUB_PAGINATION_WORKERS', '4'))
+
+
+def get_apiserver_url_environment_variable() -> str:
+    """ Get the environment variable for the apiserver url, used to patch the deployments.
+    
+    Returns:
+        str: The environment variable value for the apiserver url, of the form https://[host]:[port]. Defaults to None, meaning that it is discovered.
+    """
+    return getenv('APISERVER_URL')
+
+
+def get_versions_cache_max_size_environment_variable() -> int:
+    """ Get the environment variable for the maximum number of tags whose parsed version is kept in memory.
+
+    Returns:
+        int: The environment variable value for the versions cache maximum size. Defaults to 16384.
+    """
+    return int(getenv('VERSIONS_CACHE_MAX_SIZE', '16384'))
+
+
+def get_log_registry_flush_interval_in_seconds_environment_variable() -> int:
+    """ Get the environment variable for the seconds between writes of the logs registry, used to not post the same log repeatedly, to disk.
+
+    Returns:
+        int: The environment variable value for the logs registry flush interval in seconds. Defaults to 10.
+    """
+    return int(getenv('LOG_REGISTRY_FLUSH_INTERVAL_IN_SECONDS', '10'))
+
+
+def get_log_registry_backend_environment_variable() -> str:
+    """ Get the environment variable for the store of the logs registry, json (one json file per VersioningHandler) or sqlite.
+
+    Returns:
+        str: The environment variable value for the logs registry backend. Defaults to json.
+    """
+    return getenv('LOG_REGISTRY_BACKEND', 'json').lower()
+
+
+def get_log_registry_sqlite_path_environment_variable() -> str:
+    """ Get the environment variable for the path of the SQLite database of the logs registry, when LOG_REGISTRY_BACKEND is sqlite.
+
+    Returns:
+        str: The environment variable value for the logs registry SQLite path. Defaults to logs_registry.sqlite3.
+    """
+    return getenv('LOG_REGISTRY_SQLITE_PATH', 'logs_registry.sqlite3')
+
+
+def get_log_registry_cache_max_size_environment_variable() -> int:
+    """ Get the environment variable for the maximum number of entries of the logs registry kept in memory, besides the ones not written to the store yet.
+
+    Returns:
+        int: The environment variable value for the logs registry cache maximum size. Defaults to 4096.
+    """
+    return int(getenv('LOG_REGISTRY_CACHE_MAX_SIZE', '4096'))
+
+
+def get_notifications_queue_max_size_environment_variable() -> int:
+    """ Get the environment variable for the maximum number of email and Telegram notifications waiting to be sent.
+
+    Returns:
+        int: The environment variable value for the notifications queue maximum size. Defaults to 1000.
+    """
+    return int(getenv('NOTIFICATIONS_QUEUE_MAX_SIZE', '1000'))
+
+
+def get_notifications_workers_environment_variable() -> int:
+    """ Get the environment variable for the number of threads that send the email and Telegram notifications.
+
+    Returns:
+        int: The environment variable value for the notifications workers. Defaults to 2.
+    """
+    return int(getenv('NOTIFICATIONS_WORKERS', '2'))
+
+
+def get_notifications_digest_environment_variable() -> str:
+    """ Get the environment variable for sending the updates decisions as one grouped email and Telegram message per time window, instead of one per image.
+
+    Returns:
+        str: The environment variable value for the notifications digest, true or false. Defaults to false.
+    """
+    return getenv('NOTIFICATIONS_DIGEST', 'false').lower()
+
+
+def get_notifications_digest_window_in_seconds_environment_variable() -> int:
+    """ Get the environment variable for the seconds during which the updates decisions are grouped, when NOTIFICATIONS_DIGEST is true.
+
+    Returns:
+        int: The environment variable value for the notifications digest window in seconds. Defaults to REFRESH_FREQUENCY_IN_SECONDS, or 60 if not set.
+    """
+    return int(getenv('NOTIFICATIONS_DIGEST_WINDOW_IN_SECONDS', getenv('REFRESH_FREQUENCY_IN_SECONDS', '60')))
+
+
+def get_reachability_check_interval_in_seconds_environment_variable() -> int:
+    """ Get the environment variable for the seconds between probes of the container registries endpoints.
+
+    Returns:
+        int: The environment variable value for the reachability check interval in seconds. Defaults to 30.
+    """
+    return int(getenv('REACHABILITY_CHECK_INTERVAL_IN_SECONDS', '30'))
+
+
+def get_reachability_ttl_in_seconds_environment_variable() -> int:
+    """ Get the environment variable for the seconds during which the result of a probe of a container registry endpoint is used.
+
+    Returns:
+        int: The environment variable value for the reachability time to live in seconds. Defaults to 90.
+    """
+    return int(getenv('REACHABILITY_TTL_IN_SECONDS', '90'))
+
+
+def get_reachability_timeout_in_seconds_environment_variable() -> float:
+    """ Get the environment variable for the seconds to wait for the response of a probe of a container registry endpoint.
+
+    Returns:
+        float: The environment variable value for the reachability timeout in seconds. Defaults to 2.
+    """
+    return float(getenv('REACHABILITY_TIMEOUT_IN_SECONDS', '2'))
+
+
+def get_reachability_extra_endpoints_environment_variable() -> dict:
+    """ Get the environment variable for the extra endpoints to probe, such as a local registry mirror, in the format name=url,name=url.
+    An url without name is named after itself.
+
+    Returns:
+        dict: The environment variable value for the reachability extra endpoints, of the form {name: url}. Defaults to {}.
+    """
+    endpoints = {}
+    for endpoint in getenv('REACHABILITY_EXTRA_ENDPOINTS', '').split(','):
+        name, _, url = endpoint.strip().rpartition('=')
+        if url != '':
+            endpoints[name if name != '' else url] = url
+    return endpoints
+
+
+def get_dockerhub_search_namespaces_environment_variable() -> str:
+    """ Get the environment variable for looking up the namespace of the DockerHub images written without namespace with the search API, instead of using library.
+
+    Returns:
+        str: The environment variable value for the DockerHub search namespaces, true or false. Defaults to false.
+    """
+    return getenv('DOCKERHUB_SEARCH_NAMESPACES', 'false').lower()
+
+
+def get_dockerhub_namespaces_cache_path_environment_variable() -> str:
+    """ Get the environment variable for the path of the json file where the namespaces found with the DockerHub search API are kept.
+
+    Returns:
+        str: The environment variable value for the DockerHub namespaces cache path. Defaults to dockerhub_namespaces.json.
+    """
+    return getenv('DOCKERHUB_NAMESPACES_CACHE_PATH', 'dockerhub_namespaces.json')
+
+
+def get_dockerhub_namespaces_cache_ttl_in_seconds_environment_variable() -> int:
+    """ Get the environment variable for the seconds a namespace found with the DockerHub search API is valid for.
+
+    Returns:
+        int: The environment variable value for the DockerHub namespaces cache time to live in seconds. Defaults to 2592000 (30 days).
+    """
+    return int(getenv('DOCKERHUB_NAMESPACES_CACHE_TTL_IN_SECONDS', '2592000'))
+
+
+def get_dockerhub_full_scan_interval_in_seconds_environment_variable() -> int:
+    """ Get the environment variable for the seconds between full traversals of the DockerHub tags of an image.
+    In between, only the tags pushed since the last traversal are read.
+
+    Returns:
+        int: The environment variable value for the DockerHub full scan interval in seconds. Defaults to 86400.
+    """
+    return int(getenv('DOCKERHUB_FULL_SCAN_INTERVAL_IN_SECONDS', '86400'))
+
+
+def get_dockerhub_incremental_page_size_environment_variable() -> int:
+    """ Get the environment variable for the page size used to read the DockerHub tags pushed since the last traversal of an image.
+
+    Returns:
+        int: The environment variable value for the DockerHub incremental page size. Defaults to 10.
+    """
+    return int(getenv('DOCKERHUB_INCREMENTAL_PAGE_SIZE', '10'))
+
+
+def get_registry_http_timeout_in_seconds_environment_variable() -> float:
+    """ Get the environment variable for the seconds to wait for the responses of the container registries APIs.
+
+    Returns:
+        float: The environment variable value for the registry HTTP timeout in seconds. Defaults to 10.
+    """
+    return float(getenv('REGISTRY_HTTP_TIMEOUT_IN_SECONDS', '10'))
+
+
+def get_registry_http_pool_maxsize_environment_variable() -> int:
+    """ Get the environment variable for the maximum number of keep-alive connections kept open to each container registry host.
+
+    Returns:
+        int: The environment variable value for the registry HTTP pool maximum size. Defaults to 10.
+    """
+    return int(getenv('REGISTRY_HTTP_POOL_MAXSIZE', '10'))
+
+
+def get_registry_http_validators_cache_max_size_environment_variable() -> int:
+    """ Get the environment variable for the maximum number of responses of the container registries APIs kept to be served again when they answer 304 Not Modified.
+    A value of 0 disables the conditional requests.
+
+    Returns:
+        int: The environment variable value for the registry HTTP validators cache maximum size. Defaults to 2048.
+    """
+    return int(getenv('REGISTRY_HTTP_VALIDATORS_CACHE_MAX_SIZE', '2048'))
+
+
+def get_oci_insecure_registries_environment_variable() -> set:
+    """ Get the environment variable for the OCI registries served over plain http, such as a local registry:2, in the format host,host.
+
+    Returns:
+        set: The environment variable value for the OCI insecure registries, as hosts with port if any. Defaults to an empty set.
+    """
+    return {host.strip() for host in getenv('OCI_INSECURE_REGISTRIES', '').split(',') if host.strip() != ''}
+
+
+def get_oci_registry_credentials_environment_variable() -> dict:
+    """ Get the environment variable for the credentials used to obtain the tokens of the OCI registries that require them, in the format host=user:password,host=user:password.
+    Registries without credentials are accessed anonymously.
+
+    Returns:
+        dict: The environment variable value for the OCI registry credentials, of the form {host: base64 of user:password}. Defaults to {}.
+    """
+    credentials = {}
+    for entry in getenv('OCI_REGISTRY_CREDENTIALS', '').split(','):
+        host, _, user_password = entry.strip().partition('=')
+        if host != '' and user_password != '':
+            credentials[host] = b64encode(user_password.encode()).decode()
+    return credentials
+
+
+def get_registry_rate_limit_per_second_environment_variable() -> float:
+    """ Get the environment variable for the maximum requests per second sent to each container registry host, by all the VersioningHandlers together.
+    A value of 0 disables the rate limiting.
+
+    Returns:
+        float: The environment variable value for the registry rate limit per second. Defaults to 5.
+    """
+    return float(getenv('REGISTRY_RATE_LIMIT_PER_SECOND', '5'))
+
+
+def get_registry_rate_limit_burst_environment_variable() -> int:
+    """ Get the environment variable for the maximum requests sent at once to each container registry host, after a period without requests.
+
+    Returns:
+        int: The environment variable value for the registry rate limit burst. Defaults to 10.
+    """
+    return int(getenv('REGISTRY_RATE_LIMIT_BURST', '10'))
+
+
+def get_registry_rate_limit_max_wait_in_seconds_environment_variable() -> float:
+    """ Get the environment variable for the maximum seconds a request to a container registry waits for the rate limiter, before failing.
+
+    Returns:
+        float: The environment variable value for the registry rate limit maximum wait in seconds. Defaults to 60.
+    """
+    return float(getenv('REGISTRY_RATE_LIMIT_MAX_WAIT_IN_SECONDS', '60'))
+
+
+def get_scheduling_mode_environment_variable() -> str:
+    """ Get the environment variable for how the checks of the VersioningHandlers are scheduled: lockstep, all of them every REFRESH_FREQUENCY_IN_SECONDS,
+    or sharded, each of them once per REFRESH_FREQUENCY_IN_SECONDS at its own offset.
+
+    Returns:
+        str: The environment variable value for the scheduling mode, lockstep or sharded. Defaults to lockstep.
+    """
+    return getenv('SCHEDULING_MODE', 'lockstep').lower()
+
+
+def get_scheduling_jitter_in_seconds_environment_variable() -> float:
+    """ Get the environment variable for the maximum random delay added to each check in sharded mode.
+
+    Returns:
+        float: The environment variable value for the scheduling jitter in seconds. Defaults to 0.
+    """
+    return float(getenv('SCHEDULING_JITTER_IN_SECONDS', '0'))
+
+
+def get_adaptive_polling_environment_variable() -> str:
+    """ Get the environment variable for checking each DockerHub image with an interval learnt from the dates of its releases, instead of on every check of its VersioningHandler.
+
+    Returns:
+        str: The environment variable value for the adaptive polling, true or false. Defaults to false.
+    """
+    return getenv('ADAPTIVE_POLLING', 'false').lower()
+
+
+def get_adaptive_polling_factor_environment_variable() -> float:
+    """ Get the environment variable for the fraction of the interval between the releases of an image after which it is checked again.
+
+    Returns:
+        float: The environment variable value for the adaptive polling factor. Defaults to 0.25.
+    """
+    return float(getenv('ADAPTIVE_POLLING_FACTOR', '0.25'))
+
+
+def get_adaptive_polling_min_interval_in_seconds_environment_variable() -> float:
+    """ Get the environment variable for the minimum seconds between the checks of an image with adaptive polling.
+
+    Returns:
+        float: The environment variable value for the adaptive polling minimum interval in seconds. Defaults to REFRESH_FREQUENCY_IN_SECONDS, or 0 if not set.
+    """
+    return float(getenv('ADAPTIVE_POLLING_MIN_INTERVAL_IN_SECONDS', getenv('REFRESH_FREQUENCY_IN_SECONDS', '0')))
+
+
+def get_adaptive_polling_max_interval_in_seconds_environment_variable() -> float:
+    """ Get the environment variable for the maximum seconds between the checks of an image with adaptive polling.
+
+    Returns:
+        float: The environment variable value for the adaptive polling maximum interval in seconds. Defaults to 604800 (7 days).
+    """
+    return float(getenv('ADAPTIVE_POLLING_MAX_INTERVAL_IN_SECONDS', '604800'))
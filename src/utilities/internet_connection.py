@@ -1,30 +1,207 @@
-from urllib.error import HTTPError
-from urllib.request import urlopen
-from src.utilities.logging_messages import no_internet_connection_available_warning
-from os import environ, getenv
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from time import monotonic
+import requests
+from src.utilities.logging_messages import no_internet_connection_available_warning, registry_unreachable_warning
+from src.utilities.environment_variables import _is_gitlab_ready, _get_gitlab_environment_variables, get_reachability_check_interval_in_seconds_environment_variable, \
+    get_reachability_ttl_in_seconds_environment_variable, get_reachability_timeout_in_seconds_environment_variable, get_reachability_extra_endpoints_environment_variable
 
 
 
-def is_there_internet_connection(logs_registry_json_id:str) -> bool:
-    """ Checks if there is an internet connection.
+class ReachabilityMonitor():
+    """ Probes the container registries in a background thread, and keeps whether each one is reachable, so that the timers can skip
+    an unreachable registry without waiting for its requests to time out.
+
+    Any HTTP response, even an error one, means the endpoint is reachable. A status older than the time to live is ignored,
+    and the endpoint is then considered reachable, as it is when it has not been probed yet.
+    """
+    def __init__(self, check_interval_in_seconds:int, ttl_in_seconds:int, timeout_in_seconds:float) -> None:
+        self.check_interval_in_seconds = check_interval_in_seconds
+        self.ttl_in_seconds = ttl_in_seconds
+        self.timeout_in_seconds = timeout_in_seconds
+        self.session = requests.Session()
+        self._endpoints = {}
+        self._statuses = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def register(self, name:str, url:str) -> None:
+        """ Add an endpoint to probe, or change its url.
+
+        Args:
+            name (str): The name of the endpoint, for example dockerhub or gitlab.
+            url (str): The url to probe.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._endpoints.get(name) != url:
+                self._endpoints[name] = url
+                self._statuses.pop(name, None)
+
+    def endpoints(self) -> dict:
+        """ Get the registered endpoints.
+
+        Returns:
+            dict: The endpoints, of the form {name: url}.
+        """
+        with self._lock:
+            return dict(self._endpoints)
+
+    def is_reachable(self, name:str) -> bool:
+        """ Check if an endpoint was reachable the last time it was probed. It never blocks.
+
+        Args:
+            name (str): The name of the endpoint.
+
+        Returns:
+            bool: False if the endpoint was unreachable in a probe made within the time to live, True otherwise.
+        """
+        with self._lock:
+            status = self._statuses.get(name)
+        if status is None or monotonic() - status[1] >= self.ttl_in_seconds:
+            return True
+        return status[0]
+
+    def statuses(self) -> dict:
+        """ Get the status of the endpoints probed.
+
+        Returns:
+            dict: The statuses, of the form {name: {'url':..., 'reachable':..., 'age_in_seconds':...}}.
+        """
+        with self._lock:
+            return {name: {'url': self._endpoints.get(name), 'reachable': reachable, 'age_in_seconds': monotonic() - checked_at} \
+                for name, (reachable, checked_at) in self._statuses.items()}
+
+    def probe(self) -> None:
+        """ Probe all the endpoints at once, and save their statuses.
+
+        Returns:
+            None
+        """
+        endpoints = self.endpoints()
+        if not endpoints:
+            return
+        with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+            results = dict(zip(endpoints, executor.map(self._probe_url, endpoints.values())))
+        with self._lock:
+            for name, reachable in results.items():
+                if self._endpoints.get(name) == endpoints[name]:
+                    self._statuses[name] = (reachable, monotonic())
+
+    def start(self) -> None:
+        """ Start probing the endpoints periodically, if not started. The first probe is made right away.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = Thread(target=self._probe_periodically, name='reachability-monitor', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop probing the endpoints.
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+
+    def _probe_url(self, url:str) -> bool:
+        try:
+            self.session.head(url, timeout=self.timeout_in_seconds, allow_redirects=False)
+            return True
+        except requests.RequestException:
+            return False
+
+    def _probe_periodically(self) -> None:
+        while not self._stopped.is_set():
+            self.probe()
+            self._stopped.wait(self.check_interval_in_seconds)
+
+
+def register_registries_endpoints(monitor:ReachabilityMonitor) -> None:
+    """ Register in the monitor the endpoints of the configured container registries: DockerHub, the Gitlab base url if Gitlab is configured,
+    and the ones given in REACHABILITY_EXTRA_ENDPOINTS.
+
+    Args:
+        monitor (ReachabilityMonitor): The monitor.
+
+    Returns:
+        None
+    """
+    monitor.register('dockerhub', 'https://hub.docker.com')
+    if _is_gitlab_ready():
+        monitor.register('gitlab', _get_gitlab_environment_variables()[0])
+    for name, url in get_reachability_extra_endpoints_environment_variable().items():
+        monitor.register(name, url)
+
+
+def get_reachability_monitor() -> ReachabilityMonitor:
+    """ Obtains the reachability monitor of the operator process, registering the endpoints and starting it the first time.
+
+    Returns:
+        ReachabilityMonitor: The monitor shared by all the VersioningHandlers.
+    """
+    global _reachability_monitor
+    with _reachability_monitor_lock:
+        if _reachability_monitor is None:
+            _reachability_monitor = ReachabilityMonitor(get_reachability_check_interval_in_seconds_environment_variable(), \
+                get_reachability_ttl_in_seconds_environment_variable(), get_reachability_timeout_in_seconds_environment_variable())
+            register_registries_endpoints(_reachability_monitor)
+            _reachability_monitor.start()
+    return _reachability_monitor
+
+
+def stop_reachability_monitor() -> None:
+    """ Stops the reachability monitor of the operator process, if it was started.
+
+    Returns:
+        None
+    """
+    global _reachability_monitor
+    with _reachability_monitor_lock:
+        if _reachability_monitor is not None:
+            _reachability_monitor.stop()
+            _reachability_monitor = None
+
+
+def is_registry_reachable(registry:str, logs_registry_json_id:str, curr_img_id:str='') -> bool:
+    """ Checks if a container registry is reachable, according to the last probe of the reachability monitor, logging a warning if not.
 
     Args:
+        registry (str): The name of the registry endpoint, for example dockerhub or gitlab.
         logs_registry_json_id (str): The ID of the logs registry JSON file.
+        curr_img_id (str, optional): The id of the current image. Defaults to ''.
 
     Returns:
-        bool: True if there is an internet connection, False otherwise.
-    """    
-    if 'INTERNET_AVAILABLE' in environ and getenv('INTERNET_AVAILABLE') == 'true':
+        bool: True if the registry is reachable, or has not been probed yet, False otherwise.
+    """
+    monitor = get_reachability_monitor()
+    if monitor.is_reachable(registry):
         return True
+    if registry == 'dockerhub':
+        no_internet_connection_available_warning(logs_registry_json_id, curr_img_id)
     else:
-        try:
-            urlopen('https://www.google.com', timeout=1)
-            environ['INTERNET_AVAILABLE'] = 'true'
-            return True
-        except HTTPError:
-            no_internet_connection_available_warning(logs_registry_json_id, '')
-            environ['INTERNET_AVAILABLE'] = 'false'
-            return False
-        except:
-            environ['INTERNET_AVAILABLE'] = 'true'
-            return True
+        registry_unreachable_warning(registry, monitor.endpoints().get(registry), logs_registry_json_id, curr_img_id)
+    return False
+
+
+def is_there_internet_connection(logs_registry_json_id:str) -> bool:
+    """ Checks if there is an internet connection, that is, if DockerHub is reachable.
+
+    Args:
+        logs_registry_json_id (str): The ID of the logs registry JSON file.
+
+    Returns:
+        bool: True if there is an internet connection, False otherwise.
+    """
+    return is_registry_reachable('dockerhub', logs_registry_json_id)
+
+
+_reachability_monitor = None
+_reachability_monitor_lock = Lock()
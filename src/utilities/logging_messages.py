@@ -2,7 +2,8 @@ from packaging.version import Version
 from string import Template
 from os import getenv
 from src.utilities.environment_variables import get_latest_preference_environment_variable
-from src.utilities.logging_system import log
+from src.utilities.logging_system import log, stdout_logging
+from src.utilities.rate_limiter import pending_decisions
 
 
 ######### src/utilities/updater.py #########
@@ -55,8 +56,10 @@ def updates_logs(img_name:str, deployment_name:str, deployment_namespace:str, cu
     
     msg = msg_template.substitute(msg_action=msg_action)
     subject = subject_template.substitute(subj_action=subj_action)
+    # The image is left behind the latest version, for the user to update it: its requests go first when the registry is rate limited.
+    pending_decisions.record(curr_img_id, log_id in ('no_update', 'update_to_latest_updatable_version', 'no_update_with_latest_preference'))
 
-    log(logs_registry_json_id, curr_img_id, log_id, subject, msg, 'info', use_tls)
+    log(logs_registry_json_id, curr_img_id, log_id, subject, msg, 'info', use_tls, digest=True)
 
 
 ########## src/kube/main_operator.py ##########
@@ -220,6 +223,25 @@ def get_bearer_token_failed(name:str, namespace:str, error_message:str, logs_reg
     log(logs_registry_json_id, curr_img_id, 'get_bearer_token_failed', subject, message, 'error')
 
 
+########## src/kube/deployments_informer.py ##########
+
+def deployments_watch_failed(error_message:str) -> None:
+    """ Logs an error that listing or watching the deployments failed.
+    It is not related to any VersioningHandler, so it is only logged through the standard output.
+
+    Args:
+        error_message (str): The error message.
+
+    Returns:
+        None
+    """
+    subject = 'Deployments watch failed'
+    message = f'Listing or watching the deployments of the cluster failed, it will be retried. \n \
+        The error message is: \n \
+        {error_message} \n'
+    stdout_logging(subject, message, level='error')
+
+
 ########## src/utilities/internet_connection.py ##########
 
 def no_internet_connection_available_warning(logs_registry_json_id:str, curr_img_id:str) -> None:
@@ -233,14 +255,31 @@ def no_internet_connection_available_warning(logs_registry_json_id:str, curr_img
         None
     """    
     subject = f'No internet connection.'
-    message = f'No internet connection available. This means that the following services won\'t be available: \n \
+    message = f'No internet connection available, as DockerHub could not be reached. This means that the following services won\'t be available: \n \
         - DockerHub images updates \n \
-        - Email logging \
-        - Telegram logging \n \
-        Check your DNS, proxy settings and firewall rules.'
+        Check your DNS, proxy settings and firewall rules. \n \
+        If the cluster has no internet access, set INTERNET_AVAILABLE to false to disable email and Telegram logging as well.'
     log(logs_registry_json_id, curr_img_id, 'no_internet_connection_available_warning', subject, message, 'warning')
 
 
+def registry_unreachable_warning(registry:str, url:str, logs_registry_json_id:str, curr_img_id:str) -> None:
+    """ Logs a warning that a container registry could not be reached.
+
+    Args:
+        registry (str): The name of the registry.
+        url (str): The url probed.
+        logs_registry_json_id (str): The id of the logs registry json.
+        curr_img_id (str): The id of the current image.
+
+    Returns:
+        None
+    """
+    subject = f'Container registry {registry} unreachable.'
+    message = f'The container registry {registry} could not be reached at {url}, so its images will not be checked for updates until it is reachable again. \n \
+        Check your DNS, proxy settings and firewall rules.'
+    log(logs_registry_json_id, curr_img_id, f'{registry}_unreachable_warning', subject, message, 'warning')
+
+
 ########## src/utilities/gitlab/api.py ##########
 
 def gitlab_credentials_not_found(logs_registry_json_id:str, curr_img_id:str) -> None:
@@ -379,3 +418,43 @@ def docker_image_not_found(img_name:str, logs_registry_json_id:str, curr_img_id:
     subject = f'DockerHub image {img_name} not found.'
     message = f'While searching for the Docker image\'s {img_name} namespace at DockerHub, it was not found.'
     log(logs_registry_json_id, curr_img_id, 'docker_image_not_found', subject, message, 'error')
+
+
+########## src/oci/api.py ##########
+
+def oci_request_failed(host:str, img_name:str, endpoint:str, error_message:str, logs_registry_json_id:str, curr_img_id:str) -> None:
+    """ Logs an error that a request to the OCI Distribution API of a registry failed.
+
+    Args:
+        host (str): The host of the registry.
+        img_name (str): The name of the image.
+        endpoint (str): The endpoint requested, relative to /v2/<name>/, for example tags/list.
+        error_message (str): The error message.
+        logs_registry_json_id (str): The id of the logs registry json.
+        curr_img_id (str): The id of the current image.
+    
+    Returns:
+        None
+    """
+    subject = f'OCI registry request for image {img_name} failed.'
+    message = f'The request to {host}/v2/{img_name}/{endpoint} failed: \n {error_message}'
+    log(logs_registry_json_id, curr_img_id, 'oci_request_failed', subject, message, 'error')
+
+
+def oci_image_reference_invalid(img_reference:str, error_message:str, logs_registry_json_id:str, curr_img_id:str) -> None:
+    """ Logs an error that the image of a deployment handled with the oci container registry has no registry host.
+
+    Args:
+        img_reference (str): The image reference.
+        error_message (str): The error message.
+        logs_registry_json_id (str): The id of the logs registry json.
+        curr_img_id (str): The id of the current image.
+    
+    Returns:
+        None
+    """
+    subject = f'Invalid OCI image reference {img_reference}.'
+    message = f'{error_message} \n \
+        Images of the oci container registry must be of the form [host]/[name]:[tag], where the host contains a . or a :, or is localhost, \n \
+        for example registry.local:5000/team/app:1.2 \n'
+    log(logs_registry_json_id, curr_img_id, 'oci_image_reference_invalid', subject, message, 'error')
@@ -1,19 +1,17 @@
-from os import mkdir
-from os.path import exists
-from json import load, dumps
 from email.message import EmailMessage
-from traceback import format_exc
-from smtplib import SMTP, SMTP_SSL
-import requests
-from logging import Handler, Formatter
+from html import escape
+from string import Template
 import datetime
 import logging
 from os import getenv
-from src.utilities.environment_variables import _is_email_logging_ready, _is_telegram_logging_ready, _get_email_environment_variables, _get_telegram_environment_variables, get_internet_available_environment_variable
+from src.utilities.logs_registry import log_registry
+from src.utilities.notifications import notifications_dispatcher, notifications_digest, smtp_session, telegram_sender, TelegramSender
+from src.utilities.environment_variables import _is_email_logging_ready, _is_telegram_logging_ready, _get_email_environment_variables, _get_telegram_environment_variables, get_internet_available_environment_variable, \
+    get_notifications_digest_environment_variable
 
 
 
-def log(logs_registry_json_id:str, curr_img_id:str, log_id:str, subject:str, message:str, level:str, use_tls:bool=False) -> None:
+def log(logs_registry_json_id:str, curr_img_id:str, log_id:str, subject:str, message:str, level:str, use_tls:bool=False, digest:bool=False) -> None:
     """ Main logging function, responsible of redirecting message and subject to the different available logging systems.
 
     Args:
@@ -25,15 +23,15 @@ def log(logs_registry_json_id:str, curr_img_id:str, log_id:str, subject:str, mes
         level (str): The level of the message, important for the standard output logging.
         logs_registry_json_id (str): The id of the json file where the logs registry is stored.
         use_tls (bool, optional): If using TLS for securing emails. Defaults to False.
+        digest (bool, optional): If the message can be grouped with others in a digest, when NOTIFICATIONS_DIGEST is true. Defaults to False.
     
     Returns:
         None
     """    
-    if _is_log_not_repeated(logs_registry_json_id, log_id, curr_img_id):
-        _update_last_log_registry(logs_registry_json_id, curr_img_id, log_id)
+    if log_registry.check_and_set(logs_registry_json_id, curr_img_id, log_id):
         stdout_logging(subject, message, level=level)
-        email_logging(curr_img_id, logs_registry_json_id, subject, message, use_tls=use_tls)
-        telegram_logging(curr_img_id, logs_registry_json_id, subject, message)
+        email_logging(curr_img_id, logs_registry_json_id, subject, message, use_tls=use_tls, digest=digest)
+        telegram_logging(curr_img_id, logs_registry_json_id, subject, message, digest=digest)
 
 
 def _is_log_not_repeated(logs_registry_json_id:str, log_id:str, curr_img_id:str) -> bool:
@@ -47,64 +45,31 @@ def _is_log_not_repeated(logs_registry_json_id:str, log_id:str, curr_img_id:str)
     Returns:
         bool: True if the log has not been posted, False otherwise.
     """    
-    _create_log_registry_file_if_needed(logs_registry_json_id)
-    last_log_registry = _read_last_log_registry(logs_registry_json_id)
-    if curr_img_id not in last_log_registry:
+    last_log = _read_last_log_registry(logs_registry_json_id, curr_img_id)
+    if last_log is None:
         _update_last_log_registry(logs_registry_json_id, curr_img_id, log_id)
         return True
     else:
-        return True if log_id != last_log_registry[curr_img_id] else False
-
-
-def _create_log_registry_file_if_needed(logs_registry_id:str) -> None:
-    """ Create the log registry file if it does not exist.
-    This registry is stored in a hidden json under a created json folder.
-    
-    Args:
-        logs_registry_id (str): The id of the logs registry json file for the current operator.
-    
-    Returns:
-        None
-    """    
-    if not exists('json'):
-        mkdir('json')
-    if not exists(f'json/{logs_registry_id}.json'):
-        with open(f'json/{logs_registry_id}.json', 'w') as f:
-            f.write(dumps({}))
+        return True if log_id != last_log else False
 
 
-def _read_last_log_registry(logs_registry_id:str) -> dict:
-    """ Get the last log registry.
-    This registry is stored in a hidden json under a created json folder.
-    
-    Args:
-        logs_registry_id (str): The id of the logs registry json file for the current operator.
-    
-    Returns:
-        dict: The last log registry.
-    """    
-    with open(f'json/{logs_registry_id}.json', 'r') as f:
-        return load(f)
-
-
-def _overwrite_last_log_registry(logs_registry_id:str, last_log_registry:dict) -> None:
-    """ Set the last log registry.
-    This registry is stored in a hidden json under a created json folder.
+def _read_last_log_registry(logs_registry_id:str, curr_img_id:str) -> str:
+    """ Get the last log posted for an image.
+    It is read from memory, or from the store the first time, see LogRegistry.
     
     Args:
         logs_registry_id (str): The id of the logs registry json file for the current operator.
+        curr_img_id (str): The current image id.
     
     Returns:
-        None
+        str: The id of the last log, or None if no log has been posted for the image.
     """    
-    #Overwrite last_log_registry in json file
-    with open(f'json/{logs_registry_id}.json', 'w') as f:
-        f.write(dumps(last_log_registry))
+    return log_registry.get(logs_registry_id, curr_img_id)
 
 
 def _update_last_log_registry(logs_registry_id:str, curr_img_id:str, last_log:str) -> None:
     """ Update the last log registry.
-    This registry is stored in a hidden json under a created json folder.
+    It is updated in memory, and written to the store in the next flush, see LogRegistry.
 
     Args:
         logs_registry_id (str): The id of the logs registry json file for the current operator.
@@ -114,13 +79,13 @@ def _update_last_log_registry(logs_registry_id:str, curr_img_id:str, last_log:st
     Returns:
         None
     """    
-    last_log_registry = _read_last_log_registry(logs_registry_id)
-    last_log_registry[curr_img_id] = last_log
-    _overwrite_last_log_registry(logs_registry_id, last_log_registry)
+    log_registry.set(logs_registry_id, curr_img_id, last_log)
 
 
-def email_logging(curr_img_id:str, logs_registry_json_id:str, subject:str, message:str, use_tls:bool=False) -> None:
+def email_logging(curr_img_id:str, logs_registry_json_id:str, subject:str, message:str, use_tls:bool=False, digest:bool=False) -> None:
     """ Log through email.
+    The email is enqueued, and sent in the background through the SMTP session shared by all the VersioningHandlers, see NotificationsDispatcher.
+    If digest is True and NOTIFICATIONS_DIGEST is true, it is grouped with the rest of emails of the window instead, see NotificationsDigest.
 
     Args:
         curr_img_id (str): The id of the current image.
@@ -128,70 +93,169 @@ def email_logging(curr_img_id:str, logs_registry_json_id:str, subject:str, messa
         subject (str): Subject of the email. Should be short and concise.
         message (str): Body of the email.
         use_tls (bool, optional): Defines if TLS handshake is required or not. Defaults to False.
+        digest (bool, optional): If the email can be grouped with others in a digest. Defaults to False.
     
     Returns:
         None
     """    
     if get_internet_available_environment_variable() == 'true' and _is_email_logging_ready():
-        try:
-            sender, recipient, password, host, port = _get_email_environment_variables()
-
-            # Create your SMTP session 
-            if password == '':
-                smtp_server = SMTP(host, port) 
-            else:
-                smtp_server = SMTP_SSL(host, port)
-            if use_tls:
-                # Use TLS to add security 
-                smtp_server.starttls() 
-            # Defining The Message 
-            email_obj = EmailMessage()
-            email_obj.set_content(message)
-            email_obj['Subject'] = subject
-            email_obj['From'] = sender
-            email_obj['To'] = recipient
-
-            # Sending the Email
-            smtp_server.login(sender, password)
-            smtp_server.send_message(email_obj)
-            # Terminating the session 
-            smtp_server.quit()
-        except Exception:
-            subject = 'Email logging failed'
-            message = f'{format_exc()} \n \
-                Review your email environment variables of the deployment, which currently have the following values: \n \
-                    EMAIL_HOST: {getenv("EMAIL_HOST")} \n \
-                    EMAIL_SENDER: {getenv("EMAIL_SENDER")} \n \
-                    EMAIL_RECIPIENT: {getenv("EMAIL_RECIPIENT")} \n \
-                    EMAIL_PORT: {getenv("EMAIL_PORT")} \n \
-                    Check also your EMAIL_PASSWORD value. \n'
-            if _is_log_not_repeated(logs_registry_json_id, 'email_logging_failed', curr_img_id):
-                stdout_logging(subject, message, level='error')
-
-
-def telegram_logging(curr_img_id:str, logs_registry_json_id:str, subject:str, message:str) -> None:
+        on_failure = lambda traceback: _email_logging_failed(curr_img_id, logs_registry_json_id, traceback)
+        on_queue_full = lambda: _notifications_queue_full(curr_img_id, logs_registry_json_id, 'email_notifications_queue_full')
+        if digest and get_notifications_digest_environment_variable() == 'true':
+            notifications_digest.add('email', subject, message, lambda subject, message: _send_email(subject, message, use_tls), on_failure, on_queue_full)
+        elif not notifications_dispatcher.submit('email', lambda: _send_email(subject, message, use_tls), on_failure):
+            on_queue_full()
+
+
+def _send_email(subject:str, message:str, use_tls:bool=False) -> None:
+    """ Send an email through the shared SMTP session.
+
+    Args:
+        subject (str): Subject of the email.
+        message (str): Body of the email.
+        use_tls (bool, optional): Defines if TLS handshake is required or not. Defaults to False.
+
+    Returns:
+        None
+    """
+    sender, recipient, password, host, port = _get_email_environment_variables()
+    # Defining The Message 
+    email_obj = EmailMessage()
+    email_obj.set_content(message)
+    email_obj['Subject'] = subject
+    email_obj['From'] = sender
+    email_obj['To'] = recipient
+    # Sending the Email
+    smtp_session.send(email_obj, host, port, sender, password, use_tls=use_tls)
+
+
+def _email_logging_failed(curr_img_id:str, logs_registry_json_id:str, traceback:str) -> None:
+    """ Log through stdout that an email could not be sent.
+
+    Args:
+        curr_img_id (str): The id of the current image.
+        logs_registry_json_id (str): The id of the json file where the logs registry is stored.
+        traceback (str): The traceback of the error.
+
+    Returns:
+        None
+    """
+    subject = 'Email logging failed'
+    message = f'{traceback} \n \
+        Review your email environment variables of the deployment, which currently have the following values: \n \
+            EMAIL_HOST: {getenv("EMAIL_HOST")} \n \
+            EMAIL_SENDER: {getenv("EMAIL_SENDER")} \n \
+            EMAIL_RECIPIENT: {getenv("EMAIL_RECIPIENT")} \n \
+            EMAIL_PORT: {getenv("EMAIL_PORT")} \n \
+            Check also your EMAIL_PASSWORD value. \n'
+    if _is_log_not_repeated(logs_registry_json_id, 'email_logging_failed', curr_img_id):
+        stdout_logging(subject, message, level='error')
+
+
+def _telegram_logging_failed(curr_img_id:str, logs_registry_json_id:str, traceback:str) -> None:
+    """ Log through stdout that a Telegram message could not be sent.
+
+    Args:
+        curr_img_id (str): The id of the current image.
+        logs_registry_json_id (str): The id of the json file where the logs registry is stored.
+        traceback (str): The traceback of the error.
+
+    Returns:
+        None
+    """
+    subject = 'Telegram logging failed'
+    message = f'{traceback} \n \
+        Review your telegram environment variables of the deployment, which currently have the following values: \n \
+            TELEGRAM_CHAT_ID: {getenv("TELEGRAM_CHAT_ID")} \n \
+            Check also your TELEGRAM_TOKEN value. \n'
+    if _is_log_not_repeated(logs_registry_json_id, 'telegram_logging_failed', curr_img_id):
+        stdout_logging(subject, message, level='error')
+
+
+def _notifications_queue_full(curr_img_id:str, logs_registry_json_id:str, log_id:str) -> None:
+    """ Log through stdout that a notification was discarded because too many are waiting to be sent.
+
+    Args:
+        curr_img_id (str): The id of the current image.
+        logs_registry_json_id (str): The id of the json file where the logs registry is stored.
+        log_id (str): The id of the log, one per channel.
+
+    Returns:
+        None
+    """
+    subject = 'Notifications queue full'
+    message = f'The notification for {curr_img_id} was discarded, as {notifications_dispatcher.stats()["queue_depth"]} notifications are waiting to be sent. \n \
+        Increase NOTIFICATIONS_QUEUE_MAX_SIZE or NOTIFICATIONS_WORKERS if this happens frequently. \n'
+    if _is_log_not_repeated(logs_registry_json_id, log_id, curr_img_id):
+        stdout_logging(subject, message, level='error')
+
+
+def telegram_logging(curr_img_id:str, logs_registry_json_id:str, subject:str, message:str, digest:bool=False) -> None:
     """ Log through Telegram.
+    The message is enqueued, and sent in the background, see NotificationsDispatcher.
+    If digest is True and NOTIFICATIONS_DIGEST is true, it is grouped with the rest of messages of the window instead, see NotificationsDigest.
+
     Args:
         curr_img_id (str): The id of the current image.
         logs_registry_json_id (str): The id of the json file where the logs registry is stored.
         subject (str): The subject of the message.
         message (str): The message to be posted.
+        digest (bool, optional): If the message can be grouped with others in a digest. Defaults to False.
     
     Returns:
         None
     """
     if get_internet_available_environment_variable() == 'true' and _is_telegram_logging_ready():
-        try:
-            token, chat_id = _get_telegram_environment_variables()
-            TelegramLog(token, chat_id).send(subject, message)
-        except Exception:
-            subject ='Telegram logging failed' 
-            message = f'{format_exc()} \n \
-                Review your telegram environment variables of the deployment, which currently have the following values: \n \
-                    TELEGRAM_CHAT_ID: {getenv("TELEGRAM_CHAT_ID")} \n \
-                    Check also your TELEGRAM_TOKEN value. \n'
-            if _is_log_not_repeated(logs_registry_json_id, 'email_logging_failed', curr_img_id):
-                stdout_logging(subject, message, level='error')
+        on_failure = lambda traceback: _telegram_logging_failed(curr_img_id, logs_registry_json_id, traceback)
+        on_queue_full = lambda: _notifications_queue_full(curr_img_id, logs_registry_json_id, 'telegram_notifications_queue_full')
+        if digest and get_notifications_digest_environment_variable() == 'true':
+            notifications_digest.add('telegram', subject, message, _send_telegram_message, on_failure, on_queue_full)
+        elif not notifications_dispatcher.submit('telegram', lambda: _send_telegram_message(subject, message), on_failure):
+            on_queue_full()
+
+
+def _send_telegram_message(subject:str, message:str) -> None:
+    """ Send a message to the Telegram chat, together with the rest of messages waiting to be sent, see TelegramSender.
+
+    Args:
+        subject (str): The subject of the message.
+        message (str): The message to be posted.
+
+    Returns:
+        None
+    """
+    token, chat_id = _get_telegram_environment_variables()
+    for text in _format_telegram_messages(f'{subject}\n{message}', TelegramSender.max_message_length):
+        telegram_sender.enqueue(token, chat_id, text)
+    telegram_sender.flush(token, chat_id)
+
+
+def _format_telegram_messages(message:str, max_length:int) -> list:
+    """ Format a message as HTML for Telegram, with the current date, splitting it by lines into several messages if longer than max_length.
+
+    Args:
+        message (str): The message to be posted.
+        max_length (int): The maximum length of each formatted message.
+
+    Returns:
+        list: The formatted messages.
+    """
+    template = Template(f'<i>{datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}</i><pre>\n$message</pre>')
+    available_length = max_length - len(template.substitute(message=''))
+    parts = ['']
+    for line in escape(message, quote=False).split('\n'):
+        while len(line) > available_length:
+            # Cut too long lines, without leaving a truncated HTML entity.
+            cut = line.rfind('&', 0, available_length)
+            if cut <= 0 or cut < line.rfind(';', 0, available_length):
+                cut = available_length
+            parts.append(line[:cut])
+            line = line[cut:]
+        if parts[-1] and len(parts[-1]) + 1 + len(line) > available_length:
+            parts.append(line)
+        else:
+            parts[-1] = f'{parts[-1]}\n{line}' if parts[-1] else line
+    return [template.substitute(message=part) for part in parts if part]
 
 
 def stdout_logging(subject:str, msg:str, level:str='info') -> None:
@@ -214,60 +278,3 @@ def stdout_logging(subject:str, msg:str, level:str='info') -> None:
         logging.error(f'{subject}: \n {msg} \n')
     else:
         logging.critical(f'{subject}: \n {msg} \n')
-
-
-# Telegram logger class
-
-class RequestsHandler(Handler):
-    def __init__(self, token:str, chat_id:str):
-        super().__init__()
-        self.token = token
-        self.chat_id = chat_id
-
-    def emit(self, record:str) -> str:
-        """ Post a message to the Telegram chat.
-        Args:
-            record (str): The message to be posted.
-        Returns:
-            str: The message posted. 
-        """        
-        log_entry = self.format(record)
-        payload = {
-        'chat_id': self.chat_id,
-        'text': log_entry,
-        'parse_mode': 'HTML'
-        }
-        return requests.post("https://api.telegram.org/bot{token}/sendMessage".format(token=self.token),
-            data=payload).content
-
-
-class LogstashFormatter(Formatter):
-    def __init__(self) -> None:
-        super(LogstashFormatter, self).__init__()
-
-    def format(self, record):
-        t = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-        return "<i>{datetime}</i><pre>\n{message}</pre>".format(message=record.msg, datetime=t)
-
-
-class TelegramLog():
-    def __init__(self, token:str, chat_id:str, logger_name:str='default') -> None:
-        self.token = token
-        self.chat_id = chat_id
-        self.logger = logging.getLogger(logger_name)
-        self.logger.setLevel(logging.ERROR)
-        self.handler = RequestsHandler(self.token, self.chat_id)
-        self.formatter = LogstashFormatter()
-        self.handler.setFormatter(self.formatter)
-        self.logger.addHandler(self.handler)
-        self.logger.setLevel(logging.WARNING)
-    
-    def send(self, message:str) -> None:
-        """ Send a message to the Telegram chat.
-        Args:
-            message (str): The message to be posted.
-        Raises:
-            ValueError: The given message is not of type str.
-        """
-        if not isinstance(message, str): raise TypeError('"message" must be of type str.')
-        self.logger.error(message)
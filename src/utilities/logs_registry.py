@@ -0,0 +1,374 @@
+from collections import OrderedDict
+from os import makedirs, listdir, fdopen, fsync, replace, remove
+from os.path import exists, join, dirname
+from json import load, dumps
+from tempfile import mkstemp
+from threading import Event, Lock, RLock, Thread
+from traceback import format_exc
+from typing import Iterable, Union
+import sqlite3
+import logging
+from src.utilities.environment_variables import get_log_registry_backend_environment_variable, get_log_registry_sqlite_path_environment_variable, \
+    get_log_registry_cache_max_size_environment_variable
+
+
+
+class JSONLogRegistryStore():
+    """ Stores the logs registry as one json file per VersioningHandler, under a json folder.
+    All files are read when loading, and each file is rewritten as a whole, atomically, when any of its entries changes.
+    """
+    def __init__(self, directory:str='json') -> None:
+        self.directory = directory
+        self._registries = {}
+        self._lock = Lock()
+
+    def preload(self) -> dict:
+        """ Read all the registries.
+
+        Returns:
+            dict: The registries, of the form {logs_registry_id: {curr_img_id: last_log_id}}.
+        """
+        with self._lock:
+            if exists(self.directory):
+                for file_name in listdir(self.directory):
+                    if file_name.endswith('.json') and not file_name.startswith('.'):
+                        with open(join(self.directory, file_name), 'r') as f:
+                            self._registries.setdefault(file_name[:-len('.json')], {}).update(load(f))
+            return {logs_registry_id: dict(registry) for logs_registry_id, registry in self._registries.items()}
+
+    def read(self, logs_registry_id:str, curr_img_id:str) -> Union[str, None]:
+        """ Read the last log posted for an image, from the registries read when preloading and the entries written since.
+
+        Args:
+            logs_registry_id (str): The id of the logs registry of the VersioningHandler.
+            curr_img_id (str): The id of the image.
+
+        Returns:
+            str: The id of the last log.
+            None: No log has been posted for the image.
+        """
+        with self._lock:
+            return self._registries.get(logs_registry_id, {}).get(curr_img_id)
+
+    def write(self, entries:Iterable) -> None:
+        """ Save entries, rewriting the files of the registries they belong to.
+
+        Args:
+            entries (Iterable): Tuples of the form (logs_registry_id, curr_img_id, last_log_id).
+
+        Returns:
+            None
+        """
+        with self._lock:
+            changed_registries = set()
+            for logs_registry_id, curr_img_id, log_id in entries:
+                self._registries.setdefault(logs_registry_id, {})[curr_img_id] = log_id
+                changed_registries.add(logs_registry_id)
+            for logs_registry_id in changed_registries:
+                write_json_atomically(join(self.directory, f'{logs_registry_id}.json'), self._registries[logs_registry_id])
+
+    def expire(self, logs_registry_ids:Iterable) -> None:
+        """ Delete the registries of VersioningHandlers that no longer exist.
+
+        Args:
+            logs_registry_ids (Iterable): The ids of the registries.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for logs_registry_id in logs_registry_ids:
+                self._registries.pop(logs_registry_id, None)
+                if exists(join(self.directory, f'{logs_registry_id}.json')):
+                    remove(join(self.directory, f'{logs_registry_id}.json'))
+
+
+class SQLiteLogRegistryStore():
+    """ Stores the logs registry in a SQLite database in WAL mode, with one row per (logs_registry_id, curr_img_id) pair, which is the primary key.
+    Entries are read and upserted one row at a time, so nothing needs to be loaded when starting.
+    """
+    def __init__(self, path:str='logs_registry.sqlite3') -> None:
+        self.path = path
+        if dirname(path) != '':
+            makedirs(dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS last_logs ( \
+                registry_id TEXT NOT NULL, \
+                image_id TEXT NOT NULL, \
+                log_id TEXT NOT NULL, \
+                PRIMARY KEY (registry_id, image_id))')
+
+    def preload(self) -> dict:
+        """ Entries are read when needed, nothing is preloaded.
+
+        Returns:
+            dict: An empty dict.
+        """
+        return {}
+
+    def read(self, logs_registry_id:str, curr_img_id:str) -> Union[str, None]:
+        """ Read the last log posted for an image.
+
+        Args:
+            logs_registry_id (str): The id of the logs registry of the VersioningHandler.
+            curr_img_id (str): The id of the image.
+
+        Returns:
+            str: The id of the last log.
+            None: No log has been posted for the image.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT log_id FROM last_logs WHERE registry_id = ? AND image_id = ?', (logs_registry_id, curr_img_id)).fetchone()
+        return row[0] if row is not None else None
+
+    def write(self, entries:Iterable) -> None:
+        """ Upsert entries, in a single transaction.
+
+        Args:
+            entries (Iterable): Tuples of the form (logs_registry_id, curr_img_id, last_log_id).
+
+        Returns:
+            None
+        """
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT INTO last_logs (registry_id, image_id, log_id) VALUES (?, ?, ?) \
+                ON CONFLICT (registry_id, image_id) DO UPDATE SET log_id = excluded.log_id', list(entries))
+
+    def expire(self, logs_registry_ids:Iterable) -> None:
+        """ Delete the entries of VersioningHandlers that no longer exist, in a single transaction.
+
+        Args:
+            logs_registry_ids (Iterable): The ids of the registries.
+
+        Returns:
+            None
+        """
+        with self._lock, self._connection:
+            self._connection.executemany('DELETE FROM last_logs WHERE registry_id = ?', [(logs_registry_id,) for logs_registry_id in logs_registry_ids])
+
+
+def write_json_atomically(path:str, content:dict) -> None:
+    """ Write a dict to a json file. It is written to a temporary file first, which then replaces the json file, so that it is never left half written.
+
+    Args:
+        path (str): The path of the json file.
+        content (dict): The content to write.
+
+    Returns:
+        None
+    """
+    directory = dirname(path) or '.'
+    makedirs(directory, exist_ok=True)
+    fd, tmp_path = mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with fdopen(fd, 'w') as f:
+            f.write(dumps(content))
+            f.flush()
+            fsync(f.fileno())
+        replace(tmp_path, path)
+    except Exception:
+        if exists(tmp_path):
+            remove(tmp_path)
+        raise
+
+
+class LogRegistry():
+    """ Registry of the last log posted for each image, for all the VersioningHandlers, used to not post the same log repeatedly.
+    It is kept in memory in front of a store, and the entries that changed are written to the store in batches,
+    periodically and when the operator exits.
+    Only the max_size most recently used entries are kept in memory, besides the ones not written yet, the others are read again from the store when needed.
+
+    The entries have the form {(logs_registry_id, curr_img_id): last_log_id}.
+    """
+    def __init__(self, store:Union[JSONLogRegistryStore, SQLiteLogRegistryStore]=None, max_size:Union[int, None]=None) -> None:
+        self.store = store
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._dirty = set()
+        self._loaded = False
+        self._lock = RLock()
+        self._flush_lock = Lock()
+        self._stopped = Event()
+        self._flusher = None
+
+    def load(self) -> None:
+        """ Create the store, if not given, and preload it, if it was not done before.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            if self.store is None:
+                self.store = create_log_registry_store()
+            for logs_registry_id, registry in self.store.preload().items():
+                for curr_img_id, log_id in registry.items():
+                    self._entries[(logs_registry_id, curr_img_id)] = log_id
+            self._evict()
+            self._loaded = True
+
+    def get(self, logs_registry_id:str, curr_img_id:str) -> Union[str, None]:
+        """ Get the last log posted for an image, reading it from the store if it is not in memory.
+
+        Args:
+            logs_registry_id (str): The id of the logs registry of the VersioningHandler.
+            curr_img_id (str): The id of the image.
+
+        Returns:
+            str: The id of the last log.
+            None: No log has been posted for the image.
+        """
+        self.load()
+        with self._lock:
+            key = (logs_registry_id, curr_img_id)
+            if key not in self._entries:
+                log_id = self.store.read(logs_registry_id, curr_img_id)
+                if log_id is None:
+                    return None
+                self._entries[key] = log_id
+                self._evict()
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, logs_registry_id:str, curr_img_id:str, log_id:str) -> None:
+        """ Save the last log posted for an image.
+
+        Args:
+            logs_registry_id (str): The id of the logs registry of the VersioningHandler.
+            curr_img_id (str): The id of the image.
+            log_id (str): The id of the log.
+
+        Returns:
+            None
+        """
+        self.load()
+        with self._lock:
+            key = (logs_registry_id, curr_img_id)
+            if self._entries.get(key) != log_id:
+                self._entries[key] = log_id
+                self._dirty.add(key)
+            self._entries.move_to_end(key)
+
+    def check_and_set(self, logs_registry_id:str, curr_img_id:str, log_id:str) -> bool:
+        """ Check if the log is not the last one posted for the image, and if so, save it as the last one, all at once,
+        so that concurrent ticks do not post the same log twice.
+
+        Args:
+            logs_registry_id (str): The id of the logs registry of the VersioningHandler.
+            curr_img_id (str): The id of the image.
+            log_id (str): The id of the log.
+
+        Returns:
+            bool: True if the log has not been posted, False otherwise.
+        """
+        with self._lock:
+            if self.get(logs_registry_id, curr_img_id) == log_id:
+                return False
+            self.set(logs_registry_id, curr_img_id, log_id)
+            return True
+
+    def expire(self, logs_registry_ids:Iterable) -> None:
+        """ Forget the registries of VersioningHandlers that no longer exist, removing them from the store as well.
+
+        Args:
+            logs_registry_ids (Iterable): The ids of the registries.
+
+        Returns:
+            None
+        """
+        self.load()
+        logs_registry_ids = set(logs_registry_ids)
+        with self._flush_lock:
+            with self._lock:
+                for key in [key for key in self._entries if key[0] in logs_registry_ids]:
+                    del self._entries[key]
+                self._dirty = {entry for entry in self._dirty if entry[0] not in logs_registry_ids}
+            self.store.expire(logs_registry_ids)
+
+    def flush(self) -> None:
+        """ Write the entries that changed since the last flush to the store.
+
+        Returns:
+            None
+        """
+        if not self._loaded:
+            return
+        with self._flush_lock:
+            with self._lock:
+                entries = [(logs_registry_id, curr_img_id, self._entries[(logs_registry_id, curr_img_id)]) for logs_registry_id, curr_img_id in self._dirty]
+                self._dirty.clear()
+            if not entries:
+                return
+            try:
+                self.store.write(entries)
+            except Exception:
+                # Retry in the next flush.
+                with self._lock:
+                    self._dirty.update((logs_registry_id, curr_img_id) for logs_registry_id, curr_img_id, _ in entries)
+                logging.error(f'Logs registry flush failed: \n {format_exc()} \n')
+                return
+            # The entries written can be evicted now.
+            with self._lock:
+                self._evict()
+
+    def start(self, flush_interval_in_seconds:int) -> None:
+        """ Load the registries and start flushing them periodically in a background thread.
+
+        Args:
+            flush_interval_in_seconds (int): Seconds between flushes.
+
+        Returns:
+            None
+        """
+        self.load()
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stopped.clear()
+            self._flusher = Thread(target=self._flush_periodically, args=(flush_interval_in_seconds,), name='logs-registry-flusher', daemon=True)
+            self._flusher.start()
+
+    def stop(self) -> None:
+        """ Stop the periodic flushes, and flush the pending changes.
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        self.flush()
+
+    def _evict(self) -> None:
+        # The least recently used entries are evicted first, except the ones not written to the store yet, which would be lost.
+        if self.max_size is None:
+            return
+        evictable = len(self._entries) - len(self._dirty) - max(0, self.max_size)
+        for key in [key for key in self._entries if key not in self._dirty][:max(0, evictable)]:
+            del self._entries[key]
+
+    def _flush_periodically(self, flush_interval_in_seconds:int) -> None:
+        while not self._stopped.wait(flush_interval_in_seconds):
+            self.flush()
+
+
+def create_log_registry_store() -> Union[JSONLogRegistryStore, SQLiteLogRegistryStore]:
+    """ Create the store of the logs registry selected with the LOG_REGISTRY_BACKEND environment variable.
+
+    Raises:
+        ValueError: If the backend is neither json nor sqlite.
+
+    Returns:
+        Union[JSONLogRegistryStore, SQLiteLogRegistryStore]: The store.
+    """
+    backend = get_log_registry_backend_environment_variable()
+    if backend == 'json':
+        return JSONLogRegistryStore()
+    elif backend == 'sqlite':
+        return SQLiteLogRegistryStore(get_log_registry_sqlite_path_environment_variable())
+    raise ValueError(f'The logs registry backend must be either json or sqlite, not {backend}')
+
+
+# Shared by all the VersioningHandlers, see LogRegistry.
+log_registry = LogRegistry(max_size=get_log_registry_cache_max_size_environment_variable())
@@ -0,0 +1,475 @@
+from collections import deque
+from email.message import EmailMessage
+from queue import Queue, Full, Empty
+from smtplib import SMTP, SMTP_SSL, SMTPException
+from threading import Event, Lock, Thread, Timer
+from time import monotonic, sleep
+from traceback import format_exc
+from typing import Callable, Iterable, Union
+import requests
+from requests.adapters import HTTPAdapter
+from src.utilities.environment_variables import get_notifications_queue_max_size_environment_variable, get_notifications_workers_environment_variable, \
+    get_notifications_digest_window_in_seconds_environment_variable
+
+
+
+class SMTPSession():
+    """ Authenticated SMTP session reused for all the emails sent by the operator, instead of connecting and logging in for each one.
+    If the connection is lost, or the email settings change, it connects again.
+    """
+    def __init__(self) -> None:
+        self._smtp = None
+        self._settings = None
+        self._lock = Lock()
+
+    def send(self, email_obj:EmailMessage, host:str, port:int, sender:str, password:str, use_tls:bool=False) -> None:
+        """ Send an email, connecting first if there is no open session.
+        If sending fails because of the connection, the session is opened again and the email is sent once more.
+
+        Args:
+            email_obj (EmailMessage): The email.
+            host (str): The SMTP server host.
+            port (int): The SMTP server port.
+            sender (str): The sender address, also used to log in.
+            password (str): The password of the sender. If empty, the connection is not made with SSL.
+            use_tls (bool, optional): Defines if TLS handshake is required or not. Defaults to False.
+
+        Returns:
+            None
+        """
+        settings = (host, port, sender, password, use_tls)
+        with self._lock:
+            if self._smtp is not None and self._settings != settings:
+                self._close()
+            try:
+                if self._smtp is None:
+                    self._connect(*settings)
+                self._smtp.send_message(email_obj)
+            except (SMTPException, OSError):
+                # The session may have been closed by the server: connect again and retry once.
+                self._close()
+                self._connect(*settings)
+                self._smtp.send_message(email_obj)
+
+    def close(self) -> None:
+        """ Terminate the session, if open.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._close()
+
+    def _connect(self, host:str, port:int, sender:str, password:str, use_tls:bool) -> None:
+        if password == '':
+            smtp_server = SMTP(host, port)
+        else:
+            smtp_server = SMTP_SSL(host, port)
+        try:
+            if use_tls:
+                smtp_server.starttls()
+            smtp_server.login(sender, password)
+        except Exception:
+            smtp_server.close()
+            raise
+        self._smtp = smtp_server
+        self._settings = (host, port, sender, password, use_tls)
+
+    def _close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+        self._smtp = None
+        self._settings = None
+
+
+class TelegramSender():
+    """ Sends the Telegram messages of the operator through a single pooled HTTP session.
+    Messages are enqueued per chat, and each flush sends all the pending ones of a chat, merged into as few messages as Telegram allows,
+    so that messages that pile up while Telegram limits the rate (HTTP 429) are sent together when the limit expires.
+    The messages that could not be sent are kept, and sent again by a later flush, see flush.
+    """
+    api_url = 'https://api.telegram.org/bot{token}/sendMessage'
+    max_message_length = 4096
+
+    def __init__(self, pool_maxsize:int=4, max_retries:int=3, retry_delay_in_seconds:float=30) -> None:
+        self.max_retries = max_retries
+        self.retry_delay_in_seconds = retry_delay_in_seconds
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=pool_maxsize))
+        self._pending = {}
+        self._pending_lock = Lock()
+        self._send_lock = Lock()
+        self._blocked_until = 0.0
+        self._failed_flushes = {}
+        self._retry_timers = {}
+
+    def enqueue(self, token:str, chat_id:str, text:str) -> None:
+        """ Add a message to the pending ones of a chat.
+
+        Args:
+            token (str): The token of the Telegram bot.
+            chat_id (str): The id of the chat.
+            text (str): The message, in HTML, of at most max_message_length characters.
+
+        Returns:
+            None
+        """
+        with self._pending_lock:
+            self._pending.setdefault((token, chat_id), deque()).append(text)
+
+    def flush(self, token:str, chat_id:str) -> None:
+        """ Send all the pending messages of a chat, merged into messages of up to max_message_length characters.
+        Flushes are made one at a time, so a flush that finds no pending messages, because a previous one already sent them, does nothing.
+
+        If a message can not be sent, it and the following ones, which may belong to other VersioningHandlers, are kept pending,
+        and sent again by a flush scheduled after retry_delay_in_seconds, up to max_retries consecutive times, before reporting the error.
+        Only a message rejected by Telegram (HTTP 4xx other than 429) is discarded, as sending it again would fail too.
+
+        Args:
+            token (str): The token of the Telegram bot.
+            chat_id (str): The id of the chat.
+
+        Raises:
+            requests.RequestException: If Telegram rejects a message, or the messages could not be sent after max_retries flushes.
+                The messages not rejected are still pending, for the next flush.
+
+        Returns:
+            None
+        """
+        with self._send_lock:
+            with self._pending_lock:
+                pending = self._pending.pop((token, chat_id), deque())
+            chunks = merge_messages(pending, self.max_message_length)
+            for i, chunk in enumerate(chunks):
+                try:
+                    self._post(token, chat_id, chunk)
+                except Exception as e:
+                    status_code = e.response.status_code if isinstance(e, requests.HTTPError) and e.response is not None else None
+                    rejected = status_code is not None and 400 <= status_code < 500 and status_code != 429
+                    with self._pending_lock:
+                        self._pending.setdefault((token, chat_id), deque()).extendleft(reversed(chunks[i + 1:] if rejected else chunks[i:]))
+                    if rejected or not self._schedule_retry(token, chat_id):
+                        raise
+                    return
+            self._failed_flushes.pop((token, chat_id), None)
+
+    def _schedule_retry(self, token:str, chat_id:str) -> bool:
+        # Called with the send lock held. Returns False once max_retries consecutive flushes have failed, starting to count again.
+        failed_flushes = self._failed_flushes.get((token, chat_id), 0) + 1
+        if failed_flushes > self.max_retries:
+            self._failed_flushes.pop((token, chat_id), None)
+            return False
+        self._failed_flushes[(token, chat_id)] = failed_flushes
+        timer = self._retry_timers.get((token, chat_id))
+        if timer is None or not timer.is_alive():
+            delay = max(self.retry_delay_in_seconds * failed_flushes, self._blocked_until - monotonic())
+            timer = self._retry_timers[(token, chat_id)] = Timer(delay, self._retry_flush, (token, chat_id))
+            timer.daemon = True
+            timer.start()
+        return True
+
+    def _retry_flush(self, token:str, chat_id:str) -> None:
+        try:
+            self.flush(token, chat_id)
+        except Exception:
+            # Imported here, as logging_system imports this module.
+            from src.utilities.logging_system import stdout_logging
+            stdout_logging('Telegram logging failed', f'{format_exc()} \n The pending messages will be sent with the next ones.', level='error')
+
+    def _post(self, token:str, chat_id:str, text:str) -> None:
+        for attempt in range(self.max_retries + 1):
+            wait = self._blocked_until - monotonic()
+            if wait > 0:
+                sleep(wait)
+            response = self.session.post(self.api_url.format(token=token), data={'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'}, timeout=30)
+            if response.status_code != 429 or attempt == self.max_retries:
+                response.raise_for_status()
+                return
+            self._blocked_until = monotonic() + _get_retry_after(response)
+
+
+def _get_retry_after(response:requests.Response) -> float:
+    """ Get the seconds to wait before sending again to Telegram, from the body of a 429 response, or from its Retry-After header.
+
+    Args:
+        response (requests.Response): The 429 response.
+
+    Returns:
+        float: The seconds to wait. Defaults to 1.
+    """
+    try:
+        return float(response.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        try:
+            return float(response.headers.get('Retry-After', 1))
+        except ValueError:
+            return 1.0
+
+
+def merge_messages(messages:Iterable, max_length:int) -> list:
+    """ Merge consecutive messages, separated by a blank line, as long as the merged message is not longer than max_length.
+
+    Args:
+        messages (Iterable): The messages, in order.
+        max_length (int): The maximum length of a merged message.
+
+    Returns:
+        list: The merged messages, in order.
+    """
+    merged = []
+    for message in messages:
+        if merged and len(merged[-1]) + 2 + len(message) <= max_length:
+            merged[-1] = f'{merged[-1]}\n\n{message}'
+        else:
+            merged.append(message)
+    return merged
+
+
+class NotificationsDispatcher():
+    """ Bounded in-process queue of notifications, drained by background workers, so that slow email or Telegram servers do not block the timers.
+    Each notification is a function that sends it, and an optional function called with the traceback if sending fails.
+    Notifications are discarded if the queue is full.
+    """
+    def __init__(self, max_size:int, workers:int) -> None:
+        self.max_size = max_size
+        self.workers = max(1, workers)
+        self._queue = Queue(maxsize=max(1, max_size))
+        self._lock = Lock()
+        self._stopped = Event()
+        self._threads = []
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._latencies = {}
+
+    def submit(self, channel:str, send:Callable[[], None], on_failure:Union[Callable[[str], None], None]=None) -> bool:
+        """ Enqueue a notification, starting the workers the first time.
+
+        Args:
+            channel (str): The channel of the notification, for example email or telegram. Used for the latency counters.
+            send (Callable[[], None]): Function that sends the notification.
+            on_failure (Union[Callable[[str], None], None], optional): Function called with the traceback if send raises. Defaults to None.
+
+        Returns:
+            bool: True if the notification was enqueued, False if it was discarded because the queue is full.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((channel, send, on_failure))
+            return True
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def start(self) -> None:
+        """ Start the workers, if they are not running.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            if self._threads:
+                return
+            self._stopped.clear()
+            for i in range(self.workers):
+                thread = Thread(target=self._work, name=f'notifications-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout_in_seconds:float=10) -> None:
+        """ Send the pending notifications, waiting up to the given time, and stop the workers.
+
+        Args:
+            timeout_in_seconds (float, optional): Maximum seconds to wait for the pending notifications. Defaults to 10.
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        deadline = monotonic() + timeout_in_seconds
+        for thread in self._threads:
+            thread.join(max(0, deadline - monotonic()))
+
+    def stats(self) -> dict:
+        """ Get the counters of the dispatcher.
+
+        Returns:
+            dict: The counters, in the format {'queue_depth':..., 'sent':..., 'failed':..., 'dropped':..., 'latency': {channel: {'count':..., 'mean':..., 'max':..., 'last':...}}},
+            where the latencies are the seconds taken to send the notifications.
+        """
+        with self._lock:
+            latency = {channel: {'count': count, 'mean': total / count, 'max': maximum, 'last': last} \
+                for channel, (count, total, maximum, last) in self._latencies.items()}
+            return {'queue_depth': self._queue.qsize(), 'sent': self.sent, 'failed': self.failed, 'dropped': self.dropped, 'latency': latency}
+
+    def _work(self) -> None:
+        while True:
+            try:
+                channel, send, on_failure = self._queue.get(timeout=0.5)
+            except Empty:
+                if self._stopped.is_set():
+                    return
+                continue
+            start = monotonic()
+            try:
+                send()
+                succeeded = True
+            except Exception:
+                succeeded = False
+                if on_failure is not None:
+                    self._report_failure(on_failure, format_exc())
+            finally:
+                self._queue.task_done()
+            self._record(channel, monotonic() - start, succeeded)
+
+    def _report_failure(self, on_failure:Callable[[str], None], traceback:str) -> None:
+        # The worker must survive a failing on_failure, otherwise the queue stops being drained.
+        try:
+            on_failure(traceback)
+        except Exception:
+            # Imported here, as logging_system imports this module.
+            from src.utilities.logging_system import stdout_logging
+            stdout_logging('Notification failure handler failed', f'{format_exc()} \n while handling: \n {traceback}', level='error')
+
+    def _record(self, channel:str, elapsed:float, succeeded:bool) -> None:
+        with self._lock:
+            if succeeded:
+                self.sent += 1
+            else:
+                self.failed += 1
+            count, total, maximum, _ = self._latencies.get(channel, (0, 0.0, 0.0, 0.0))
+            self._latencies[channel] = (count + 1, total + elapsed, max(maximum, elapsed), elapsed)
+
+
+class NotificationsDigest():
+    """ Groups the notifications of each channel produced during a time window, across all the VersioningHandlers,
+    and enqueues them in the dispatcher as a single message per channel when the window ends.
+    """
+    def __init__(self, dispatcher:NotificationsDispatcher, window_in_seconds:int) -> None:
+        self.dispatcher = dispatcher
+        self.window_in_seconds = window_in_seconds
+        self._pending = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def add(self, channel:str, subject:str, message:str, send:Callable[[str, str], None], on_failure:Union[Callable[[str], None], None]=None, \
+            on_queue_full:Union[Callable[[], None], None]=None) -> None:
+        """ Add a notification to the digest of its channel, starting the periodic sending the first time.
+
+        Args:
+            channel (str): The channel of the notification, for example email or telegram.
+            subject (str): The subject of the notification.
+            message (str): The message of the notification.
+            send (Callable[[str, str], None]): Function that sends a subject and a message through the channel. The one of the first notification of the window is used.
+            on_failure (Union[Callable[[str], None], None], optional): Function called with the traceback if sending the digest fails. Defaults to None.
+            on_queue_full (Union[Callable[[], None], None], optional): Function called if the digest is discarded because the queue of the dispatcher is full. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.start()
+        with self._lock:
+            digest = self._pending.setdefault(channel, {'send': send, 'on_failure': [], 'on_queue_full': [], 'notifications': []})
+            digest['notifications'].append((subject, message))
+            # Every notification of the digest is reported, so the handlers of all of them are kept.
+            if on_failure is not None:
+                digest['on_failure'].append(on_failure)
+            if on_queue_full is not None:
+                digest['on_queue_full'].append(on_queue_full)
+
+    def flush(self) -> None:
+        """ Enqueue the digest of each channel in the dispatcher, and start new windows.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for channel, digest in pending.items():
+            subject, message = render_digest(digest['notifications'])
+            on_failure = (lambda traceback, on_failure=digest['on_failure']: _call_each(on_failure, traceback)) if digest['on_failure'] else None
+            if not self.dispatcher.submit(channel, lambda send=digest['send'], subject=subject, message=message: send(subject, message), on_failure):
+                try:
+                    _call_each(digest['on_queue_full'])
+                except Exception:
+                    # The periodic flushes must go on. Imported here, as logging_system imports this module.
+                    from src.utilities.logging_system import stdout_logging
+                    stdout_logging('Notification queue full handler failed', format_exc(), level='error')
+
+    def start(self) -> None:
+        """ Start sending the digests periodically, if not started.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = Thread(target=self._flush_periodically, name='notifications-digest', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop sending the digests periodically, and enqueue the pending ones.
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        self.flush()
+
+    def _flush_periodically(self) -> None:
+        while not self._stopped.wait(self.window_in_seconds):
+            self.flush()
+
+
+def _call_each(functions:list, *args) -> None:
+    """ Call each function with the given arguments, even if the previous ones fail.
+
+    Args:
+        functions (list): The functions.
+        *args: The arguments.
+
+    Raises:
+        Exception: The first exception raised by the functions, once all of them have been called.
+
+    Returns:
+        None
+    """
+    error = None
+    for function in functions:
+        try:
+            function(*args)
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+
+
+def render_digest(notifications:list) -> tuple:
+    """ Render several notifications as a single one, listing their subjects first and then each subject with its message.
+
+    Args:
+        notifications (list): The notifications, as (subject, message) tuples.
+
+    Returns:
+        tuple: The subject and message of the digest.
+    """
+    if len(notifications) == 1:
+        return notifications[0]
+    subject = f'[Digest] {len(notifications)} notifications'
+    summary = '\n'.join(f'- {subject}' for subject, _ in notifications)
+    details = '\n\n'.join(f'{subject}\n{message}' for subject, message in notifications)
+    return subject, f'{summary}\n\n{details}'
+
+
+# Shared by all the VersioningHandlers, see NotificationsDispatcher, NotificationsDigest, SMTPSession and TelegramSender.
+notifications_dispatcher = NotificationsDispatcher(get_notifications_queue_max_size_environment_variable(), get_notifications_workers_environment_variable())
+smtp_session = SMTPSession()
+telegram_sender = TelegramSender()
+notifications_digest = NotificationsDigest(notifications_dispatcher, get_notifications_digest_window_in_seconds_environment_variable())
@@ -0,0 +1,371 @@
+import heapq
+from email.utils import parsedate_to_datetime
+from itertools import count
+from threading import Condition, Lock, local
+from time import monotonic, time
+from typing import Union
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from src.utilities.environment_variables import get_registry_rate_limit_per_second_environment_variable, get_registry_rate_limit_burst_environment_variable, \
+    get_registry_rate_limit_max_wait_in_seconds_environment_variable
+
+
+
+class RegistryRateLimitedException(Exception):
+    """ Raised when a request to a container registry waited for longer than REGISTRY_RATE_LIMIT_MAX_WAIT_IN_SECONDS to be allowed. """
+    pass
+
+
+# Requests of images with a pending decision are sent before the rest, which only refresh what is already known.
+PRIORITY_PENDING_DECISION = 0
+PRIORITY_REFRESH = 1
+# Times a request answered with 429 Too Many Requests is sent again, once the registry allows it.
+rate_limited_retries = 1
+# RateLimit-Reset values above this are unix times (2001-09-09) instead of seconds.
+unix_time_threshold = 1e9
+
+
+class TokenBucket():
+    """ Token bucket that paces the requests to a container registry host, letting through bursts of up to burst requests.
+
+    The requests wait in a priority queue, so that a token is always given to the waiting request with the lowest priority value,
+    and in arrival order among the ones with the same priority.
+
+    The refill rate adapts to the responses of the registry, see observe, and never exceeds the configured one.
+    """
+    def __init__(self, rate_per_second:float, burst:int) -> None:
+        self.configured_rate_per_second = rate_per_second
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self._updated_at = monotonic()
+        self._waiting = []
+        self._sequence = count()
+        self._condition = Condition()
+
+    def acquire(self, priority:int=PRIORITY_REFRESH, timeout_in_seconds:Union[float, None]=None) -> bool:
+        """ Wait for a token, and take it.
+
+        Args:
+            priority (int, optional): The priority of the request, lower values first. Defaults to PRIORITY_REFRESH.
+            timeout_in_seconds (Union[float, None], optional): The maximum seconds to wait. Defaults to None, waiting as long as needed.
+
+        Returns:
+            bool: True if the token was taken, False if the timeout expired before.
+        """
+        if self.configured_rate_per_second <= 0:
+            return True
+        deadline = None if timeout_in_seconds is None else monotonic() + timeout_in_seconds
+        with self._condition:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = monotonic()
+                    self._refill(now)
+                    if self._waiting[0] == entry and now >= self.blocked_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        return True
+                    if self._waiting[0] != entry:
+                        # Woken up when the requests ahead take their tokens.
+                        wait = None
+                    elif now < self.blocked_until:
+                        wait = self.blocked_until - now
+                    else:
+                        wait = (1 - self.tokens) / self.rate_per_second
+                    if deadline is not None:
+                        if deadline <= now:
+                            return False
+                        wait = deadline - now if wait is None else min(wait, deadline - now)
+                    self._condition.wait(wait)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def observe(self, status_code:int, headers:dict) -> None:
+        """ Adapt to a response of the registry.
+        - RateLimit-Remaining, with the window of RateLimit-Reset or of its w parameter, as DockerHub sends it, caps the tokens to the remaining requests,
+          and spreads them over the window. RateLimit-Reset may be given in seconds, or as the unix time of the reset, as Gitlab sends it.
+        - Retry-After stops all the requests for the seconds given.
+        - A 429 response without those headers halves the refill rate, which then recovers gradually with the successful responses without a window.
+
+        Args:
+            status_code (int): The status code of the response.
+            headers (dict): The headers of the response, with case insensitive keys.
+
+        Returns:
+            None
+        """
+        if self.configured_rate_per_second <= 0:
+            return
+        remaining, window_in_seconds = _parse_rate_limit(headers.get('RateLimit-Remaining'), headers.get('RateLimit-Reset'))
+        retry_after = _parse_retry_after(headers.get('Retry-After'))
+        with self._condition:
+            now = monotonic()
+            self._refill(now)
+            if status_code == 429:
+                self.throttled += 1
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+                if window_in_seconds:
+                    self.rate_per_second = min(self.configured_rate_per_second, max(remaining, 1) / window_in_seconds)
+            if retry_after is not None:
+                self.tokens = 0.0
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            elif status_code == 429 and remaining is None:
+                self.rate_per_second = max(self.configured_rate_per_second / 64, self.rate_per_second / 2)
+                self.tokens = 0.0
+            elif status_code < 400 and not (remaining is not None and window_in_seconds):
+                # Without a window to spread the remaining requests over, the rate recovers gradually.
+                self.rate_per_second = min(self.configured_rate_per_second, self.rate_per_second + self.configured_rate_per_second / 10)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """ Get the state of the bucket.
+
+        Returns:
+            dict: The state, of the form {'rate_per_second':..., 'tokens':..., 'waiting':..., 'throttled':..., 'blocked_for_seconds':...},
+            where throttled is the number of 429 responses received.
+        """
+        with self._condition:
+            now = monotonic()
+            self._refill(now)
+            return {'rate_per_second': self.rate_per_second, 'tokens': self.tokens, 'waiting': len(self._waiting), 'throttled': self.throttled, \
+                'blocked_for_seconds': max(0.0, self.blocked_until - now)}
+
+    def _refill(self, now:float) -> None:
+        self.tokens = min(float(self.burst), self.tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+
+class RegistryRateLimiter():
+    """ Token buckets of the container registries hosts, shared by all the VersioningHandlers of the operator process, see TokenBucket. """
+    def __init__(self, rate_per_second:float, burst:int, max_wait_in_seconds:float) -> None:
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_wait_in_seconds = max_wait_in_seconds
+        self._buckets = {}
+        self._lock = Lock()
+
+    def get_bucket(self, host:str) -> TokenBucket:
+        """ Get the token bucket of a host, creating it the first time.
+
+        Args:
+            host (str): The host, with port if any.
+
+        Returns:
+            TokenBucket: The token bucket.
+        """
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate_per_second, self.burst)
+            return self._buckets[host]
+
+    def acquire(self, host:str, priority:int=PRIORITY_REFRESH) -> None:
+        """ Wait until a request can be sent to a host.
+
+        Args:
+            host (str): The host.
+            priority (int, optional): The priority of the request. Defaults to PRIORITY_REFRESH.
+
+        Raises:
+            RegistryRateLimitedException: If the request can not be sent within max_wait_in_seconds.
+
+        Returns:
+            None
+        """
+        if not self.get_bucket(host).acquire(priority, self.max_wait_in_seconds):
+            raise RegistryRateLimitedException(f'The requests to {host} are rate limited, waited for {self.max_wait_in_seconds} seconds.')
+
+    def observe(self, host:str, status_code:int, headers:dict) -> None:
+        """ Adapt the token bucket of a host to one of its responses, see TokenBucket.observe.
+
+        Args:
+            host (str): The host.
+            status_code (int): The status code of the response.
+            headers (dict): The headers of the response, with case insensitive keys.
+
+        Returns:
+            None
+        """
+        self.get_bucket(host).observe(status_code, headers)
+
+    def stats(self) -> dict:
+        """ Get the state of the token bucket of each host.
+
+        Returns:
+            dict: The states, of the form {host: TokenBucket.stats()}.
+        """
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {host: bucket.stats() for host, bucket in buckets.items()}
+
+
+class RateLimitedHTTPAdapter(HTTPAdapter):
+    """ HTTP adapter that waits for the rate limiter before sending each request, adapts it to the response, and sends again
+    the requests answered with 429 Too Many Requests, up to rate_limited_retries times.
+    It can be mounted in any requests session, so that the container registries clients share the limits of each host.
+    """
+    def __init__(self, limiter:RegistryRateLimiter, **kwargs) -> None:
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        host = urlsplit(request.url).netloc
+        for attempt in range(rate_limited_retries + 1):
+            self.limiter.acquire(host, get_request_priority())
+            response = super().send(request, **kwargs)
+            self.limiter.observe(host, response.status_code, response.headers)
+            if response.status_code != 429 or attempt == rate_limited_retries:
+                return response
+            response.close()
+
+
+_request_priority = local()
+
+
+def get_request_priority() -> int:
+    """ Get the priority of the requests sent by the current thread.
+
+    Returns:
+        int: The priority. Defaults to PRIORITY_REFRESH.
+    """
+    return getattr(_request_priority, 'value', PRIORITY_REFRESH)
+
+
+def set_request_priority(priority:int) -> None:
+    """ Set the priority of the requests sent by the current thread, until it is set again.
+
+    Args:
+        priority (int): PRIORITY_PENDING_DECISION or PRIORITY_REFRESH.
+
+    Returns:
+        None
+    """
+    _request_priority.value = priority
+
+
+class PendingDecisions():
+    """ Images whose last update decision left a newer version than the one they run for the user to apply, see updates_logs.
+    They are kept by namespace, deployment and image, without the tag, as it changes when the image is updated.
+    """
+    def __init__(self) -> None:
+        self._images = set()
+        self._lock = Lock()
+
+    def record(self, curr_img_id:str, pending:bool) -> None:
+        """ Save the last update decision of an image.
+
+        Args:
+            curr_img_id (str): The id of the image, of the form namespace/deployment/image:tag.
+            pending (bool): If the decision left a newer version for the user to apply.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if pending:
+                self._images.add(_untag_img_id(curr_img_id))
+            else:
+                self._images.discard(_untag_img_id(curr_img_id))
+
+    def is_pending(self, curr_img_id:str) -> bool:
+        """ Check if the last update decision of an image left a newer version for the user to apply.
+
+        Args:
+            curr_img_id (str): The id of the image, with any tag.
+
+        Returns:
+            bool: True if the image has a pending decision, False otherwise, or if no decision has been made for it yet.
+        """
+        with self._lock:
+            return _untag_img_id(curr_img_id) in self._images
+
+
+def _untag_img_id(curr_img_id:str) -> str:
+    """ Remove the tag from the id of an image, of the form namespace/deployment/image:tag, where image may have a registry host with port.
+
+    Args:
+        curr_img_id (str): The id of the image.
+
+    Returns:
+        str: The id without the tag.
+    """
+    untagged_img_id, _, tag = curr_img_id.rpartition(':')
+    return curr_img_id if not untagged_img_id or '/' in tag else untagged_img_id
+
+
+def get_image_request_priority(curr_img_id:str) -> int:
+    """ Get the priority of the requests of an image: the images with a pending decision go before the rest, see PendingDecisions.
+
+    Args:
+        curr_img_id (str): The id of the image.
+
+    Returns:
+        int: PRIORITY_PENDING_DECISION or PRIORITY_REFRESH.
+    """
+    return PRIORITY_PENDING_DECISION if pending_decisions.is_pending(curr_img_id) else PRIORITY_REFRESH
+
+
+def _parse_rate_limit(remaining:Union[str, None], reset:Union[str, None]) -> tuple:
+    """ Parse the RateLimit-Remaining header, of the form 76 or 76;w=21600, and the RateLimit-Reset one.
+
+    Args:
+        remaining (Union[str, None]): The RateLimit-Remaining header.
+        reset (Union[str, None]): The RateLimit-Reset header, in seconds, or as the unix time of the reset, as Gitlab sends it.
+
+    Returns:
+        tuple: The remaining requests, and the seconds of the window, from RateLimit-Reset or else from the w parameter. Each of them None if not given.
+    """
+    if remaining is None:
+        return None, None
+    value, _, parameters = remaining.partition(';')
+    try:
+        remaining_requests = max(0, int(value.strip()))
+    except ValueError:
+        return None, None
+    window_in_seconds = None
+    try:
+        if reset is not None:
+            window_in_seconds = float(reset)
+            if window_in_seconds > unix_time_threshold:
+                window_in_seconds = max(0.0, window_in_seconds - time())
+        else:
+            for parameter in parameters.split(';'):
+                if parameter.strip().startswith('w='):
+                    window_in_seconds = float(parameter.strip()[2:])
+    except ValueError:
+        window_in_seconds = None
+    return remaining_requests, window_in_seconds
+
+
+def _parse_retry_after(retry_after:Union[str, None]) -> Union[float, None]:
+    """ Parse the Retry-After header, in seconds or as an HTTP date.
+
+    Args:
+        retry_after (Union[str, None]): The Retry-After header.
+
+    Returns:
+        float: The seconds to wait.
+        None: The header is not given, or can not be parsed.
+    """
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Shared by all the container registries clients, and therefore by all the VersioningHandlers timers.
+registry_rate_limiter = RegistryRateLimiter(get_registry_rate_limit_per_second_environment_variable(), get_registry_rate_limit_burst_environment_variable(), \
+    get_registry_rate_limit_max_wait_in_seconds_environment_variable())
+# Shared by all the VersioningHandlers, filled by updates_logs.
+pending_decisions = PendingDecisions()
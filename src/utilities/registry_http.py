@@ -0,0 +1,145 @@
+from collections import OrderedDict, namedtuple
+from json import loads
+from threading import Lock
+from typing import Union
+from urllib.parse import urlsplit
+import requests
+from src.utilities.environment_variables import get_registry_http_timeout_in_seconds_environment_variable, get_registry_http_pool_maxsize_environment_variable, \
+    get_registry_http_validators_cache_max_size_environment_variable
+from src.utilities.rate_limiter import RateLimitedHTTPAdapter, registry_rate_limiter
+
+
+
+# Body and headers of a response, which may come from the validators cache when the registry answered 304 Not Modified.
+RegistryResponse = namedtuple('RegistryResponse', ['status_code', 'headers', 'content', 'from_cache'])
+
+
+class RegistryHTTPClient():
+    """ HTTP client shared by the container registries APIs, with a keep-alive connection pool per host and the same timeout for all requests.
+    The requests to each host are paced by the shared rate limiter, see RateLimitedHTTPAdapter.
+
+    The ETag and Last-Modified validators of the GET responses are kept, together with their bodies, and sent back as If-None-Match and If-Modified-Since,
+    so that the registry answers 304 Not Modified for the pages that did not change, which are then served from the stored bodies.
+    The least recently used stored responses are discarded beyond max_cached_responses.
+    """
+    def __init__(self, timeout_in_seconds:float, pool_maxsize:int, max_cached_responses:int) -> None:
+        self.timeout_in_seconds = timeout_in_seconds
+        self.pool_maxsize = pool_maxsize
+        self.max_cached_responses = max_cached_responses
+        self._sessions = {}
+        self._validated = OrderedDict()
+        self._counters = {}
+        self._lock = Lock()
+
+    def get(self, url:str, headers:Union[dict, None]=None, timeout_in_seconds:Union[float, None]=None) -> RegistryResponse:
+        """ Send a conditional GET request.
+
+        Args:
+            url (str): The url.
+            headers (Union[dict, None], optional): Extra headers. Defaults to None.
+            timeout_in_seconds (Union[float, None], optional): Timeout for this request, instead of the shared one. Defaults to None.
+
+        Raises:
+            requests.HTTPError: If the response status is an error one.
+
+        Returns:
+            RegistryResponse: The response.
+        """
+        headers = dict(headers or {})
+        with self._lock:
+            validated = self._validated.get(url)
+        if validated is not None:
+            if validated.headers.get('ETag') is not None:
+                headers['If-None-Match'] = validated.headers['ETag']
+            if validated.headers.get('Last-Modified') is not None:
+                headers['If-Modified-Since'] = validated.headers['Last-Modified']
+        response = self._send('GET', url, headers, timeout_in_seconds)
+        if response.status_code == 304 and validated is not None:
+            with self._lock:
+                self._count(url, not_modified=1)
+                self._validated.move_to_end(url)
+            return validated._replace(status_code=200, from_cache=True)
+        response.raise_for_status()
+        result = RegistryResponse(response.status_code, dict(response.headers), response.content, False)
+        if self.max_cached_responses > 0 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+            with self._lock:
+                self._validated[url] = result
+                self._validated.move_to_end(url)
+                while len(self._validated) > self.max_cached_responses:
+                    self._validated.popitem(last=False)
+        return result
+
+    def get_json(self, url:str, headers:Union[dict, None]=None, timeout_in_seconds:Union[float, None]=None) -> dict:
+        """ Send a conditional GET request, and parse the body as json.
+
+        Args:
+            url (str): The url.
+            headers (Union[dict, None], optional): Extra headers. Defaults to None.
+            timeout_in_seconds (Union[float, None], optional): Timeout for this request, instead of the shared one. Defaults to None.
+
+        Raises:
+            requests.HTTPError: If the response status is an error one.
+
+        Returns:
+            dict: The parsed body.
+        """
+        return loads(self.get(url, headers, timeout_in_seconds).content)
+
+    def head(self, url:str, headers:Union[dict, None]=None, timeout_in_seconds:Union[float, None]=None) -> RegistryResponse:
+        """ Send a HEAD request.
+
+        Args:
+            url (str): The url.
+            headers (Union[dict, None], optional): Extra headers. Defaults to None.
+            timeout_in_seconds (Union[float, None], optional): Timeout for this request, instead of the shared one. Defaults to None.
+
+        Raises:
+            requests.HTTPError: If the response status is an error one.
+
+        Returns:
+            RegistryResponse: The response, without content.
+        """
+        response = self._send('HEAD', url, dict(headers or {}), timeout_in_seconds)
+        response.raise_for_status()
+        return RegistryResponse(response.status_code, dict(response.headers), b'', False)
+
+    def stats(self) -> dict:
+        """ Get the counters of each host.
+
+        Returns:
+            dict: The counters, of the form {host: {'requests':..., 'bytes':..., 'not_modified':..., 'errors':...}},
+            where bytes are the bytes of the bodies received, and not_modified the responses served from the stored bodies.
+        """
+        with self._lock:
+            return {host: dict(counters) for host, counters in self._counters.items()}
+
+    def _send(self, method:str, url:str, headers:dict, timeout_in_seconds:Union[float, None]) -> requests.Response:
+        try:
+            response = self._get_session(url).request(method, url, headers=headers, \
+                timeout=timeout_in_seconds if timeout_in_seconds is not None else self.timeout_in_seconds)
+        except requests.RequestException:
+            with self._lock:
+                self._count(url, requests=1, errors=1)
+            raise
+        with self._lock:
+            self._count(url, requests=1, bytes=len(response.content), errors=int(response.status_code >= 400))
+        return response
+
+    def _get_session(self, url:str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                session.mount(f'{urlsplit(url).scheme}://{host}', RateLimitedHTTPAdapter(registry_rate_limiter, pool_maxsize=self.pool_maxsize))
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def _count(self, url:str, **increments:int) -> None:
+        counters = self._counters.setdefault(urlsplit(url).netloc, {'requests': 0, 'bytes': 0, 'not_modified': 0, 'errors': 0})
+        for counter, increment in increments.items():
+            counters[counter] += increment
+
+
+# Shared by all the container registries APIs, and therefore by all the VersioningHandlers timers.
+registry_http_client = RegistryHTTPClient(get_registry_http_timeout_in_seconds_environment_variable(), get_registry_http_pool_maxsize_environment_variable(), \
+    get_registry_http_validators_cache_max_size_environment_variable())
@@ -0,0 +1,65 @@
+from hashlib import sha256
+from math import floor
+from random import uniform
+from src.utilities.environment_variables import get_refresh_frequency_in_seconds_environment_variable, get_scheduling_jitter_in_seconds_environment_variable
+
+
+
+def get_slot_offset_in_seconds(uid:str, interval_in_seconds:float) -> float:
+    """ Get the offset within the interval at which an object is checked, spreading the objects evenly and deterministically,
+    so that it is the same across restarts of the operator.
+
+    Args:
+        uid (str): The uid of the object.
+        interval_in_seconds (float): The interval between checks.
+
+    Returns:
+        float: The offset, between 0 and the interval.
+    """
+    return int(sha256(uid.encode()).hexdigest()[:8], 16) / 0x100000000 * interval_in_seconds
+
+
+def get_next_slot(uid:str, now:float, interval_in_seconds:float) -> float:
+    """ Get the first time after now at which an object is checked, of the form k * interval + offset.
+
+    Args:
+        uid (str): The uid of the object.
+        now (float): The current unix time.
+        interval_in_seconds (float): The interval between checks.
+
+    Returns:
+        float: The unix time of the next slot.
+    """
+    offset = get_slot_offset_in_seconds(uid, interval_in_seconds)
+    return (floor((now - offset) / interval_in_seconds) + 1) * interval_in_seconds + offset
+
+
+def get_seconds_until_next_check(uid:str, now:float, interval_in_seconds:float, jitter_in_seconds:float=0) -> float:
+    """ Get the seconds the updates checker daemon of an object sleeps in sharded mode before its next check.
+    The object is checked once per interval, on its slot, see get_next_slot, delayed by a random jitter of up to jitter_in_seconds, which is at most the interval.
+    The first time, the object also waits for its slot, so that the objects are spread over the first interval after a restart of the operator.
+
+    Args:
+        uid (str): The uid of the object.
+        now (float): The current unix time.
+        interval_in_seconds (float): The interval between checks.
+        jitter_in_seconds (float, optional): The maximum random delay of each check. Defaults to 0.
+
+    Returns:
+        float: The seconds until the next check.
+    """
+    jitter_in_seconds = max(0, min(jitter_in_seconds, interval_in_seconds))
+    return get_next_slot(uid, now, interval_in_seconds) + uniform(0, jitter_in_seconds) - now
+
+
+def get_seconds_until_next_updates_check(uid:str, now:float) -> float:
+    """ Get the seconds until the next check of a VersioningHandler in sharded mode, once per REFRESH_FREQUENCY_IN_SECONDS, see get_seconds_until_next_check.
+
+    Args:
+        uid (str): The uid of the VersioningHandler.
+        now (float): The current unix time.
+
+    Returns:
+        float: The seconds until the next check.
+    """
+    return get_seconds_until_next_check(uid, now, get_refresh_frequency_in_seconds_environment_variable(), get_scheduling_jitter_in_seconds_environment_variable())
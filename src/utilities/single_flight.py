@@ -0,0 +1,73 @@
+from copy import copy
+from threading import Event, Lock
+from typing import Any, Callable, Hashable
+
+
+
+class _Flight():
+    """ A call in progress, whose result is shared by all the callers of the same key. """
+    def __init__(self) -> None:
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight():
+    """ Coalesces concurrent calls with the same key into a single one, so that when many VersioningHandlers look up the same image
+    at the same time, the container registry is queried once, and all of them get its result.
+
+    Only calls in progress are shared, results are not kept afterwards, see TagsCache for that.
+    """
+    def __init__(self) -> None:
+        self._flights = {}
+        self._lock = Lock()
+        self.calls = 0
+        self.executions = 0
+
+    def do(self, key:Hashable, fetch:Callable[[], Any]) -> Any:
+        """ Call fetch, or wait for the call in progress with the same key and get its result.
+
+        Args:
+            key (Hashable): The key of the call, usually (registry, namespace, image, current tag).
+            fetch (Callable[[], Any]): Function that obtains the value from the container registry.
+
+        Raises:
+            Exception: The exception raised by fetch, to all the callers that waited for it.
+
+        Returns:
+            Any: The value returned by fetch. The callers that waited get a shallow copy, so that they can modify it freely.
+        """
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy(flight.value)
+        try:
+            flight.value = fetch()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+    def stats(self) -> dict:
+        """ Get the counters of the calls.
+
+        Returns:
+            dict: The counters, of the form {'calls':..., 'executions':..., 'coalesced':..., 'in_flight':..., 'dedup_ratio':...},
+            where coalesced are the calls that waited for another one, and dedup_ratio their fraction of all the calls.
+        """
+        with self._lock:
+            coalesced = self.calls - self.executions
+            return {'calls': self.calls, 'executions': self.executions, 'coalesced': coalesced, 'in_flight': len(self._flights), \
+                'dedup_ratio': coalesced / self.calls if self.calls else 0.0}
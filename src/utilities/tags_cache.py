@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from copy import copy
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Hashable
+from src.utilities.single_flight import SingleFlight
+from src.utilities.environment_variables import get_tags_cache_ttl_in_seconds_environment_variable, get_tags_cache_max_size_environment_variable
+
+
+
+class TagsCache():
+    """ Thread safe cache shared by all the VersioningHandlers of the operator process, which stores the tags obtained from the container registries.
+    Entries expire after a time to live, and when the maximum size is reached, the least recently used entry is evicted.
+
+    Keys are tuples of the form (registry, namespace, image, ...), for example ('dockerhub', 'library', 'nginx', '1.21').
+
+    Concurrent misses of the same key are coalesced into a single fetch, see SingleFlight, whose counters are in single_flight.stats().
+    """
+    def __init__(self, ttl_in_seconds:int, max_size:int) -> None:
+        self.ttl_in_seconds = ttl_in_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.single_flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key:Hashable, default:Any=None) -> Any:
+        """ Get the value stored for the given key, if it has not expired.
+
+        Args:
+            key (Hashable): The key of the entry, usually (registry, namespace, image, ...).
+            default (Any, optional): The value to return when the key is not found or has expired. Defaults to None.
+
+        Returns:
+            Any: A shallow copy of the value stored, so that callers can modify it freely, or the default value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and monotonic() - entry[0] >= self.ttl_in_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy(entry[1])
+
+    def set(self, key:Hashable, value:Any) -> None:
+        """ Store a value for the given key, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (Hashable): The key of the entry, usually (registry, namespace, image, ...).
+            value (Any): The value to store.
+
+        Returns:
+            None
+        """
+        if self.ttl_in_seconds <= 0 or self.max_size <= 0:
+            # Caching disabled.
+            return
+        with self._lock:
+            self._entries[key] = (monotonic(), copy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_fetch(self, key:Hashable, fetch:Callable[[], Any]) -> Any:
+        """ Read through the cache: return the stored value, or call fetch and store its result.
+        While a fetch is in progress, the other callers of the same key wait for it instead of fetching again.
+        Exceptions raised by fetch are not cached, and are raised to all the callers that waited for it.
+
+        Args:
+            key (Hashable): The key of the entry, usually (registry, namespace, image, ...).
+            fetch (Callable[[], Any]): Function that obtains the value from the container registry.
+
+        Returns:
+            Any: The value for the given key.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            def fetch_and_set() -> Any:
+                fetched = fetch()
+                self.set(key, fetched)
+                return fetched
+            value = self.single_flight.do(key, fetch_and_set)
+        return value
+
+    def invalidate(self, key:Hashable) -> None:
+        """ Remove an entry from the cache, if present.
+
+        Args:
+            key (Hashable): The key of the entry.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """ Remove all the entries of the cache, keeping the counters.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """ Get the counters of the cache.
+
+        Returns:
+            dict: The counters, in the format {'size':..., 'hits':..., 'misses':..., 'evictions':..., 'expirations':...}
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations}
+
+
+# Shared by the DockerHub and Gitlab APIs, and therefore by all the VersioningHandlers timers.
+tags_cache = TagsCache(get_tags_cache_ttl_in_seconds_environment_variable(), get_tags_cache_max_size_environment_variable())
@@ -0,0 +1,167 @@
+import re
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, Iterable, Iterator, Union
+from src.utilities.environment_variables import get_tags_cache_max_size_environment_variable
+
+
+
+numeric_version_number_regex = re.compile(r'^\d+(\.\d+)*$')
+
+
+def _strip_trailing_zeros(release:tuple) -> tuple:
+    """ Remove the trailing zero levels of a release, as PEP 440 considers 1.2 and 1.2.0 the same version.
+
+    Args:
+        release (tuple): The levels of a version number, as integers.
+
+    Returns:
+        tuple: The release without trailing zeros.
+    """
+    end = len(release)
+    while end > 0 and release[end - 1] == 0:
+        end -= 1
+    return release[:end]
+
+
+class SortedTagsIndex():
+    """ Index of the tags of an image, which keeps the numeric version numbers (of the form N(.N)*) sorted as tuples of integers,
+    so that the latest version, and the latest version with some levels frozen, are found with a binary search.
+    Tags of any other form are kept apart, in other_tags.
+    """
+    def __init__(self, tags:Iterable=()) -> None:
+        self._releases = []
+        self._releases_by_levels = {}
+        self._tags = {}
+        self.other_tags = set()
+        self._lock = Lock()
+        self.update(tags)
+
+    def __len__(self) -> int:
+        return len(self._releases)
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over the tags of the numeric versions, from the oldest to the latest. """
+        with self._lock:
+            return iter([self._tags[release] for release in self._releases])
+
+    def add(self, tags:Iterable) -> None:
+        """ Insert new tags in the index, keeping it sorted.
+
+        Args:
+            tags (Iterable): The tags to insert. Those already indexed are ignored.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for tag in tags:
+                if numeric_version_number_regex.match(tag) is None:
+                    self.other_tags.add(tag)
+                    continue
+                release = tuple(int(l) for l in tag.split('.'))
+                if release not in self._tags:
+                    insort(self._releases, release)
+                    insort(self._releases_by_levels.setdefault(len(release), []), release)
+                self._tags[release] = tag
+
+    def update(self, tags:Iterable) -> None:
+        """ Make the index contain exactly the given tags, inserting the new ones and removing the ones that are no longer available.
+
+        Args:
+            tags (Iterable): All the tags of the image.
+
+        Returns:
+            None
+        """
+        tags = set(tags)
+        with self._lock:
+            removed_releases = [release for release, tag in self._tags.items() if tag not in tags]
+            for release in removed_releases:
+                del self._tags[release]
+                del self._releases[bisect_left(self._releases, release)]
+                by_levels = self._releases_by_levels[len(release)]
+                del by_levels[bisect_left(by_levels, release)]
+            self.other_tags &= tags
+            new_tags = tags - self.other_tags - set(self._tags.values())
+        self.add(new_tags)
+
+    def latest(self) -> Union[str, None]:
+        """ Get the tag of the latest numeric version.
+
+        Returns:
+            str: The tag.
+            None: No numeric version is indexed.
+        """
+        with self._lock:
+            return self._tags[self._releases[-1]] if self._releases else None
+
+    def latest_with_prefix(self, prefix:tuple) -> Union[str, None]:
+        """ Get the tag of the latest numeric version whose first levels are the given ones.
+
+        Args:
+            prefix (tuple): The frozen levels, as integers. For example (3, 2) matches 3.2, 3.2.1, 3.2.10.4...
+
+        Returns:
+            str: The tag.
+            None: No numeric version with that prefix is indexed.
+        """
+        if not prefix:
+            return self.latest()
+        with self._lock:
+            # All the versions with the prefix are between the prefix itself and the prefix with its last level incremented.
+            position = bisect_left(self._releases, prefix[:-1] + (prefix[-1] + 1,))
+            if position > 0 and self._releases[position - 1][:len(prefix)] == prefix:
+                return self._tags[self._releases[position - 1]]
+            return None
+
+    def latest_updatable(self, curr_version_number:str, version_frontier:int) -> Union[str, None]:
+        """ Get the tag of the latest numeric version newer than the current one, to which perform_automatic_update allows updating automatically.
+        - If the frontier does not fall inside the current version number, it is the latest version overall.
+        - Otherwise, it is the latest version with the same levels as the current one before the frontier,
+          or any newer version with less levels than the frontier, as those are always updatable.
+
+        Args:
+            curr_version_number (str): Version number of the current image, of the form N(.N)*.
+            version_frontier (int): The limit between updating automatically and notifying the user.
+
+        Returns:
+            str: The tag.
+            None: No numeric version can be updated to.
+        """
+        curr_release = tuple(int(l) for l in curr_version_number.split('.'))
+        if version_frontier <= 0 or version_frontier > len(curr_release):
+            candidates = [self.latest()]
+        else:
+            candidates = [self.latest_with_prefix(curr_release[:version_frontier])]
+            with self._lock:
+                for levels in range(1, version_frontier):
+                    if self._releases_by_levels.get(levels):
+                        candidates.append(self._tags[self._releases_by_levels[levels][-1]])
+        release_of = lambda tag: _strip_trailing_zeros(tuple(int(l) for l in tag.split('.')))
+        candidates = [tag for tag in candidates if tag is not None and release_of(tag) > _strip_trailing_zeros(curr_release)]
+        return max(candidates, key=release_of) if candidates else None
+
+
+_tags_indexes = OrderedDict()
+_tags_indexes_lock = Lock()
+
+
+def get_tags_index(key:Hashable) -> SortedTagsIndex:
+    """ Get the tags index of an image, creating an empty one the first time.
+    Indexes are shared by all the VersioningHandlers, and the least recently used ones are discarded beyond TAGS_CACHE_MAX_SIZE images.
+
+    Args:
+        key (Hashable): The key of the image, of the form (registry, namespace, image).
+
+    Returns:
+        SortedTagsIndex: The index of the image.
+    """
+    with _tags_indexes_lock:
+        if key not in _tags_indexes:
+            _tags_indexes[key] = SortedTagsIndex()
+            while len(_tags_indexes) > max(1, get_tags_cache_max_size_environment_variable()):
+                _tags_indexes.popitem(last=False)
+        _tags_indexes.move_to_end(key)
+        return _tags_indexes[key]
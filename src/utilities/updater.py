@@ -6,7 +6,7 @@ from src.utilities.logging_messages import updates_logs
 
 def updating_engine(img_name:str, deployment_name:str, deployment_namespace:str, apiserver_url:str, prev_tag:str, \
         latest_updatable_version:str, latest_version_number:str, logs_registry_json_id:str, curr_img_id:str, \
-        curr_img_date:datetime=None, latest_img_date:datetime=None) -> None:
+        curr_img_date:datetime=None, latest_img_date:datetime=None, curr_img_digest:str=None, latest_img_digest:str=None) -> None:
     """ If needed, updates the image and logs the user accordingly.
 
     Args:
@@ -20,11 +20,14 @@ def updating_engine(img_name:str, deployment_name:str, deployment_namespace:str,
         curr_img_id (str): The id of the image in the registry.
         curr_img_date (datetime, optional): The datetime at which the current image was pushed to DockerHub. Defaults to None.
         latest_img_date (datetime, optional): The datetime at which the latest image was pushed to DockerHub. Defaults to None.
+        curr_img_digest (str, optional): The digest of the manifest the current image points to, for OCI registries. Defaults to None.
+        latest_img_digest (str, optional): The digest of the manifest the latest image points to, for OCI registries. Defaults to None.
 
     Returns:
         None
     """    
     if (latest_updatable_version != '' and curr_img_date != None and latest_img_date != None and curr_img_date < latest_img_date and prev_tag == latest_updatable_version == 'latest') \
+        or (curr_img_digest != None and latest_img_digest != None and curr_img_digest != latest_img_digest and prev_tag == latest_updatable_version == 'latest') \
         or (prev_tag != latest_updatable_version != 'latest'):
         update_container_image(img_name, deployment_name, deployment_namespace, apiserver_url, prev_tag, latest_updatable_version, logs_registry_json_id, curr_img_id)
         updates_logs(img_name, deployment_name, deployment_namespace, prev_tag, latest_updatable_version, latest_version_number, logs_registry_json_id, curr_img_id)
@@ -1,7 +1,30 @@
 from packaging.version import Version, InvalidVersion
+import numpy as np
+from functools import lru_cache
+from typing import Iterable, Union
+from src.utilities.environment_variables import get_versions_cache_max_size_environment_variable
+from src.utilities.tags_index import SortedTagsIndex, numeric_version_number_regex
 
 
 
+@lru_cache(maxsize=get_versions_cache_max_size_environment_variable())
+def parse_version(v:str) -> Union[Version, None]:
+    """ Parse a tag into a PEP 440 version, remembering the result, so that the same tag is parsed only once by all the functions of this module,
+    and across all the VersioningHandlers.
+
+    Args:
+        v (str): Version number to parse.
+
+    Returns:
+        Version: The parsed version.
+        None: The version number does not follow the PEP 440 standard.
+    """
+    try:
+        return Version(v)
+    except InvalidVersion:
+        return None
+
+
 def perform_automatic_update(curr_version_number:str, latest_version_number:str, version_frontier:int) -> bool:
     """ Based on the user's specified latest_version_number, perform an update automatically, or not.
     The algorithm to check for updates is the following:
@@ -37,11 +60,11 @@ def perform_automatic_update(curr_version_number:str, latest_version_number:str,
         return False
     # Check if before the frontier, the versions are the same.
     for i in range(version_frontier):
-        if latest_version_levels[i] > curr_version_levels[i]:
+        if _is_level_greater(latest_version_levels[i], curr_version_levels[i]):
             return False
     # Check if after the frontier, the current version is outdated.
     for i in range(version_frontier, shortest_version_number):
-        if latest_version_levels[i] > curr_version_levels[i]:
+        if _is_level_greater(latest_version_levels[i], curr_version_levels[i]):
             return True
     if shortest_version_number == len(curr_version_levels):
         # Before and after the frontier the version is the same, and the shortest version number is the current:
@@ -50,25 +73,162 @@ def perform_automatic_update(curr_version_number:str, latest_version_number:str,
     return False
 
 
-def get_latest_version(versions:list, filter:bool=False) -> str:
+def _is_level_greater(level:str, other_level:str) -> bool:
+    """ Compare two levels of version numbers. Numeric levels are compared as integers, so that 10 is greater than 9,
+    and any other level is compared as a string.
+
+    Args:
+        level (str): Level of a version number.
+        other_level (str): Level of another version number, at the same position.
+
+    Returns:
+        bool: True if level is greater than other_level, False otherwise.
+    """
+    if level.isdigit() and other_level.isdigit():
+        return int(level) > int(other_level)
+    return level > other_level
+
+
+def _encode_release_matrix(version_numbers:list, fill_value:int) -> tuple:
+    """ Encode version numbers of the form N(.N)* into a fixed-width integer matrix, with one row per version number and one column per level.
+    Version numbers with any other form (latest, pre-releases, suffixes...) or with levels too big for 64 bits integers are marked as not numeric,
+    and their rows are left filled.
+
+    Args:
+        version_numbers (list): The version numbers, represented as strings.
+        fill_value (int): The value of the levels a version number does not have.
+
+    Returns:
+        tuple: (matrix, levels, is_numeric), being matrix a numpy array of shape (len(version_numbers), max levels), 
+            levels the number of levels of each version number, and is_numeric the mask of the rows that could be encoded.
+    """
+    split_version_numbers = [v.split('.') for v in version_numbers]
+    is_numeric = np.array([all(l.isdigit() and len(l) <= 18 for l in levels) for levels in split_version_numbers], dtype=bool)
+    levels = np.array([len(levels) for levels in split_version_numbers], dtype=np.int64)
+    width = int(levels.max()) if len(version_numbers) > 0 else 0
+    matrix = np.full((len(version_numbers), width), fill_value, dtype=np.int64)
+    for row in np.flatnonzero(is_numeric):
+        matrix[row, :levels[row]] = [int(l) for l in split_version_numbers[row]]
+    return matrix, levels, is_numeric
+
+
+def perform_automatic_update_batch(curr_version_numbers:Union[list, str], latest_version_numbers:Union[list, str], version_frontier:int) -> np.ndarray:
+    """ Vectorized version of perform_automatic_update, which evaluates many pairs of version numbers at once.
+    Either of the arguments can be a single version number, which is then compared against every element of the other.
+
+    The numeric version numbers are encoded once into integer matrices, and the checks of perform_automatic_update before and after the frontier
+    become comparisons of the whole matrices. The rest of the pairs (for example, latest or pre-releases) are evaluated one by one with perform_automatic_update.
+
+    Args:
+        curr_version_numbers (Union[list, str]): Version numbers of the current images.
+        latest_version_numbers (Union[list, str]): Version numbers of the latest images.
+        version_frontier (int): The number that divides the update automatically/notify areas, see perform_automatic_update.
+
+    Returns:
+        np.ndarray: Boolean mask, True for the pairs that can be updated automatically.
+    """
+    rows = len(latest_version_numbers) if isinstance(curr_version_numbers, str) else len(curr_version_numbers)
+    curr_version_numbers = [curr_version_numbers] * rows if isinstance(curr_version_numbers, str) else list(curr_version_numbers)
+    latest_version_numbers = [latest_version_numbers] * rows if isinstance(latest_version_numbers, str) else list(latest_version_numbers)
+    if rows == 0:
+        return np.zeros(0, dtype=bool)
+    curr_matrix, curr_levels, curr_is_numeric = _encode_release_matrix(curr_version_numbers, -1)
+    latest_matrix, latest_levels, latest_is_numeric = _encode_release_matrix(latest_version_numbers, -1)
+    width = max(curr_matrix.shape[1], latest_matrix.shape[1])
+    curr_matrix = np.pad(curr_matrix, ((0, 0), (0, width - curr_matrix.shape[1])), constant_values=-1)
+    latest_matrix = np.pad(latest_matrix, ((0, 0), (0, width - latest_matrix.shape[1])), constant_values=-1)
+
+    shortest_levels = np.minimum(curr_levels, latest_levels)
+    columns = np.arange(width)
+    # Levels where latest is greater than current, only up to the length of the shortest version number.
+    greater = (latest_matrix > curr_matrix) & (columns < shortest_levels[:, None])
+    greater_before_frontier = greater[:, :max(version_frontier, 0)].any(axis=1)
+    greater_after_frontier = greater[:, max(version_frontier, 0):].any(axis=1)
+    always = (version_frontier <= 0) | (version_frontier > shortest_levels)
+    equal = np.array([c == l for c, l in zip(curr_version_numbers, latest_version_numbers)], dtype=bool)
+    update = np.where(always, True, 
+        np.where(equal | greater_before_frontier, False, 
+        np.where(greater_after_frontier, True, shortest_levels == curr_levels)))
+
+    for row in np.flatnonzero(~(curr_is_numeric & latest_is_numeric)):
+        update[row] = perform_automatic_update(curr_version_numbers[row], latest_version_numbers[row], version_frontier)
+    return update
+
+
+def _newer_than_batch(version_numbers:list, curr_version:Version) -> np.ndarray:
+    """ Vectorized comparison of many PEP 440 version numbers against the current version.
+    Numeric version numbers are compared as rows of an integer matrix padded with zeros, as PEP 440 ignores trailing zeros,
+    and the rest are compared one by one with their parsed versions.
+
+    Args:
+        version_numbers (list): PEP 440 version numbers, represented as strings.
+        curr_version (Version): The current version.
+
+    Returns:
+        np.ndarray: Boolean mask, True for the version numbers newer than the current one.
+    """
+    if len(version_numbers) == 0:
+        return np.zeros(0, dtype=bool)
+    matrix, _, is_numeric = _encode_release_matrix(version_numbers, 0)
+    curr_release = list(curr_version.release) if curr_version.epoch == 0 and not curr_version.is_prerelease and not curr_version.is_postrelease and not curr_version.is_devrelease and not curr_version.local else None
+    if curr_release is None:
+        is_numeric[:] = False
+        newer = np.zeros(len(version_numbers), dtype=bool)
+    else:
+        width = max(matrix.shape[1], len(curr_release))
+        matrix = np.pad(matrix, ((0, 0), (0, width - matrix.shape[1])), constant_values=0)
+        curr_row = np.array(curr_release + [0] * (width - len(curr_release)), dtype=np.int64)
+        different = matrix != curr_row
+        # The first different level decides which version is newer.
+        first_different = different.argmax(axis=1)
+        newer = different.any(axis=1) & (matrix[np.arange(len(version_numbers)), first_different] > curr_row[first_different])
+    for row in np.flatnonzero(~is_numeric):
+        newer[row] = parse_version(version_numbers[row]) > curr_version
+    return newer
+
+
+def _max_version_number(version_numbers:list) -> str:
+    """ Get the highest of some PEP 440 version numbers.
+    If all of them are numeric, the rows of their zero padded integer matrix are sorted lexicographically at once.
+
+    Args:
+        version_numbers (list): PEP 440 version numbers, represented as strings. It must not be empty.
+
+    Returns:
+        str: The highest version number, as given.
+    """
+    matrix, _, is_numeric = _encode_release_matrix(version_numbers, 0)
+    if is_numeric.all():
+        # np.lexsort uses the last key as the primary one.
+        return version_numbers[np.lexsort(matrix.T[::-1])[-1]]
+    return max(version_numbers, key=parse_version)
+
+
+def get_latest_version(versions:Iterable, filter:bool=False) -> str:
     """ Extracts the latest version available.
     It gives priority to the tag latest, if found.
+    The versions are traversed only once, so they can be a generator of tags, which stops being consumed as soon as the tag latest is found.
 
     Args:
-        versions (list): Versions available, represented as strings.
+        versions (Iterable): Versions available, represented as strings.
 
     Returns:
         str: The latest tag.
             If no latest version, or no PEP 440 style specified image is found, the empty string is returned.
     """    
-    if 'latest' in versions:
-        return 'latest'
-    elif filter:
-        versions = filter_pep404_versions(versions)['correct_format']
-    for idx, tag in enumerate(versions):
-        versions[idx] = Version(tag)
+    latest_version = None
+    for tag in versions:
+        if tag == 'latest':
+            return 'latest'
+        tag_version = parse_version(tag)
+        if tag_version is None:
+            if filter:
+                continue
+            raise InvalidVersion(f"Invalid version: '{tag}'")
+        if latest_version is None or tag_version > latest_version:
+            latest_version = tag_version
 
-    return str(max(versions)) if versions != [] else ''
+    return str(latest_version) if latest_version is not None else ''
     
 
 def get_latest_pep440_updatable_version(curr_version:str, img_versions:list, version_frontier:int) -> str:
@@ -84,8 +244,48 @@ def get_latest_pep440_updatable_version(curr_version:str, img_versions:list, ver
         str: The latest version to which an automatic update can be performed.
     """    
     correctly_formatted_versions = filter_pep404_versions(img_versions)['correct_format']
-    updatable_pep440_versions = [Version(v) for v in correctly_formatted_versions if Version(v) > Version(curr_version) and perform_automatic_update(curr_version, v, version_frontier)]
-    return str(max(updatable_pep440_versions)) if updatable_pep440_versions else ''
+    curr_version_obj = parse_version(curr_version)
+    if curr_version_obj is None:
+        raise InvalidVersion(f"Invalid version: '{curr_version}'")
+    updatable = _newer_than_batch(correctly_formatted_versions, curr_version_obj) \
+        & perform_automatic_update_batch(curr_version, correctly_formatted_versions, version_frontier)
+    updatable_pep440_versions = [v for v, u in zip(correctly_formatted_versions, updatable) if u]
+    return str(parse_version(_max_version_number(updatable_pep440_versions))) if updatable_pep440_versions else ''
+
+
+def get_latest_version_from_index(tags_index:SortedTagsIndex) -> str:
+    """ Extracts the latest version available from the sorted tags index of an image, without traversing all its tags.
+    It gives priority to the tag latest, if found. Only the tags that are not numeric version numbers, usually few, are traversed.
+
+    Args:
+        tags_index (SortedTagsIndex): The index of the tags of the image.
+
+    Returns:
+        str: The latest tag.
+            If no latest version, or no PEP 440 style specified image is found, the empty string is returned.
+    """
+    latest_numeric_version = tags_index.latest()
+    return get_latest_version(list(tags_index.other_tags) + ([latest_numeric_version] if latest_numeric_version is not None else []), filter=True)
+
+
+def get_latest_pep440_updatable_version_from_index(curr_version:str, tags_index:SortedTagsIndex, version_frontier:int) -> str:
+    """ Same as get_latest_pep440_updatable_version, but the numeric version numbers are queried from the sorted tags index of the image with binary searches,
+    and only the tags that are not numeric version numbers, usually few, are traversed.
+
+    Args:
+        curr_version (str): Current version of the image.
+        tags_index (SortedTagsIndex): The index of the tags of the image.
+        version_frontier (int): The limit between updating automatically and notifying the user.
+
+    Returns:
+        str: The latest version to which an automatic update can be performed.
+    """
+    if numeric_version_number_regex.match(curr_version) is None:
+        return get_latest_pep440_updatable_version(curr_version, list(tags_index.other_tags) + list(tags_index), version_frontier)
+    candidates = [tags_index.latest_updatable(curr_version, version_frontier), \
+        get_latest_pep440_updatable_version(curr_version, list(tags_index.other_tags), version_frontier)]
+    candidates = [parse_version(v) for v in candidates if v]
+    return str(max(candidates)) if candidates else ''
 
 
 def filter_pep404_versions(versions:list) -> dict:
@@ -123,11 +323,7 @@ def is_pep440(v:str) -> bool:
         bool: True if the version number follows the PEP 440 standard, False otherwise.
     """    
     if not isinstance(v, str): raise TypeError('The parameter v must be a string.')
-    try:
-        Version(v)
-        return True
-    except InvalidVersion:
-        return False
+    return parse_version(v) is not None
 
 
 def get_newest_docker_updatable_version(updatable_versions:dict, version_frontier:int, latest_version_number:str) -> str:
@@ -141,5 +337,11 @@ def get_newest_docker_updatable_version(updatable_versions:dict, version_frontie
     Returns:
         str: The latest version to which an automatic update can be performed.
     """    
-    latest_updatable_versions = [v for v in updatable_versions if perform_automatic_update(str(v), latest_version_number, version_frontier)]
-    return 'latest' if latest_updatable_versions == ['latest'] else updatable_versions[max(latest_updatable_versions)]
+    candidate_versions = list(updatable_versions)
+    updatable = perform_automatic_update_batch([str(v) for v in candidate_versions], latest_version_number, version_frontier)
+    latest_updatable_versions = [v for v, u in zip(candidate_versions, updatable) if u]
+    if not latest_updatable_versions:
+        return ''
+    if latest_updatable_versions == ['latest']:
+        return 'latest'
+    return updatable_versions[max(latest_updatable_versions)]
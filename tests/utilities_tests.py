@@ -1,8 +1,45 @@
 from src.utilities.dates_times import docker_str_to_datetime
-from src.docker_imgs.docker_versions_utilities import perform_automatic_update
+from packaging.version import Version
+from src.utilities.versions import perform_automatic_update, perform_automatic_update_batch, parse_version, is_pep440, get_latest_version, get_latest_pep440_updatable_version, \
+    get_latest_version_from_index, get_latest_pep440_updatable_version_from_index
+from src.utilities.tags_cache import TagsCache, tags_cache
+from src.utilities.single_flight import SingleFlight
+from src.utilities.scheduling import get_seconds_until_next_check, get_slot_offset_in_seconds
+from src.utilities.adaptive_polling import AdaptivePolling, estimate_release_interval, get_release_times
+from src.utilities.tags_index import SortedTagsIndex
+from src.utilities.logs_registry import LogRegistry, JSONLogRegistryStore, SQLiteLogRegistryStore
+from src.docker_imgs.dockerhub_api import get_updatable_dockerhub_imgs, get_dockerhub_tag_records, get_latest_img_date_dockerhub_api, _fetch_updatable_dockerhub_imgs
+from src.utilities.registry_http import RegistryHTTPClient
+from src.docker_imgs.namespaces import split_dockerhub_image_reference, NamespacesCache
+from src.utilities.internet_connection import ReachabilityMonitor
+from src.oci.api import split_oci_image_reference, iter_oci_imgs_tags, get_oci_manifest_digest, get_latest_digest, save_latest_digest, \
+    InvalidOCIImageReferenceException
+from src.utilities.registry_http import RegistryResponse
+from src.utilities.rate_limiter import TokenBucket, PRIORITY_PENDING_DECISION, PRIORITY_REFRESH, PendingDecisions, get_image_request_priority
+from src.utilities.logging_messages import updates_logs
+from src.utilities.notifications import NotificationsDispatcher, NotificationsDigest, SMTPSession, TelegramSender
+from src.utilities.logging_system import email_logging, telegram_logging
+from src.gitlab.api import iter_gitlab_imgs_tags
+from src.kube.deployments_informer import DeploymentsInformer
+from src.kube.kubernetes_api import BearerTokenCache, CanNotGetBearerTokenException, get_bearer_token, get_api_instance, get_running_image_digest, _invalidate_bearer_token_if_unauthorized
+from kubernetes import client as kubernetes_client
+from kubernetes.client.rest import ApiException
 
 import unittest
-from datetime import datetime
+import random
+from tempfile import TemporaryDirectory
+from os import listdir, environ
+from os.path import join
+from unittest.mock import call, patch, MagicMock
+from types import SimpleNamespace
+from smtplib import SMTPServerDisconnected
+import requests
+import gitlab
+from threading import Event, Thread
+from json import dumps
+from time import time
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta
 
 
 class UtilitiesTests(unittest.TestCase):
@@ -80,6 +117,664 @@ class UtilitiesTests(unittest.TestCase):
         curr_version_number = '3.1.5'
         self.assertEqual(perform_automatic_update(curr_version_number, latest_version_number, version_frontier), True)
 
+        #Levels are compared as integers
+        self.assertEqual(perform_automatic_update('3.9.1', '3.10.1', 2), False)
+        self.assertEqual(perform_automatic_update('3.9.9', '3.9.10', 2), True)
+
+
+    def test_docker_perform_automatic_update_batch(self) -> None:
+        """ Tests that the vectorized update checking matches perform_automatic_update, on a randomly generated corpus of version numbers.
+        """
+        rng = random.Random(440)
+        random_version_number = lambda: '.'.join(str(rng.choice([0, 1, 2, 9, 10, 11, 123])) for _ in range(rng.randint(1, 5)))
+        corpus = [random_version_number() for _ in range(300)] + ['latest', '1.0rc1', '2.0.post1', '3.2-alpine']
+        for version_frontier in range(-1, 7):
+            for curr_version_number in corpus[:40] + ['latest', '1.0rc1']:
+                expected = [perform_automatic_update(curr_version_number, v, version_frontier) for v in corpus]
+                self.assertEqual(list(perform_automatic_update_batch(curr_version_number, corpus, version_frontier)), expected)
+                expected = [perform_automatic_update(v, curr_version_number, version_frontier) for v in corpus]
+                self.assertEqual(list(perform_automatic_update_batch(corpus, curr_version_number, version_frontier)), expected)
+            #Selection of the latest updatable version matches the one made with the scalar function.
+            pep440_corpus = [v for v in corpus if is_pep440(v)]
+            for curr_version_number in corpus[:40]:
+                updatable = [parse_version(v) for v in pep440_corpus if parse_version(v) > parse_version(curr_version_number) and perform_automatic_update(curr_version_number, v, version_frontier)]
+                expected = str(max(updatable)) if updatable else ''
+                self.assertEqual(get_latest_pep440_updatable_version(curr_version_number, corpus, version_frontier), expected)
+
+
+    def test_sorted_tags_index(self) -> None:
+        """ Tests the binary search queries of the sorted tags index against the linear selection of versions.
+        """
+        tags_index = SortedTagsIndex(['3.9.1', '3.10.0', '3.10.2', '3.9', '4.0.1', 'latest', '3.10.3rc1'])
+        self.assertEqual(tags_index.latest(), '4.0.1')
+        self.assertEqual(tags_index.latest_with_prefix((3, 9)), '3.9.1')
+        self.assertEqual(tags_index.latest_with_prefix((3, 1)), None)
+        tags_index.update(['3.9.1', '3.10.0', '3.10.2', '3.9', '3.10.5', 'latest'])
+        self.assertEqual(tags_index.latest(), '3.10.5')
+        self.assertEqual(tags_index.latest_updatable('3.10.0', 2), '3.10.5')
+        self.assertEqual(tags_index.other_tags, {'latest'})
+        self.assertEqual(get_latest_version_from_index(tags_index), 'latest')
+
+        rng = random.Random(10)
+        random_version_number = lambda: '.'.join(str(rng.choice([0, 1, 2, 9, 10, 11])) for _ in range(rng.randint(1, 4)))
+        corpus = [random_version_number() for _ in range(200)] + ['1.0rc1', '2.0.post1', '3.2-alpine']
+        tags_index = SortedTagsIndex(corpus)
+        for version_frontier in range(-1, 6):
+            for curr_version_number in corpus[:60]:
+                expected = get_latest_pep440_updatable_version(curr_version_number, corpus, version_frontier)
+                result = get_latest_pep440_updatable_version_from_index(curr_version_number, tags_index, version_frontier)
+                self.assertEqual(parse_version(result) if result else '', parse_version(expected) if expected else '')
+
+
+    def test_tags_cache(self) -> None:
+        """ Tests the expiration, LRU eviction and counters of the tags cache.
+        """
+        with patch('src.utilities.tags_cache.monotonic') as monotonic:
+            monotonic.return_value = 0
+            cache = TagsCache(ttl_in_seconds=10, max_size=2)
+            fetches = []
+            fetch = lambda: fetches.append(1) or ['1.0', '1.1']
+            self.assertEqual(cache.get_or_fetch(('dockerhub', 'library', 'nginx'), fetch), ['1.0', '1.1'])
+            self.assertEqual(cache.get_or_fetch(('dockerhub', 'library', 'nginx'), fetch), ['1.0', '1.1'])
+            self.assertEqual(len(fetches), 1)
+            #Values returned are copies, modifying them does not modify the cache.
+            cache.get(('dockerhub', 'library', 'nginx')).append('2.0')
+            self.assertEqual(cache.get(('dockerhub', 'library', 'nginx')), ['1.0', '1.1'])
+            #Least recently used entry is evicted.
+            cache.set(('gitlab', '1', 'a'), ['1'])
+            cache.set(('gitlab', '1', 'b'), ['2'])
+            self.assertIsNone(cache.get(('dockerhub', 'library', 'nginx')))
+            self.assertEqual(cache.get(('gitlab', '1', 'a')), ['1'])
+            #Expired entries are fetched again.
+            monotonic.return_value = 10
+            self.assertIsNone(cache.get(('gitlab', '1', 'a')))
+            self.assertEqual(cache.stats(), {'size': 1, 'hits': 4, 'misses': 3, 'evictions': 1, 'expirations': 1})
+
+
+    def test_parse_version_cache(self) -> None:
+        """ Tests that tags are parsed once, and that invalid tags are remembered as well.
+        """
+        parse_version.cache_clear()
+        self.assertEqual(get_latest_version(['1.2', '1.10', 'alpine'], filter=True), '1.10')
+        self.assertTrue(is_pep440('1.10'))
+        self.assertFalse(is_pep440('alpine'))
+        self.assertIsNone(parse_version('alpine'))
+        self.assertEqual(parse_version.cache_info().misses, 3)
+        self.assertEqual(parse_version.cache_info().hits, 3)
+
+
+    def test_single_flight(self) -> None:
+        """ Tests that concurrent calls with the same key wait for a single fetch, and share its result or its exception.
+        """
+        single_flight = SingleFlight()
+        release = Event()
+        fetches = []
+        def fetch() -> list:
+            fetches.append(1)
+            release.wait(5)
+            return ['1.0', '1.1']
+        results = []
+        callers = [Thread(target=lambda: results.append(single_flight.do(('dockerhub', 'library', 'nginx', '1.21'), fetch))) for _ in range(5)]
+        for caller in callers:
+            caller.start()
+        while single_flight.stats()['calls'] < 5:
+            release.wait(0.01)
+        release.set()
+        for caller in callers:
+            caller.join()
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(results, [['1.0', '1.1']] * 5)
+        self.assertEqual(single_flight.stats(), {'calls': 5, 'executions': 1, 'coalesced': 4, 'in_flight': 0, 'dedup_ratio': 0.8})
+        with self.assertRaises(ValueError):
+            single_flight.do('failing', lambda: int('not a number'))
+        self.assertEqual(single_flight.stats()['in_flight'], 0)
+
+
+    def test_sharded_scheduling(self) -> None:
+        """ Tests that the objects are spread over the interval, and that each one is checked once per interval, on its slot.
+        """
+        offsets = [get_slot_offset_in_seconds(f'uid-{i}', 100) for i in range(1000)]
+        self.assertTrue(all(0 <= offset < 100 for offset in offsets))
+        self.assertEqual(len({int(offset // 10) for offset in offsets}), 10)
+        self.assertEqual(get_slot_offset_in_seconds('uid-1', 100), offsets[1])
+        for jitter in [0, 10]:
+            #The daemon of the object sleeps until its next check, which takes 3 seconds.
+            now, checks = 1000, []
+            for _ in range(4):
+                now += get_seconds_until_next_check('uid-1', now, 100, jitter)
+                checks.append(now)
+                now += 3
+            self.assertLess(checks[0] - 1000, 100 + jitter)
+            self.assertTrue(all(0 <= (check - offsets[1]) % 100 <= jitter for check in checks))
+            self.assertEqual([round((check - offsets[1]) // 100) for check in checks], [10, 11, 12, 13])
+
+
+    def test_adaptive_polling(self) -> None:
+        """ Tests that images released often are checked on every tick, and dormant ones less often, within the bounds.
+        """
+        polling = AdaptivePolling(factor=0.25, min_interval_in_seconds=600, max_interval_in_seconds=86400, max_size=10)
+        now = datetime(2022, 6, 15, 12)
+        now_timestamp = (now - datetime(1970, 1, 1)).total_seconds()
+        #Released every 4 hours, with the tags of each release pushed together.
+        busy_dates = [now - timedelta(hours=4 * i, minutes=m) for i in range(5) for m in (0, 5)]
+        self.assertEqual(polling.schedule('ns/deploy/busy:1.0', now_timestamp, busy_dates), 3600)
+        #Not released for a year.
+        self.assertEqual(polling.schedule('ns/deploy/dormant:1.0', now_timestamp, [now - timedelta(days=365)]), 86400)
+        self.assertEqual(polling.schedule('ns/deploy/unknown:1.0', now_timestamp, []), 600)
+        self.assertTrue(polling.is_due('ns/deploy/unknown:1.0', now_timestamp + 600))
+        self.assertFalse(polling.is_due('ns/deploy/dormant:1.0', now_timestamp + 3600))
+        self.assertTrue(polling.is_due('ns/deploy/dormant:1.0', now_timestamp + 86400))
+        #The dates seen before are kept, so a new release tightens the interval again.
+        self.assertEqual(polling.schedule('ns/deploy/busy:1.0', now_timestamp + 4 * 3600, [now + timedelta(hours=4)]), 3600)
+        #Released every day and checked 20 hours after its last release: checked again in a quarter of its cadence, as its next release approaches.
+        daily_dates = [now - timedelta(hours=20, days=i) for i in range(7)]
+        self.assertEqual(polling.schedule('ns/deploy/daily:1.0', now_timestamp, daily_dates), 21600)
+        daily_times = [now_timestamp - 20 * 3600 - 86400 * i for i in range(7)]
+        self.assertEqual(estimate_release_interval(get_release_times(daily_times), now_timestamp), 86400)
+        #Not released for more than twice its cadence, it is considered dormant.
+        self.assertEqual(estimate_release_interval(get_release_times(daily_times), now_timestamp + 2 * 86400), 68 * 3600)
+
+
+    def test_log_registry(self) -> None:
+        """ Tests that the logs registry is kept in memory, up to its maximum size, and only the changed entries are written to the store when flushing.
+        """
+        with TemporaryDirectory() as directory:
+            registry = LogRegistry(JSONLogRegistryStore(join(directory, 'json')))
+            self.assertTrue(registry.check_and_set('vh', 'ns/deployment/nginx:1.21', 'no_update'))
+            self.assertFalse(registry.check_and_set('vh', 'ns/deployment/nginx:1.21', 'no_update'))
+            self.assertTrue(registry.check_and_set('vh', 'ns/deployment/nginx:1.21', 'update_to_latest_overall_version'))
+            self.assertEqual(listdir(directory), [])
+            registry.flush()
+            self.assertEqual(listdir(join(directory, 'json')), ['vh.json'])
+            #A new process loads the registry once from disk.
+            registry = LogRegistry(JSONLogRegistryStore(join(directory, 'json')))
+            self.assertEqual(registry.get('vh', 'ns/deployment/nginx:1.21'), 'update_to_latest_overall_version')
+            self.assertFalse(registry.check_and_set('vh', 'ns/deployment/nginx:1.21', 'update_to_latest_overall_version'))
+            registry.expire(['vh'])
+            self.assertEqual(listdir(join(directory, 'json')), [])
+
+            #Same behaviour with the SQLite store, whose entries are read one at a time.
+            path = join(directory, 'logs_registry.sqlite3')
+            registry = LogRegistry(SQLiteLogRegistryStore(path))
+            self.assertTrue(registry.check_and_set('vh', 'ns/deployment/nginx:1.21', 'no_update'))
+            self.assertTrue(registry.check_and_set('vh2', 'ns/deployment/redis:7', 'no_update'))
+            registry.flush()
+            registry = LogRegistry(SQLiteLogRegistryStore(path))
+            self.assertEqual(registry.get('vh', 'ns/deployment/nginx:1.21'), 'no_update')
+            self.assertIsNone(registry.get('vh', 'ns/deployment/redis:7'))
+            registry.expire(['vh'])
+            registry = LogRegistry(SQLiteLogRegistryStore(path))
+            self.assertIsNone(registry.get('vh', 'ns/deployment/nginx:1.21'))
+            self.assertEqual(registry.get('vh2', 'ns/deployment/redis:7'), 'no_update')
+
+            #Only the most recently used entries are kept in memory once written, the others are read again from the store.
+            registry = LogRegistry(SQLiteLogRegistryStore(path), max_size=2)
+            for i in range(4):
+                self.assertTrue(registry.check_and_set('vh3', f'ns/deployment/app{i}:1.0', 'no_update'))
+            #The entries not written yet are kept whatever the size.
+            self.assertEqual(len(registry._entries), 4)
+            registry.flush()
+            self.assertEqual(list(registry._entries), [('vh3', 'ns/deployment/app2:1.0'), ('vh3', 'ns/deployment/app3:1.0')])
+            self.assertFalse(registry.check_and_set('vh3', 'ns/deployment/app0:1.0', 'no_update'))
+            self.assertEqual(list(registry._entries), [('vh3', 'ns/deployment/app3:1.0'), ('vh3', 'ns/deployment/app0:1.0')])
+            #Same with the json store, which keeps the registries it wrote.
+            registry = LogRegistry(JSONLogRegistryStore(join(directory, 'json')), max_size=1)
+            self.assertTrue(registry.check_and_set('vh', 'ns/deployment/nginx:1.21', 'no_update'))
+            self.assertTrue(registry.check_and_set('vh', 'ns/deployment/redis:7', 'no_update'))
+            registry.flush()
+            self.assertEqual(len(registry._entries), 1)
+            self.assertFalse(registry.check_and_set('vh', 'ns/deployment/nginx:1.21', 'no_update'))
+            self.assertFalse(registry.check_and_set('vh', 'ns/deployment/redis:7', 'no_update'))
+
+
+    def test_notifications_dispatcher(self) -> None:
+        """ Tests that notifications are sent in the background, that failures and discarded notifications are counted,
+        and that the SMTP session is reused and opened again when the connection is lost.
+        """
+        started, release = Event(), Event()
+        sent, failures = [], []
+        dispatcher = NotificationsDispatcher(max_size=1, workers=1)
+        self.assertTrue(dispatcher.submit('email', lambda: started.set() or release.wait(5) and sent.append(1)))
+        #The worker is blocked on the first notification, the second one fills the queue and the third one is discarded.
+        started.wait(5)
+        self.assertTrue(dispatcher.submit('telegram', lambda: 1 / 0, failures.append))
+        self.assertFalse(dispatcher.submit('email', lambda: sent.append(1)))
+        release.set()
+        dispatcher.stop()
+        stats = dispatcher.stats()
+        self.assertEqual((len(sent), len(failures), stats['sent'], stats['failed'], stats['dropped']), (1, 1, 1, 1, 1))
+        self.assertIn('ZeroDivisionError', failures[0])
+        self.assertEqual(stats['latency']['email']['count'], 1)
+        #A failing on_failure does not stop the worker.
+        dispatcher = NotificationsDispatcher(max_size=10, workers=1)
+        with patch('src.utilities.logging_system.stdout_logging') as stdout_logging:
+            self.assertTrue(dispatcher.submit('telegram', lambda: 1 / 0, lambda traceback: 1 / 0))
+            self.assertTrue(dispatcher.submit('email', lambda: sent.append(2)))
+            dispatcher.stop()
+        self.assertEqual(sent, [1, 2])
+        self.assertEqual(stdout_logging.call_count, 1)
+
+        with patch('src.utilities.notifications.SMTP') as smtp:
+            server = MagicMock()
+            smtp.return_value = server
+            session = SMTPSession()
+            session.send(MagicMock(), 'localhost', 25, 'operator@example.com', '')
+            session.send(MagicMock(), 'localhost', 25, 'operator@example.com', '')
+            self.assertEqual(smtp.call_count, 1)
+            server.send_message.side_effect = [SMTPServerDisconnected(), None]
+            session.send(MagicMock(), 'localhost', 25, 'operator@example.com', '')
+            self.assertEqual(smtp.call_count, 2)
+            self.assertEqual(server.login.call_count, 2)
+
+
+    def test_notifications_failures_logging(self) -> None:
+        """ Tests that a failed Telegram message and a discarded notification are logged through stdout, once per image.
+        """
+        notifications_env = {'TELEGRAM_TOKEN': 'token', 'TELEGRAM_CHAT_ID': '1', 'EMAIL_HOST': 'localhost', 'EMAIL_SENDER': 'operator@example.com', \
+            'EMAIL_RECIPIENT': 'user@example.com', 'EMAIL_PASSWORD': '', 'EMAIL_PORT': '25', 'INTERNET_AVAILABLE': 'true', 'NOTIFICATIONS_DIGEST': 'false'}
+        with TemporaryDirectory() as directory, patch.dict(environ, notifications_env), \
+                patch('src.utilities.logging_system.log_registry', LogRegistry(JSONLogRegistryStore(directory))), \
+                patch('src.utilities.logging_system.stdout_logging') as stdout_logging, \
+                patch('src.utilities.logging_system._send_telegram_message', side_effect=requests.ConnectionError('unreachable')):
+            dispatcher = NotificationsDispatcher(max_size=10, workers=1)
+            with patch('src.utilities.logging_system.notifications_dispatcher', dispatcher):
+                telegram_logging('ns/deploy/nginx:1.21', 'vh', 'subject', 'message')
+                telegram_logging('ns/deploy/nginx:1.21', 'vh', 'subject', 'message')
+                dispatcher.stop()
+            self.assertEqual(dispatcher.stats()['failed'], 2)
+            self.assertEqual([c.args[0] for c in stdout_logging.call_args_list], ['Telegram logging failed'])
+            stdout_logging.reset_mock()
+            full_dispatcher = MagicMock()
+            full_dispatcher.submit.return_value = False
+            full_dispatcher.stats.return_value = {'queue_depth': 10}
+            with patch('src.utilities.logging_system.notifications_dispatcher', full_dispatcher):
+                email_logging('ns/deploy/nginx:1.21', 'vh', 'subject', 'message')
+                telegram_logging('ns/deploy/nginx:1.21', 'vh', 'subject', 'message')
+            self.assertEqual([c.args[0] for c in stdout_logging.call_args_list], ['Notifications queue full'] * 2)
+
+
+    def test_notifications_digest(self) -> None:
+        """ Tests that the notifications of a window are sent as one message per channel.
+        """
+        sent = []
+        dispatcher = NotificationsDispatcher(max_size=10, workers=1)
+        digest = NotificationsDigest(dispatcher, window_in_seconds=3600)
+        send = lambda subject, message: sent.append((subject, message))
+        digest.add('email', '[Update!] - Image: nginx', 'Updated nginx', send)
+        digest.add('email', '[No update!] - Image: redis', 'Did not update redis', send)
+        digest.add('telegram', '[Update!] - Image: nginx', 'Updated nginx', send)
+        digest.stop()
+        dispatcher.stop()
+        self.assertEqual(len(sent), 2)
+        subject, message = sorted(sent)[0]
+        self.assertEqual(subject, '[Digest] 2 notifications')
+        self.assertIn('- [Update!] - Image: nginx\n- [No update!] - Image: redis', message)
+        self.assertIn('Did not update redis', message)
+        self.assertIn(('[Update!] - Image: nginx', 'Updated nginx'), sent)
+        #A digest discarded because the queue is full is reported, and so are the failures, to the handlers of all its notifications.
+        full_dispatcher = MagicMock()
+        full_dispatcher.submit.return_value = False
+        digest = NotificationsDigest(full_dispatcher, window_in_seconds=3600)
+        queue_full, failures = [], []
+        for image in ['nginx', 'redis']:
+            digest.add('email', f'[Update!] - Image: {image}', f'Updated {image}', send, lambda traceback, image=image: failures.append(image), \
+                lambda image=image: queue_full.append(image))
+        digest.stop()
+        self.assertEqual(queue_full, ['nginx', 'redis'])
+        full_dispatcher.submit.call_args.args[2]('traceback')
+        self.assertEqual(failures, ['nginx', 'redis'])
+
+
+    def test_telegram_sender(self) -> None:
+        """ Tests that pending Telegram messages are merged up to the length limit, and that rate limited messages are sent again after retry_after.
+        """
+        sender = TelegramSender(max_retries=1)
+        rate_limited, ok = MagicMock(status_code=429), MagicMock(status_code=200)
+        rate_limited.json.return_value = {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 0}}
+        sender.session.post = MagicMock(side_effect=[rate_limited, ok, ok])
+        for text in ['a' * 3000, 'b' * 1000, 'c' * 1000]:
+            sender.enqueue('token', 'chat', text)
+        sender.flush('token', 'chat')
+        texts = [call.kwargs['data']['text'] for call in sender.session.post.call_args_list]
+        self.assertEqual(texts, ['a' * 3000 + '\n\n' + 'b' * 1000] * 2 + ['c' * 1000])
+        #Nothing is left to send.
+        sender.flush('token', 'chat')
+        self.assertEqual(sender.session.post.call_count, 3)
+        #A message that can not be sent is kept with the following ones, and they are sent again by a scheduled flush.
+        sender = TelegramSender(max_retries=1, retry_delay_in_seconds=0.01)
+        sent_again = Event()
+        sender.session.post = MagicMock(side_effect=[ok, requests.ConnectionError('Connection reset'), ok, MagicMock(status_code=200, **{'raise_for_status.side_effect': sent_again.set})])
+        for text in ['a' * 3000, 'b' * 3000, 'c' * 3000]:
+            sender.enqueue('token', 'chat', text)
+        sender.flush('token', 'chat')
+        self.assertTrue(sent_again.wait(5))
+        texts = [call.kwargs['data']['text'] for call in sender.session.post.call_args_list]
+        self.assertEqual(texts, ['a' * 3000, 'b' * 3000, 'b' * 3000, 'c' * 3000])
+        #Once max_retries flushes fail, the error is reported, and the messages are still kept.
+        sender = TelegramSender(max_retries=0)
+        sender.session.post = MagicMock(side_effect=requests.Timeout('Timed out'))
+        sender.enqueue('token', 'chat', 'a')
+        self.assertRaises(requests.Timeout, sender.flush, 'token', 'chat')
+        self.assertEqual(list(sender._pending[('token', 'chat')]), ['a'])
+        #A message rejected by Telegram is discarded.
+        rejected = MagicMock(status_code=400, **{'raise_for_status.side_effect': requests.HTTPError(response=MagicMock(status_code=400))})
+        sender.session.post = MagicMock(side_effect=[rejected])
+        self.assertRaises(requests.HTTPError, sender.flush, 'token', 'chat')
+        self.assertEqual(list(sender._pending[('token', 'chat')]), [])
+
+
+    def test_reachability_monitor(self) -> None:
+        """ Tests that the status of each endpoint is kept until its time to live expires, and that endpoints not probed are considered reachable.
+        """
+        with patch('src.utilities.internet_connection.monotonic') as monotonic:
+            monotonic.return_value = 0
+            monitor = ReachabilityMonitor(check_interval_in_seconds=30, ttl_in_seconds=90, timeout_in_seconds=1)
+            monitor.register('dockerhub', 'https://hub.docker.com')
+            monitor.register('mirror', 'https://mirror.local:5000')
+            self.assertTrue(monitor.is_reachable('mirror'))
+            #Error responses mean the endpoint is reachable, connection errors do not.
+            def head(url:str, **_:dict) -> MagicMock:
+                if 'mirror' in url:
+                    raise requests.ConnectionError()
+                return MagicMock(status_code=401)
+            monitor.session.head = head
+            monitor.probe()
+            self.assertTrue(monitor.is_reachable('dockerhub'))
+            self.assertFalse(monitor.is_reachable('mirror'))
+            self.assertTrue(monitor.is_reachable('gitlab'))
+            monotonic.return_value = 90
+            self.assertTrue(monitor.is_reachable('mirror'))
+
+
+    def test_dockerhub_namespaces(self) -> None:
+        """ Tests that namespaces are taken from the image references, and that the ones searched are kept across restarts until they expire.
+        """
+        self.assertEqual(split_dockerhub_image_reference('nginx'), ('library', 'nginx'))
+        self.assertEqual(split_dockerhub_image_reference('bitnami/redis'), ('bitnami', 'redis'))
+        self.assertEqual(split_dockerhub_image_reference('docker.io/library/nginx'), ('library', 'nginx'))
+        self.assertEqual(split_dockerhub_image_reference('docker.io/nginx'), ('library', 'nginx'))
+        with TemporaryDirectory() as directory, patch('src.docker_imgs.namespaces.time') as time:
+            time.return_value = 0
+            searches = []
+            search = lambda: searches.append(1) or 'bitnami'
+            self.assertEqual(NamespacesCache(join(directory, 'namespaces.json'), 100).get_or_search('redis', search), 'bitnami')
+            self.assertEqual(NamespacesCache(join(directory, 'namespaces.json'), 100).get_or_search('redis', search), 'bitnami')
+            self.assertEqual(len(searches), 1)
+            time.return_value = 100
+            self.assertIsNone(NamespacesCache(join(directory, 'namespaces.json'), 100).get('redis'))
+
+
+    def test_dockerhub_tag_records(self) -> None:
+        """ Tests that the dates of the current and latest tags are taken from the tags listing, without requesting them one by one.
+        """
+        page = {'count': 4, 'results': [
+            {'name': 'latest', 'last_updated': '2022-06-15T13:14:25.654498Z', 'digest': 'sha256:c'},
+            {'name': '1.23', 'last_updated': '2022-06-15T13:14:25.654498Z', 'digest': 'sha256:c'},
+            {'name': '1.22', 'last_updated': '2022-05-01T10:00:00.000000Z', 'digest': 'sha256:b'},
+            {'name': '1.21', 'last_updated': '2022-04-01T10:00:00.000000Z', 'digest': 'sha256:a'}]}
+        with patch('src.docker_imgs.dockerhub_api.registry_http_client') as client:
+            client.get_json.return_value = page
+            self.assertEqual(list(get_updatable_dockerhub_imgs('records-test', 'library', '1.21', 'vh', 'img').values()), ['1.23', '1.22'])
+            tag_records = get_dockerhub_tag_records('records-test', 'library', '1.21', 'vh', 'img')
+            self.assertEqual(tag_records['1.21'].digest, 'sha256:a')
+            self.assertEqual(get_latest_img_date_dockerhub_api('library', 'records-test', '1.21', 'vh', 'img', tag_records), '2022-04-01T10:00:00.000000Z')
+            self.assertEqual(get_latest_img_date_dockerhub_api('library', 'records-test', 'latest', 'vh', 'img', tag_records), '2022-06-15T13:14:25.654498Z')
+            self.assertEqual(client.get_json.call_count, 1)
+            #Once the cached entry expires, only the tags pushed since the newest one seen are read, and merged.
+            tags_cache.invalidate(('dockerhub', 'library', 'records-test', '1.21'))
+            newer_page = {'count': 5, 'next': 'page=2', 'results': [
+                {'name': '1.24', 'last_updated': '2022-07-01T10:00:00.000000Z', 'digest': 'sha256:d'},
+                {'name': 'latest', 'last_updated': '2022-07-01T10:00:00.000000Z', 'digest': 'sha256:d'},
+                {'name': '1.23', 'last_updated': '2022-06-15T13:14:25.654498Z', 'digest': 'sha256:c'},
+                {'name': '1.22', 'last_updated': '2022-05-01T10:00:00.000000Z', 'digest': 'sha256:b'}]}
+            client.get_json.return_value = newer_page
+            self.assertEqual(sorted(get_updatable_dockerhub_imgs('records-test', 'library', '1.21', 'vh', 'img').values()), ['1.22', '1.23', '1.24'])
+            self.assertIn('ordering=last_updated', client.get_json.call_args.args[0])
+            self.assertEqual(client.get_json.call_count, 2)
+            self.assertEqual(get_dockerhub_tag_records('records-test', 'library', '1.21', 'vh', 'img')['latest'].digest, 'sha256:d')
+
+
+    def test_registry_http_client(self) -> None:
+        """ Tests that validators are sent back, that 304 responses are served from the stored bodies, and the counters of each host.
+        """
+        client = RegistryHTTPClient(timeout_in_seconds=1, pool_maxsize=2, max_cached_responses=10)
+        session = MagicMock()
+        session.request.side_effect = [MagicMock(status_code=200, headers={'ETag': '"v1"'}, content=dumps({'count': 1}).encode()), \
+            MagicMock(status_code=304, headers={}, content=b'')]
+        with patch.object(client, '_get_session', return_value=session):
+            self.assertEqual(client.get_json('https://hub.docker.com/v2/repositories/library/nginx/tags/'), {'count': 1})
+            self.assertEqual(client.get_json('https://hub.docker.com/v2/repositories/library/nginx/tags/'), {'count': 1})
+        self.assertEqual(session.request.call_args.kwargs['headers'], {'If-None-Match': '"v1"'})
+        self.assertEqual(client.stats(), {'hub.docker.com': {'requests': 2, 'bytes': 12, 'not_modified': 1, 'errors': 0}})
+
+
+    def test_oci_registry(self) -> None:
+        """ Tests the image references, the Link header pagination of the tags, and the detection of latest moving from its digest.
+        """
+        self.assertEqual(split_oci_image_reference('registry.local:5000/team/app:1.2'), ('registry.local:5000', 'team/app', '1.2'))
+        self.assertEqual(split_oci_image_reference('registry.local:5000/app'), ('registry.local:5000', 'app', 'latest'))
+        self.assertEqual(split_oci_image_reference('localhost/app:1.2'), ('localhost', 'app', '1.2'))
+        self.assertEqual(split_oci_image_reference('quay.io/team/app@sha256:a'), ('quay.io', 'team/app', 'latest'))
+        #Without registry host.
+        for img_reference in ['team/app:1.2', 'nginx:1.2', 'nginx', 'registry.local:5000']:
+            self.assertRaises(InvalidOCIImageReferenceException, split_oci_image_reference, img_reference)
+        with patch('src.oci.api.registry_http_client') as client:
+            client.get.side_effect = [RegistryResponse(200, {'Link': '</v2/app/tags/list?n=2&last=1.1>; rel="next"'}, dumps({'name': 'app', 'tags': ['1.0', '1.1']}).encode(), False), \
+                RegistryResponse(200, {}, dumps({'name': 'app', 'tags': ['1.2']}).encode(), False)]
+            self.assertEqual(list(iter_oci_imgs_tags('registry.local:5000', 'app')), ['1.0', '1.1', '1.2'])
+            self.assertEqual(client.get.call_args.args[0], 'https://registry.local:5000/v2/app/tags/list?n=2&last=1.1')
+            client.head.return_value = RegistryResponse(200, {'Docker-Content-Digest': 'sha256:a'}, b'', False)
+            self.assertEqual(get_oci_manifest_digest('registry.local:5000', 'app', 'latest', 'vh', 'img'), 'sha256:a')
+        self.assertEqual(get_latest_digest('ns/deploy/registry.local:5000/app:latest', 'sha256:a'), 'sha256:a')
+        #Until the deployment is updated to the digest, latest is still seen as moved.
+        self.assertEqual(get_latest_digest('ns/deploy/registry.local:5000/app:latest', 'sha256:b'), 'sha256:a')
+        self.assertEqual(get_latest_digest('ns/deploy/registry.local:5000/app:latest', 'sha256:b'), 'sha256:a')
+        save_latest_digest('ns/deploy/registry.local:5000/app:latest', 'sha256:b')
+        self.assertEqual(get_latest_digest('ns/deploy/registry.local:5000/app:latest', 'sha256:b'), 'sha256:b')
+        #After a restart of the operator, the digest the pods run is read instead, so a push made in between is applied.
+        pod = SimpleNamespace(status=SimpleNamespace(container_statuses=[SimpleNamespace(name='sidecar', image_id='registry.local:5000/proxy@sha256:s'), \
+            SimpleNamespace(name='app', image_id='registry.local:5000/app@sha256:r')]))
+        deployment = SimpleNamespace(metadata=SimpleNamespace(namespace='ns'), spec=SimpleNamespace(selector=SimpleNamespace(match_labels={'app': 'deploy'})))
+        api_instance = MagicMock()
+        api_instance.list_namespaced_pod.return_value = SimpleNamespace(items=[pod])
+        self.assertEqual(get_running_image_digest(api_instance, deployment, 'app'), 'sha256:r')
+        self.assertEqual(api_instance.list_namespaced_pod.call_args, call('ns', label_selector='app=deploy'))
+        self.assertEqual(get_latest_digest('ns/other/registry.local:5000/app:latest', 'sha256:b', lambda: get_running_image_digest(api_instance, deployment, 'app')), 'sha256:r')
+        self.assertEqual(get_latest_digest('ns/other/registry.local:5000/app:latest', 'sha256:b', lambda: 'sha256:c'), 'sha256:r')
+        #Without any pod reporting it, the digest of latest is assumed to be running.
+        api_instance.list_namespaced_pod.side_effect = Exception('forbidden')
+        self.assertIsNone(get_running_image_digest(api_instance, deployment, 'app'))
+        self.assertEqual(get_latest_digest('ns/new/registry.local:5000/app:latest', 'sha256:b', lambda: None), 'sha256:b')
+
+
+    def test_registry_rate_limiter(self) -> None:
+        """ Tests that the tokens go to the pending decisions first, and that the bucket adapts to the rate limit headers.
+        """
+        bucket = TokenBucket(rate_per_second=5, burst=1)
+        self.assertTrue(bucket.acquire(PRIORITY_REFRESH, timeout_in_seconds=0))
+        self.assertFalse(bucket.acquire(PRIORITY_REFRESH, timeout_in_seconds=0))
+        order = []
+        waiting = [Thread(target=lambda p=p: bucket.acquire(p) and order.append(p)) for p in [PRIORITY_REFRESH, PRIORITY_PENDING_DECISION]]
+        with bucket._condition:
+            #Both requests wait in the queue before any token is given.
+            for thread in waiting:
+                thread.start()
+            while len(bucket._waiting) < 2:
+                bucket._condition.wait(0.01)
+        for thread in waiting:
+            thread.join()
+        self.assertEqual(order, [PRIORITY_PENDING_DECISION, PRIORITY_REFRESH])
+        bucket.observe(200, {'RateLimit-Remaining': '36;w=3600'})
+        self.assertEqual(bucket.rate_per_second, 0.01)
+        bucket.observe(429, {'Retry-After': '30'})
+        self.assertGreater(bucket.stats()['blocked_for_seconds'], 29)
+        self.assertEqual(bucket.stats()['throttled'], 1)
+        #Gitlab sends RateLimit-Reset as the unix time of the reset.
+        bucket = TokenBucket(rate_per_second=10, burst=10)
+        bucket.observe(200, {'RateLimit-Remaining': '1999', 'RateLimit-Reset': str(int(time()) + 60)})
+        self.assertEqual(bucket.rate_per_second, 10)
+        bucket.observe(200, {'RateLimit-Remaining': '30', 'RateLimit-Reset': str(int(time()) + 60)})
+        self.assertAlmostEqual(bucket.rate_per_second, 0.5, places=1)
+        for _ in range(10):
+            bucket.observe(200, {'RateLimit-Remaining': '1999', 'RateLimit-Reset': str(int(time()) + 60)})
+        self.assertEqual(bucket.rate_per_second, 10)
+        self.assertTrue(all(bucket.acquire(PRIORITY_REFRESH, timeout_in_seconds=1) for _ in range(15)))
+        #After a 429, the successful responses with RateLimit-Remaining but without window restore the rate.
+        bucket.observe(429, {})
+        self.assertEqual(bucket.rate_per_second, 5)
+        for _ in range(5):
+            bucket.observe(200, {'RateLimit-Remaining': '1999'})
+        self.assertEqual(bucket.rate_per_second, 10)
+
+
+    def test_kubernetes_bearer_token(self) -> None:
+        """ Tests that the bearer token of the ServiceAccount is only looked up again when it expires or is rejected,
+        and that it is only used to patch the deployments when the loaded configuration has no credentials.
+        """
+        jwt = lambda exp: f'header.{urlsafe_b64encode(dumps({"exp": exp}).encode()).decode().rstrip("=")}.signature'
+        with patch('src.kube.kubernetes_api.get_bearer_token', side_effect=[jwt(1000), jwt(2000), jwt(3000)]) as lookup, \
+            patch('src.kube.kubernetes_api.time') as now:
+            cache = BearerTokenCache('default', 'kube-system', expiration_margin_in_seconds=60)
+            now.return_value = 100
+            self.assertEqual(cache.get(None, 'vh', 'img'), jwt(1000))
+            now.return_value = 900
+            self.assertEqual(cache.get(None, 'vh', 'img'), jwt(1000))
+            self.assertEqual(lookup.call_count, 1)
+            #Within the expiration margin.
+            now.return_value = 950
+            self.assertEqual(cache.get(None, 'vh', 'img'), jwt(2000))
+            self.assertEqual(lookup.call_count, 2)
+            #Only a 401 response means that the token was rejected.
+            with patch('src.kube.kubernetes_api._bearer_token_cache', cache):
+                _invalidate_bearer_token_if_unauthorized(ApiException(status=403))
+                self.assertEqual(cache.get(None, 'vh', 'img'), jwt(2000))
+                _invalidate_bearer_token_if_unauthorized(ApiException(status=401))
+                self.assertEqual(cache.get(None, 'vh', 'img'), jwt(3000))
+            self.assertEqual(lookup.call_count, 3)
+        #Since Kubernetes 1.24, the ServiceAccounts have no token secrets.
+        api_instance = MagicMock()
+        api_instance.read_namespaced_service_account.return_value = MagicMock(secrets=None)
+        with patch('src.kube.kubernetes_api.get_bearer_token_failed') as failed:
+            self.assertRaises(CanNotGetBearerTokenException, get_bearer_token, api_instance, 'default', 'kube-system', 'vh', 'img')
+        failed.assert_called_once()
+        api_instance.read_namespaced_secret.assert_not_called()
+        for api_key, uses_service_account_token in [({'authorization': 'Bearer own'}, False), ({}, True)]:
+            configuration = kubernetes_client.Configuration(host='https://apiserver:6443', api_key=api_key)
+            shared_api_client = kubernetes_client.ApiClient(configuration)
+            with patch('src.kube.kubernetes_api._api_client', shared_api_client), patch.dict('src.kube.kubernetes_api._patching_api_clients', clear=True), \
+                patch('src.kube.kubernetes_api._bearer_token_cache') as cache:
+                cache.get.return_value = 'sa'
+                api_client = get_api_instance('https://apiserver:6443', 'vh', 'img').api_client
+                self.assertIs(api_client is shared_api_client, not uses_service_account_token)
+                self.assertEqual(cache.get.called, uses_service_account_token)
+                #The requests of the shared api client, such as the ones of the informer, keep the credentials of the configuration.
+                self.assertEqual(configuration.api_key, api_key)
+                self.assertIsNone(configuration.refresh_api_key_hook)
+                self.assertEqual(api_client.configuration.get_api_key_with_prefix('authorization'), 'Bearer sa' if uses_service_account_token else 'Bearer own')
+
+
+    def test_pending_decisions_priority(self) -> None:
+        """ Tests that the requests of an image go first after a decision that left it behind the latest version, also once its tag has changed.
+        """
+        decisions = PendingDecisions()
+        with patch('src.utilities.rate_limiter.pending_decisions', decisions), patch('src.utilities.logging_messages.pending_decisions', decisions), \
+            patch('src.utilities.logging_messages.log'):
+            self.assertEqual(get_image_request_priority('ns/deploy/nginx:1.2'), PRIORITY_REFRESH)
+            #Updated to 1.3, but 2.0 is beyond the versions frontier.
+            updates_logs('nginx', 'deploy', 'ns', '1.2', '1.3', '2.0', 'vh', 'ns/deploy/nginx:1.2')
+            self.assertEqual(get_image_request_priority('ns/deploy/nginx:1.3'), PRIORITY_PENDING_DECISION)
+            self.assertEqual(get_image_request_priority('ns/other/nginx:1.3'), PRIORITY_REFRESH)
+            updates_logs('nginx', 'deploy', 'ns', '1.3', '2.0', '2.0', 'vh', 'ns/deploy/nginx:1.3')
+            self.assertEqual(get_image_request_priority('ns/deploy/nginx:2.0'), PRIORITY_REFRESH)
+            updates_logs('app', 'deploy', 'ns', '1.2', '1.3', '2.0', 'vh', 'ns/deploy/registry.local:5000/app:1.2')
+            self.assertEqual(get_image_request_priority('ns/deploy/registry.local:5000/app:1.3'), PRIORITY_PENDING_DECISION)
+            self.assertEqual(get_image_request_priority('ns/deploy/registry.local:5000/other:1.3'), PRIORITY_REFRESH)
+            #A new latest image is not restarted into, as LATEST is false.
+            with patch('src.utilities.logging_messages.get_latest_preference_environment_variable', return_value='false'):
+                updates_logs('nginx', 'deploy', 'ns', 'latest', 'latest', 'latest', 'vh', 'ns/deploy/nginx:latest')
+            self.assertEqual(get_image_request_priority('ns/deploy/nginx:latest'), PRIORITY_PENDING_DECISION)
+
+
+    def test_gitlab_tags_pagination(self) -> None:
+        """ Tests that the tags of a Gitlab image are listed with keyset pagination, and with offset pagination if the server does not support it.
+        """
+        tag = lambda name: SimpleNamespace(name=name)
+        repository = MagicMock()
+        repository.tags.list.return_value = iter([tag('1.10'), tag('1.9')])
+        self.assertEqual(list(iter_gitlab_imgs_tags(repository)), ['1.10', '1.9'])
+        self.assertEqual(repository.tags.list.call_args.kwargs['pagination'], 'keyset')
+        repository = MagicMock()
+        repository.tags.list.side_effect = [gitlab.exceptions.GitlabListError('Keyset pagination is not supported', 400), iter([tag('1.9'), tag('1.10')])]
+        tags = iter_gitlab_imgs_tags(repository, per_page=2)
+        #No request is sent until the tags are consumed.
+        repository.tags.list.assert_not_called()
+        self.assertEqual(list(tags), ['1.9', '1.10'])
+        self.assertEqual(repository.tags.list.call_count, 2)
+        self.assertEqual(repository.tags.list.call_args.kwargs, {'iterator': True, 'per_page': 2})
+
+
+    def test_dockerhub_concurrent_pagination(self) -> None:
+        """ Tests that the pages of DockerHub tags read concurrently give the same versions as reading them one by one,
+        and that no page is requested after the window of the one with the current version.
+        """
+        tags = ['2.0', '1.9', '1.8', '1.7', '1.6', '1.5', '1.4', '1.3', '1.2', '1.1', '1.0', '0.9']
+        def get_json(url:str) -> dict:
+            page = int(url.partition('page=')[2].partition('&')[0])
+            return {'count': len(tags), 'results': [{'name': t, 'digest': f'sha256:{t}'} for t in tags[(page - 1) * 2:page * 2]]}
+        pages_requested = {}
+        for workers in [1, 2, 4]:
+            with patch('src.docker_imgs.dockerhub_api.registry_http_client') as client, patch('src.docker_imgs.dockerhub_api.dockerhub_max_page_size', 2), \
+                patch('src.docker_imgs.dockerhub_api.get_dockerhub_pagination_workers_environment_variable', return_value=workers):
+                client.get_json.side_effect = get_json
+                newer_versions, _ = _fetch_updatable_dockerhub_imgs('app', 'library', '1.3', 'vh', 'img')
+                self.assertEqual(newer_versions, {Version(t): t for t in tags[:7]})
+                pages_requested[workers] = {int(c.args[0].partition('page=')[2].partition('&')[0]) for c in client.get_json.call_args_list}
+        #1.3 is in the 4th page. The rest of pages of its window may be read, as they are requested at the same time, but not the next windows.
+        for workers, last_page_of_window in [(1, 4), (2, 5), (4, 5)]:
+            self.assertTrue({1, 2, 3, 4} <= pages_requested[workers] <= set(range(1, last_page_of_window + 1)))
+
+
+    def test_deployments_informer(self) -> None:
+        """ Tests that the deployments index follows the events of the watch, and that the deployments are listed again when the watch expires.
+        """
+        deployment = lambda name, namespace, resource_version: SimpleNamespace(metadata=SimpleNamespace(name=name, namespace=namespace, resource_version=resource_version))
+        deployments_list = lambda resource_version, items: SimpleNamespace(metadata=SimpleNamespace(resource_version=resource_version), items=items)
+        api_instance = MagicMock()
+        api_instance.list_deployment_for_all_namespaces.side_effect = [
+            deployments_list('1', [deployment('web', 'a', '1'), deployment('web', 'b', '1'), deployment('web', 'kube-system', '1')]),
+            deployments_list('10', [deployment('api', 'a', '10')])]
+        informer = DeploymentsInformer(api_instance, retry_delay_in_seconds=0)
+        names = lambda name: sorted(d.metadata.namespace for d in informer.get_deployments(name, timeout_in_seconds=0))
+        snapshots = []
+        def first_stream():
+            yield {'type': 'ADDED', 'object': deployment('api', 'a', '2')}
+            yield {'type': 'MODIFIED', 'object': deployment('web', 'a', '3')}
+            yield {'type': 'ADDED', 'object': deployment('api', 'kube-system', '4')}
+            yield {'type': 'DELETED', 'object': deployment('web', 'b', '5')}
+            snapshots.append((names('web'), names('api'), informer.get_deployments('web', timeout_in_seconds=0)[0].metadata.resource_version))
+            raise ApiException(status=410, reason='Gone')
+        def second_stream():
+            snapshots.append((names('web'), names('api')))
+            informer.stop()
+            yield from []
+        streams = [first_stream, second_stream]
+        resource_versions = []
+        class Watch():
+            def stream(self, func, **kwargs):
+                resource_versions.append(kwargs['resource_version'])
+                return streams.pop(0)()
+            def stop(self):
+                pass
+        with patch('src.kube.deployments_informer.watch.Watch', Watch), patch('src.kube.deployments_informer.deployments_watch_failed') as failed:
+            informer._run()
+        failed.assert_not_called()
+        #The native namespaces are ignored, and the deleted deployment is removed.
+        self.assertEqual(snapshots[0], (['a'], ['a'], '3'))
+        #The index is rebuilt from the new list.
+        self.assertEqual(snapshots[1], ([], ['a']))
+        self.assertEqual(resource_versions, ['1', '10'])
+        self.assertEqual(api_instance.list_deployment_for_all_namespaces.call_count, 2)
+
 
 if __name__ == '__main__':
     unittest.main()